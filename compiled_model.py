@@ -0,0 +1,813 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+""" Numerical Eyring rate model made directly from the model makers, used in place of
+the python file made by template_maker.make_template
+"""
+# standard libraries
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from mpmath import mp
+from scipy import sparse
+
+# local files
+import mixed_func
+import mp_func
+import np_func
+import result_set
+import result_stream
+
+__author__ = 'Kyle Vitautas Lopin'
+
+# same logger as the helpers, the voltage being solved is logged at debug level
+LOGGER = logging.getLogger('timer')
+
+K0 = 6.1*10**12  # pre exponential factor of the rates, per second
+Q_VOLTAGE = 1/25.  # unit is e- / kT
+Q_CHARGE = 1.602e-19
+
+
+class RateContext(object):
+    """
+    The rates of a CompiledEyringModel at one voltage and the transition matrix made from them,
+    made by CompiledEyringModel.rate_context.  Has the eyring_rate_transport and current_calc
+    functions of the model so it is passed to the helpers in place of the model, nothing is
+    saved in the model so several contexts can be solved at the same time in different threads
+
+    Public attributes:
+    ::transition_matrix: numpy, mpmath or scipy sparse matrix made from the rates
+    ::rates: array (or list of mpf) of rate constants indexed the same as the model's rate_names
+    """
+    def __init__(self, model, rates, prefactors, flux_prefactors):
+        """
+        :param model: CompiledEyringModel the rates are from
+        :param rates: array (or list of mpf) of rate constants
+        :param prefactors: Q values each transition rate is multiplied by
+        :param flux_prefactors: tuple of the Q values each inward and outward flux term is
+        multiplied by
+        """
+        self.model = model
+        self.rates = rates
+        self.prefactors = prefactors
+        self.flux_prefactors = flux_prefactors
+        self.transition_matrix = None
+
+    def eyring_rate_transport(self, steady_state):
+        return self.model.eyring_rate_transport(steady_state, self)
+
+    def current_calc(self, transport_rates):
+        return self.model.current_calc(transport_rates)
+
+
+class CompiledEyringModel(object):
+    """
+    An Eyring rate model saved as integer index arrays instead of strings of equations.
+    The transition matrix is made for a set of parameters by gathering the rate of each
+    transition and scattering it into the matrix, with no python code to generate or import.
+    Has the same functions as the script made by template_maker.make_template:
+    eyring_rate_algo, eyring_rate_context, eyring_rate_matrix, eyring_rate_transport and
+    current_calc
+
+    Public attributes:
+    ::states: list of the channel configurations of each state
+    ::ions: list of the solutes in the model
+    ::ion_charges: dict with the solutes as keys and their charges as values
+    ::inward_operator, outward_operator: scipy sparse matrices that sum the terms of the
+    flux in each direction into their (ion, barrier)
+    ::flux_operator: scipy sparse matrix of the net transport, see transport_table
+    ::model_spec: tuple of the arguments of template_maker.get_model that make the model, used
+    by the worker processes of eyring_rate_algo, None if the model was not made by template_maker
+    """
+    def __init__(self, math_package, algo_instance, rates_instance):
+        """
+        Make the index arrays of the model
+        :param math_package: string of type of math package to use, 'numpy', 'mpmath' or
+        'mixed', the mixed precision helper uses the numpy matrices
+        :param algo_instance: step_algo.EryingRateModelMaker of the model
+        :param rates_instance: rates_algo.EryingRateMaker of the model
+        """
+        self._set_math_package(math_package)
+        self.model_spec = None
+        self.states = algo_instance.get_states_vector()
+        self.ions = list(algo_instance.list_ions)
+        self.ion_charges = dict(zip(self.ions, algo_instance.ion_charges))
+        self.num_states = algo_instance.get_number_states()
+        self.num_barriers = algo_instance.num_binding_sites + 1
+
+        # make the arrays to calculate the rate constants
+        self.rate_names = rates_instance.get_rate_names()
+        self.rate_specs = rates_instance.get_rate_specs()
+        rate_index = dict((name, i) for i, name in enumerate(self.rate_names))
+
+        # make a list of the Q and R values used, and where to get their values from
+        q_sources = algo_instance.get_q_sources()
+        self.q_names = sorted(q_sources)
+        self.q_sources = [q_sources[name] for name in self.q_names]
+        q_index = dict((name, i) for i, name in enumerate(self.q_names))
+
+        # make the arrays of the off diagonal elements of the transition matrix, each
+        # element is the rate of rate_id[i] times the Q values with the powers in q_exponents[i]
+        transitions = algo_instance.get_transitions()
+        transition_factors = algo_instance.get_transition_factors()
+        self.row = np.array([transition[0] for transition in transitions], dtype=np.intp)
+        self.col = np.array([transition[1] for transition in transitions], dtype=np.intp)
+        self.rate_id = np.array([rate_index[name] for name, _ in transition_factors],
+                                dtype=np.intp)
+        self.q_factors = [[(q_index[name], power) for name, power in factors]
+                          for _, factors in transition_factors]
+        self.q_exponents = self._make_exponents(self.q_factors)
+
+        # make the arrays to calculate the transport of the solutes over each barrier
+        self.inward_flux = self._make_flux_arrays(algo_instance.forward_transport,
+                                                  rate_index, q_index, 'forward')
+        self.outward_flux = self._make_flux_arrays(algo_instance.backward_transport,
+                                                   rate_index, q_index, 'backward')
+        self._make_derived_arrays()
+
+    def _set_math_package(self, math_package):
+        """
+        Set the math package and the helper module used to solve the model
+        :param math_package: string of type of math package to use, 'numpy', 'mpmath' or
+        'mixed'
+        """
+        if math_package == 'mpmath':
+            self.helper = mp_func
+        elif math_package == 'numpy':
+            self.helper = np_func
+        elif math_package == 'mixed':
+            self.helper = mixed_func
+        else:
+            raise IOError("math_package should be 'mpmath', 'numpy' or 'mixed'")
+        self.math_package = math_package
+
+    def _make_derived_arrays(self):
+        """
+        Make the arrays that are calculated from the index tables of the model, these are
+        not saved by save and are made again by load
+        """
+        # make the arrays to calculate the rate constants
+        self._make_rate_arrays()
+        # index of the flattened matrix to add each rate to, the rates are added to
+        # their off diagonal element and subtracted from the diagonal element of their column
+        num_states = self.num_states
+        self.matrix_index = np.concatenate((self.row*num_states + self.col,
+                                            self.col*(num_states+1)))
+        # row and column of the same elements to make a sparse matrix with
+        self.sparse_index = (np.concatenate((self.row, self.col)),
+                             np.concatenate((self.col, self.col)))
+        # sparse operators that sum the terms of each flux into their (ion, barrier) group,
+        # the net transport of a sweep is flux_operator times the inward terms followed
+        # by the outward terms, see transport_table
+        self.inward_operator = self._make_flux_operator(self.inward_flux)
+        self.outward_operator = self._make_flux_operator(self.outward_flux)
+        self.flux_operator = sparse.hstack((-self.inward_operator,
+                                            self.outward_operator)).tocsr()
+
+    def save(self, filename):
+        """
+        Save the index tables of the model to a numpy .npz file, the lists of states,
+        rates and rate equation parts are saved as a json string in the metadata array
+        :param filename: name of the file, or an open file, to save the model to
+        """
+        metadata = {'states': self.states, 'ions': self.ions,
+                    'charges': [self.ion_charges[ion] for ion in self.ions],
+                    'num_states': self.num_states, 'num_barriers': self.num_barriers,
+                    'rate_names': self.rate_names, 'rate_specs': self.rate_specs,
+                    'q_names': self.q_names, 'q_sources': self.q_sources,
+                    'model_spec': self.model_spec}
+        flux_arrays = dict()
+        for direction, flux in (('inward', self.inward_flux), ('outward', self.outward_flux)):
+            group, rate_id, state, _, q_exponents = flux
+            flux_arrays[direction+'_group'] = group
+            flux_arrays[direction+'_rate_id'] = rate_id
+            flux_arrays[direction+'_state'] = state
+            flux_arrays[direction+'_q_exponents'] = q_exponents
+        np.savez(filename, metadata=np.array(json.dumps(metadata)), row=self.row, col=self.col,
+                 rate_id=self.rate_id, q_exponents=self.q_exponents, **flux_arrays)
+
+    @classmethod
+    def load(cls, math_package, filename):
+        """
+        Load a model saved by save
+        :param math_package: string of type of math package to use, 'numpy', 'mpmath' or
+        'mixed'
+        :param filename: name of the .npz file, or an open file, the model was saved to
+        :return: CompiledEyringModel
+        """
+        model = cls.__new__(cls)
+        model._set_math_package(math_package)
+        tables = np.load(filename)
+        try:
+            metadata = json.loads(str(tables['metadata']))
+            model.states = metadata['states']
+            model.ions = metadata['ions']
+            model.ion_charges = dict(zip(model.ions, metadata['charges']))
+            model.num_states = metadata['num_states']
+            model.num_barriers = metadata['num_barriers']
+            model.rate_names = metadata['rate_names']
+            model.rate_specs = metadata['rate_specs']
+            model.q_names = metadata['q_names']
+            model.q_sources = metadata['q_sources']
+            # models saved before the spec was saved can not be used by worker processes
+            model_spec = metadata.get('model_spec')
+            model.model_spec = tuple(model_spec) if model_spec else None
+            model.row = tables['row']
+            model.col = tables['col']
+            model.rate_id = tables['rate_id']
+            model.q_exponents = tables['q_exponents']
+            model.q_factors = factors_from_exponents(model.q_exponents)
+            fluxes = []
+            for direction in ('inward', 'outward'):
+                q_exponents = tables[direction+'_q_exponents']
+                fluxes.append((tables[direction+'_group'], tables[direction+'_rate_id'],
+                               tables[direction+'_state'], factors_from_exponents(q_exponents),
+                               q_exponents))
+            model.inward_flux, model.outward_flux = fluxes
+        finally:
+            tables.close()
+        model._make_derived_arrays()
+        return model
+
+    def _make_rate_arrays(self):
+        """
+        Make arrays of the parts of the rate equations from rates_algo.EryingRateMaker,
+        each rate is concentration * k0 * exp(energy) * exp(charge * q * distance * V)
+        and has at most 2 energy and distance terms
+        """
+        num_rates = len(self.rate_specs)
+        self.conc_keys = []
+        self.rate_conc = np.full(num_rates, -1, dtype=np.intp)  # -1 is no concentration
+        self.rate_ion = np.zeros(num_rates, dtype=np.intp)
+        self.rate_charge = np.zeros(num_rates)
+        self.energy_index = np.zeros((num_rates, 2), dtype=np.intp)
+        self.energy_sign = np.zeros((num_rates, 2))
+        self.distance_const = np.zeros(num_rates)
+        self.distance_index = np.zeros((num_rates, 2), dtype=np.intp)
+        self.distance_sign = np.zeros((num_rates, 2))
+        for i, (ion, conc_key, energy_terms, distance_const,
+                distance_terms) in enumerate(self.rate_specs):
+            if conc_key:
+                if conc_key not in self.conc_keys:
+                    self.conc_keys.append(conc_key)
+                self.rate_conc[i] = self.conc_keys.index(conc_key)
+            self.rate_ion[i] = self.ions.index(ion)
+            self.rate_charge[i] = self.ion_charges[ion]
+            for j, (index, sign) in enumerate(energy_terms):
+                self.energy_index[i, j] = index
+                self.energy_sign[i, j] = sign
+            self.distance_const[i] = distance_const
+            for j, (index, sign) in enumerate(distance_terms):
+                self.distance_index[i, j] = index
+                self.distance_sign[i, j] = sign
+
+    def _make_exponents(self, q_factors):
+        """
+        Make an array of the powers of each Q value for a list of rates
+        :param q_factors: list of lists of (Q index, power) tuples
+        :return: integer array of shape (number of rates, number of Q values)
+        """
+        exponents = np.zeros((len(q_factors), len(self.q_names)), dtype=int)
+        for i, factors in enumerate(q_factors):
+            for q_id, power in factors:
+                exponents[i, q_id] += power
+        return exponents
+
+    def _make_flux_arrays(self, transport, rate_index, q_index, direction):
+        """
+        Make the arrays to calculate the rate of solutes moving over each barrier in one direction
+        :param transport: step_algo.TransportClass with the rates to use
+        :param rate_index: dict of the rate names to their index
+        :param q_index: dict of the Q and R names to their index
+        :param direction: 'forward' or 'backward'
+        :return: tuple of (group, rate id, state index, Q factors, Q exponents),
+        group is ion index * number of barriers + barrier index
+        """
+        group = []
+        rate_id = []
+        state = []
+        q_factors = []
+        for barrier_index, barrier in enumerate(transport.factors):
+            barrier_number = barrier_index + 1
+            for ion_index, ion in enumerate(self.ions):
+                if direction == 'forward':
+                    rate_name = 'k_'+str(barrier_number-1)+'_'+str(barrier_number)+'_'+ion
+                else:
+                    rate_name = 'k_'+str(barrier_number)+'_'+str(barrier_number-1)+'_'+ion
+                for factors, state_index in barrier[ion]:
+                    group.append(ion_index*self.num_barriers + barrier_index)
+                    rate_id.append(rate_index[rate_name])
+                    state.append(state_index)
+                    q_factors.append([(q_index[name], power) for name, power in factors])
+        return (np.array(group, dtype=np.intp), np.array(rate_id, dtype=np.intp),
+                np.array(state, dtype=np.intp), q_factors, self._make_exponents(q_factors))
+
+    def _make_flux_operator(self, flux):
+        """
+        Make the sparse matrix that adds the terms of a flux into the (ion, barrier) they
+        move solutes over
+        :param flux: tuple of arrays made by _make_flux_arrays
+        :return: scipy.sparse.csr_matrix of shape (number of ions * number of barriers,
+        number of terms in the flux)
+        """
+        group = flux[0]
+        return sparse.csr_matrix((np.ones(len(group)), (group, np.arange(len(group)))),
+                                 shape=(len(self.ions)*self.num_barriers, len(group)))
+
+    def rate_parts(self, ion_concs, energy_barriers):
+        """
+        Every rate constant has the form A*exp(B*V), calculate A and B of all the rates
+        :param ion_concs: dict of the concentrations, keys are the solutes + 'i' or 'e'
+        :param energy_barriers: dict of the energy barriers with the solutes as keys and
+        a 'distance' key with the electrical distances
+        :return: 2 arrays indexed the same as rate_names, A and B (per mV)
+        """
+        energies = np.array([energy_barriers[ion] for ion in self.ions], dtype=float)
+        energy = (self.energy_sign
+                  * energies[self.rate_ion[:, np.newaxis], self.energy_index]).sum(axis=1)
+        distances = np.asarray(energy_barriers['distance'], dtype=float)
+        distance = (self.distance_const
+                    + (self.distance_sign * distances[self.distance_index]).sum(axis=1))
+        # put a 1 at the end for the rates without a concentration, index -1
+        concs = np.array([ion_concs[key] for key in self.conc_keys] + [1.0])
+        return (concs[self.rate_conc] * K0 * np.exp(energy),
+                self.rate_charge * Q_VOLTAGE * distance)
+
+    def rate_table(self, voltages, ion_concs, energy_barriers):
+        """
+        Calculate all the rate constants of the model at every voltage of a sweep at once,
+        with numpy this is one outer product and exponential
+        :param voltages: list of voltages (mV)
+        :param ion_concs: dict of the concentrations, keys are the solutes + 'i' or 'e'
+        :param energy_barriers: dict of the energy barriers with the solutes as keys and
+        a 'distance' key with the electrical distances
+        :return: array of shape (number of voltages, number of rates), or a list of lists
+        of mpf if mpmath is used, the columns are indexed the same as rate_names
+        """
+        if self.math_package == 'mpmath':
+            return [self._mp_rate_constants(voltage, ion_concs, energy_barriers)
+                    for voltage in voltages]
+        rate_a, rate_b = self.rate_parts(ion_concs, energy_barriers)
+        return rate_a * np.exp(np.outer(np.asarray(voltages, dtype=float), rate_b))
+
+    def rate_constants(self, voltage, ion_concs, energy_barriers):
+        """
+        Calculate all the rate constants of the model at a voltage
+        :param voltage: voltage (mV)
+        :return: array (or list of mpf if mpmath is used) indexed the same as rate_names
+        """
+        return self.rate_table([voltage], ion_concs, energy_barriers)[0]
+
+    def _mp_rate_constants(self, voltage, ion_concs, energy_barriers):
+        """
+        Calculate all the rate constants with mpmath at the current mp.dps
+        :return: list of mpf
+        """
+        rates = []
+        for ion, conc_key, energy_terms, distance_const, distance_terms in self.rate_specs:
+            energy = sum(sign*energy_barriers[ion][index] for index, sign in energy_terms)
+            distance = distance_const + sum(sign*energy_barriers['distance'][index]
+                                            for index, sign in distance_terms)
+            rate = mp.mpf(K0)*mp.exp(energy)
+            if conc_key:
+                rate *= ion_concs[conc_key]
+            rates.append(rate*mp.exp(self.ion_charges[ion]*Q_VOLTAGE*distance*voltage))
+        return rates
+
+    def q_values(self, Qs, Rs):
+        """
+        Get the value of each Q and R used in the model
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :return: list indexed the same as q_names
+        """
+        values = []
+        for argument, index in self.q_sources:
+            if argument == 'Qs':
+                values.append(Qs[index])
+            else:
+                values.append(Rs[index])
+        return values
+
+    def _prefactors(self, q_values, q_factors, q_exponents):
+        """
+        Calculate the product of the Q values each rate is multiplied by
+        :param q_values: list of Q and R values
+        :param q_factors: list of lists of (Q index, power) tuples, used with mpmath
+        :param q_exponents: array of powers of each Q value, used with numpy
+        :return: array (or list of mpf if mpmath is used)
+        """
+        if self.math_package == 'mpmath':
+            prefactors = []
+            for factors in q_factors:
+                prefactor = mp.mpf(1)
+                for q_id, power in factors:
+                    prefactor *= mp.mpf(q_values[q_id])**power
+                prefactors.append(prefactor)
+            return prefactors
+        return np.prod(np.asarray(q_values, dtype=float)**q_exponents, axis=1)
+
+    def eyring_rate_algo(self, voltages, ion_conc, energy_barriers, Qs=None, Rs=1, mp_dps=15,
+                         method=None, threads=None, workers=None):
+        """
+        Solve the model at each voltage, same as the eyring_rate_algo of the generated scripts
+        :param mp_dps: precision to use with mpmath, or a list of increasing precisions to
+        raise each voltage through until the solution is accurate enough,
+        see mp_func.eyring_rate_algo_adaptive
+        :param method: string of the method to find the steady states with, any method of the
+        helper module, 'batched' or 'sparse' (numpy only) or 'all' to compare eig, svd and qr,
+        the helper's DEFAULT_METHOD is used if None.  The iterative methods of np_func
+        use sparse matrices
+        :param threads: number of threads to split the voltages between, the numpy and scipy
+        solvers release the GIL so each thread can solve a part of the sweep at the same time
+        :param workers: number of processes (or a multiprocessing.Pool) to split the voltages
+        between, each process gets the model from template_maker.get_model with model_spec,
+        see sweep_driver.run_voltages
+        :return: result_set.ResultSet, or a tuple of the ResultSets by the eigenvector, svd and
+        qr methods if method is 'all'
+        """
+        if workers:
+            if not self.model_spec:
+                raise ValueError("the model was not made by template_maker so the worker "
+                                 "processes can not make it")
+            # each process makes its own model and sets its own mp.dps
+            import sweep_driver
+            return sweep_driver.run_voltages(self.model_spec, voltages, ion_conc,
+                                             energy_barriers, Qs, Rs, mp_dps, method, workers)
+        if self.math_package == 'mpmath':
+            if isinstance(mp_dps, (list, tuple)):
+                return mp_func.eyring_rate_algo_adaptive(self, voltages, ion_conc,
+                                                         energy_barriers, Qs, Rs, mp_dps, method)
+            mp.dps = mp_dps
+        if not Qs:
+            Qs = [1]
+        if not method:
+            method = self.helper.DEFAULT_METHOD
+        if method == 'batched':
+            return self.eyring_rate_batched(voltages, ion_conc, energy_barriers, Qs, Rs)
+        # calculate the rates of every voltage at once
+        rate_table = self.rate_table(voltages, ion_conc, energy_barriers)
+        results = result_set.sweep_results(self, len(voltages), method)
+        if threads:
+            # each thread solves a continuous part of the sweep so the iterative methods can
+            # still start each voltage from the steady state of the last one, and writes
+            # into its own part of the results
+            chunk_size = -(-len(voltages) // threads)
+            pool = ThreadPool(threads)
+            try:
+                pool.map(lambda start: self._solve_sweep(
+                    voltages[start:start+chunk_size], rate_table[start:start+chunk_size], Qs, Rs,
+                    method, result_set.sweep_slice(results, start, start+chunk_size)),
+                    range(0, len(voltages), chunk_size))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            self._solve_sweep(voltages, rate_table, Qs, Rs, method, results)
+        return results
+
+    def eyring_rate_stream(self, voltages, ion_conc, energy_barriers, Qs=None, Rs=1, mp_dps=15,
+                           method=None, chunk_size=None):
+        """
+        Solve the model at each voltage in order and give each result as soon as it is
+        solved, same as the eyring_rate_stream of the generated scripts.  Takes the same
+        arguments as eyring_rate_algo, each result is a tuple of the results by eig, svd
+        and qr if method is 'all'.  The 'batched' method solves chunk_size voltages at a time
+        :param chunk_size: if given the results are given in lists of this many results,
+        or as a result_set.ResultSet for each chunk for the 'batched' method
+        :return: iterator of results, or of lists of results if chunk_size is given
+        """
+        if self.math_package == 'mpmath':
+            if isinstance(mp_dps, (list, tuple)):
+                return result_stream.chunked(mp_func.iter_eyring_rate_adaptive(
+                    self, voltages, ion_conc, energy_barriers, Qs, Rs, mp_dps, method),
+                    chunk_size)
+            mp.dps = mp_dps
+        if not Qs:
+            Qs = [1]
+        if not method:
+            method = self.helper.DEFAULT_METHOD
+        if method == 'batched':
+            return self._iter_batched(voltages, ion_conc, energy_barriers, Qs, Rs, chunk_size)
+        rate_table = self.rate_table(voltages, ion_conc, energy_barriers)
+        return result_stream.chunked(self._iter_sweep(voltages, rate_table, Qs, Rs, method),
+                                     chunk_size)
+
+    def _iter_batched(self, voltages, ion_conc, energy_barriers, Qs, Rs, chunk_size):
+        """
+        Solve chunk_size voltages at a time with eyring_rate_batched
+        :return: iterator of the result_set.ResultSet of each chunk, or of each result if
+        chunk_size is None (all the voltages are solved at once)
+        """
+        if not chunk_size:
+            for result in self.eyring_rate_batched(voltages, ion_conc, energy_barriers, Qs, Rs):
+                yield result
+            return
+        for start in range(0, len(voltages), chunk_size):
+            yield self.eyring_rate_batched(voltages[start:start+chunk_size], ion_conc,
+                                           energy_barriers, Qs, Rs)
+
+    def _solve_sweep(self, voltages, rate_table, Qs, Rs, method, results=None):
+        """
+        Solve the model at each voltage of a sweep in order and write the results into
+        preallocated result sets, see _iter_sweep
+        :param results: result sets made by result_set.sweep_results, made if None
+        :return: result_set.ResultSet, or a tuple of ResultSets if method is 'all'
+        """
+        if results is None:
+            results = result_set.sweep_results(self, len(voltages), method)
+        for _ in self._iter_sweep(voltages, rate_table, Qs, Rs, method, results):
+            pass
+        return results
+
+    def _iter_sweep(self, voltages, rate_table, Qs, Rs, method, results=None):
+        """
+        Solve the model at each voltage of a sweep in order
+        :param voltages: list of voltages to solve the model at
+        :param rate_table: rate constants at each voltage, made by rate_table
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :param method: method of the helper module, or 'sparse' or one of
+        np_func.ITERATIVE_METHODS to solve sparse matrices with np_func
+        :param results: result sets made by result_set.sweep_results to write the results into,
+        a Results is made for each voltage if None
+        :return: iterator of results, or of the rows of results they are written into
+        """
+        use_sparse = method == 'sparse' or method in getattr(self.helper, 'ITERATIVE_METHODS', ())
+        # iterative methods keep the last steady state to start the next voltage with
+        if use_sparse:
+            solver = np_func.make_sweep_method(method)
+        else:
+            solver = self.helper.make_sweep_method(method)
+        for index, (voltage, rates) in enumerate(zip(voltages, rate_table)):
+            LOGGER.debug('voltage: %s', voltage)
+            out = None if results is None else result_set.sweep_row(results, index)
+
+            # 1: make the transition matrix and keep the rates to calculate the transport with
+            context = self.rate_context(rates, Qs, Rs, use_sparse)
+
+            if method == 'sparse':
+                yield np_func.solve_eyring_rate_model_sparse(voltage, context.transition_matrix,
+                                                             context, out)
+            elif use_sparse:
+                yield np_func.solve_eyring_rate_model_iterative(
+                    voltage, context.transition_matrix, solver, context, out)
+            else:
+                yield self.helper.solve_eyring_rate_model(voltage, context.transition_matrix,
+                                                          context, solver, out)
+
+    def eyring_rate_batched(self, voltages, ion_conc, energy_barriers, Qs=None, Rs=1):
+        """
+        Solve the model at every voltage with one stacked linear solve, numpy only,
+        see np_func.steady_state_batched
+        :return: result_set.ResultSet, the condition number and eigenvalue fitting metrics
+        are not calculated
+        """
+        if not Qs:
+            Qs = [1]
+        rate_table = self.rate_table(voltages, ion_conc, energy_barriers)
+        trans_matrices = self.transition_matrices(rate_table, Qs, Rs)
+        steady_states = np_func.steady_state_batched(trans_matrices)
+        transport = self.transport_table(rate_table, steady_states, Qs, Rs)
+        abs_elements = np.fabs(trans_matrices)
+        # same as np_func.smallest_largest_elements, the zero elements are not used
+        smallest_elements = np.where(abs_elements > 0, abs_elements, np.inf).min(axis=(1, 2))
+        residues = np.einsum('vij,vj->vi', trans_matrices, steady_states)
+        # same as np_func.characterize_solution, the 1-norm and 2-norm of the residues
+        return result_set.ResultSet(
+            self.ions, np.array(voltages, dtype=float), self.current_table(transport),
+            transport.reshape(-1, len(self.ions), self.num_barriers), steady_states,
+            largest_element=abs_elements.max(axis=(1, 2)), smallest_element=smallest_elements,
+            sae_residues=np.sum(np.fabs(residues), axis=1),
+            sse_residues=np.sqrt(np.sum(residues**2, axis=1)),
+            method=np.full(len(voltages), 'batched', dtype=result_set.method_dtype()))
+
+    def eyring_rate_sparse(self, voltages, ion_conc, energy_barriers, Qs=None, Rs=1,
+                           method='lu'):
+        """
+        Solve the model at every voltage with sparse matrices, numpy only, see
+        np_func.solve_eyring_rate_model_sparse and np_func.IterativeSteadyState
+        :param method: 'lu' for a sparse LU factorization or one of np_func.ITERATIVE_METHODS
+        to solve each voltage starting from the steady state of the last one
+        :return: result_set.ResultSet
+        """
+        if not Qs:
+            Qs = [1]
+        rate_table = self.rate_table(voltages, ion_conc, energy_barriers)
+        if method == 'lu':
+            method = 'sparse'
+        return self._solve_sweep(voltages, rate_table, Qs, Rs, method)
+
+    def eyring_rate_matrix(self, voltage, ion_concs, energy_barriers, Qs, Rs):
+        """
+        Make the transition matrix at a voltage
+        :return: numpy matrix or mpmath matrix
+        """
+        context = self.eyring_rate_context(voltage, ion_concs, energy_barriers, Qs, Rs)
+        return context.transition_matrix
+
+    def eyring_rate_context(self, voltage, ion_concs, energy_barriers, Qs, Rs):
+        """
+        Make the transition matrix at a voltage and keep the rates and Q values to calculate
+        the transport with
+        :return: RateContext
+        """
+        return self.rate_context(self.rate_constants(voltage, ion_concs, energy_barriers),
+                                 Qs, Rs)
+
+    def rate_context(self, rates, Qs, Rs, sparse_matrix=False):
+        """
+        Make the transition matrix from the rate constants at one voltage, i.e. a row of
+        rate_table, and keep the rates and Q values to calculate the transport with
+        :param rates: array (or list of mpf) of rate constants indexed the same as rate_names
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :param sparse_matrix: True to make a scipy sparse matrix, numpy only,
+        see sparse_transition_matrix
+        :return: RateContext
+        """
+        q_values = self.q_values(Qs, Rs)
+        flux_prefactors = (self._prefactors(q_values, self.inward_flux[3], self.inward_flux[4]),
+                           self._prefactors(q_values, self.outward_flux[3],
+                                            self.outward_flux[4]))
+        context = RateContext(self, rates,
+                              self._prefactors(q_values, self.q_factors, self.q_exponents),
+                              flux_prefactors)
+        if sparse_matrix:
+            context.transition_matrix = self._sparse_matrix(context)
+        else:
+            context.transition_matrix = self._matrix(context)
+        return context
+
+    def matrix_from_rates(self, rates, Qs, Rs):
+        """
+        Make the transition matrix from the rate constants at one voltage, i.e. a row of
+        rate_table
+        :param rates: array (or list of mpf) of rate constants indexed the same as rate_names
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :return: numpy matrix or mpmath matrix
+        """
+        return self.rate_context(rates, Qs, Rs).transition_matrix
+
+    def sparse_transition_matrix(self, rates, Qs, Rs):
+        """
+        Make the transition matrix from the rate constants at one voltage as a scipy sparse
+        matrix, numpy only.  Only the non-zero elements are stored so models with thousands
+        of states can be made and solved with np_func.solve_eyring_rate_model_sparse
+        :param rates: array of rate constants indexed the same as rate_names
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :return: scipy.sparse.csc_matrix
+        """
+        return self.rate_context(rates, Qs, Rs, sparse_matrix=True).transition_matrix
+
+    def _matrix(self, context):
+        """
+        Make the dense transition matrix of the rates of a context
+        :param context: RateContext with the rates and Q values
+        :return: numpy matrix or mpmath matrix
+        """
+        num_states = self.num_states
+        if self.math_package == 'mpmath':
+            transition_matrix = mp.matrix(num_states, num_states)
+            for row, col, rate_id, prefactor in zip(self.row.tolist(), self.col.tolist(),
+                                                    self.rate_id.tolist(), context.prefactors):
+                value = context.rates[rate_id] * prefactor
+                transition_matrix[row, col] += value
+                transition_matrix[col, col] -= value
+            return transition_matrix
+        values = context.rates[self.rate_id] * context.prefactors
+        flat_matrix = np.bincount(self.matrix_index, weights=np.concatenate((values, -values)),
+                                  minlength=num_states*num_states)
+        return np.matrix(flat_matrix.reshape(num_states, num_states))
+
+    def _sparse_matrix(self, context):
+        """
+        Make the sparse transition matrix of the rates of a context, numpy only
+        :param context: RateContext with the rates and Q values
+        :return: scipy.sparse.csc_matrix
+        """
+        values = context.rates[self.rate_id] * context.prefactors
+        # the coo format sums the duplicate diagonal entries when converted
+        return sparse.coo_matrix((np.concatenate((values, -values)), self.sparse_index),
+                                 shape=(self.num_states, self.num_states)).tocsc()
+
+    def transition_matrices(self, rate_table, Qs, Rs):
+        """
+        Make the transition matrices of every voltage of a sweep with one scatter, numpy only
+        :param rate_table: array of rate constants made by rate_table
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :return: array of shape (number of voltages, number of states, number of states)
+        """
+        prefactors = self._prefactors(self.q_values(Qs, Rs), self.q_factors, self.q_exponents)
+        values = rate_table[:, self.rate_id] * prefactors
+        num_voltages = values.shape[0]
+        matrix_size = self.num_states * self.num_states
+        # offset the index of each voltage by the size of a matrix
+        offsets = np.arange(num_voltages, dtype=np.intp)[:, np.newaxis] * matrix_size
+        flat_matrices = np.bincount((self.matrix_index + offsets).ravel(),
+                                    weights=np.concatenate((values, -values), axis=1).ravel(),
+                                    minlength=num_voltages*matrix_size)
+        return flat_matrices.reshape(num_voltages, self.num_states, self.num_states)
+
+    def eyring_rate_transport(self, steady_state, context):
+        """
+        Calculate the rate of each solute moving over each barrier using the rates of a
+        matrix made by eyring_rate_context or rate_context
+        :param steady_state: steady state vector of the transition matrix
+        :param context: RateContext of the transition matrix
+        :return: dict with the solutes as keys and a list of the transport over each barrier
+        """
+        inward = self._flux(self.inward_flux, context.rates, context.flux_prefactors[0],
+                            steady_state)
+        outward = self._flux(self.outward_flux, context.rates, context.flux_prefactors[1],
+                             steady_state)
+        transport_rate = dict()
+        for i, ion in enumerate(self.ions):
+            barriers = range(i*self.num_barriers, (i+1)*self.num_barriers)
+            transport_rate[ion] = [outward[j] - inward[j] for j in barriers]
+        return transport_rate
+
+    def _flux(self, flux, rates, prefactors, steady_state):
+        """
+        Calculate the rate of solutes moving over each barrier in one direction
+        :param flux: tuple of arrays made by _make_flux_arrays
+        :param rates: array (or list of mpf) of rate constants indexed the same as rate_names
+        :param prefactors: Q values each rate of the flux is multiplied by
+        :param steady_state: steady state vector of the transition matrix
+        :return: list (or array) indexed by ion index * number of barriers + barrier index
+        """
+        group, rate_id, state = flux[:3]
+        num_groups = len(self.ions) * self.num_barriers
+        if self.math_package == 'mpmath':
+            terms = [[] for _ in range(num_groups)]
+            for _group, _rate_id, _state, prefactor in zip(group.tolist(), rate_id.tolist(),
+                                                           state.tolist(), prefactors):
+                terms[_group].append(rates[_rate_id] * prefactor * steady_state[_state])
+            return [mp.fsum(_terms).real for _terms in terms]
+        steady_state = np.real(np.asarray(steady_state)).ravel()
+        return np.bincount(group, weights=rates[rate_id] * prefactors * steady_state[state],
+                           minlength=num_groups)
+
+    def transport_table(self, rate_table, steady_states, Qs, Rs):
+        """
+        Calculate the net transport of each solute over each barrier for every voltage of a
+        sweep with one sparse matrix product, numpy only
+        :param rate_table: array of rate constants made by rate_table
+        :param steady_states: array of shape (number of voltages, number of states)
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :return: array of shape (number of voltages, number of ions * number of barriers),
+        the columns are indexed by ion index * number of barriers + barrier index
+        """
+        q_values = self.q_values(Qs, Rs)
+        terms = []
+        for flux in (self.inward_flux, self.outward_flux):
+            group, rate_id, state, q_factors, q_exponents = flux
+            prefactors = self._prefactors(q_values, q_factors, q_exponents)
+            terms.append(rate_table[:, rate_id] * prefactors * steady_states[:, state])
+        return self.flux_operator.dot(np.concatenate(terms, axis=1).T).T
+
+    def current_table(self, transport_table):
+        """
+        Calculate the current over each barrier for every voltage of a sweep
+        :param transport_table: array made by transport_table
+        :return: array of currents (in picoamps) of shape (number of voltages,
+        number of barriers)
+        """
+        charges = np.array([self.ion_charges[ion] for ion in self.ions], dtype=float)
+        transport = transport_table.reshape(-1, len(self.ions), self.num_barriers)
+        # the ion charge (coulomb) times the transport rate (per second), 10e12 is to
+        # convert to picoamps, summed over the ions
+        return Q_CHARGE * 10**12 * np.einsum('i,vib->vb', charges, transport)
+
+    def current_calc(self, transport_rates):
+        """
+        Calculate the current for each barrier using the ion transport rates
+        :param transport_rates:  dictionary of ions (as keys) with list of rates as values
+        :return: list of currents (in picoamps) over each barrier
+        """
+        all_currents = []
+        for barrier in range(self.num_barriers):
+            current = 0
+            for ion in self.ions:
+                # calcuate current as the ion charge (coulomb) times the transport rate
+                # (per second), 10e12 is to convert to picoamps
+                current += (self.ion_charges[ion] * Q_CHARGE * 10**12
+                            * transport_rates[ion][barrier])
+            all_currents.append(current)
+        return all_currents
+
+
+def factors_from_exponents(q_exponents):
+    """
+    Make the lists of (Q index, power) tuples of each rate from the array of the powers of
+    each Q value, the opposite of CompiledEyringModel._make_exponents
+    :param q_exponents: integer array of shape (number of rates, number of Q values)
+    :return: list of lists of (Q index, power) tuples
+    """
+    return [[(q_id, power) for q_id, power in enumerate(powers) if power]
+            for powers in q_exponents.tolist()]
@@ -7,10 +7,12 @@
 import Tkinter as tk
 import sys
 import tkFileDialog
+import tkMessageBox
+import ttk
 
-import eyring_rate_script
 import paramframe as param_frame
 import result_disp
+import sim_worker
 import simframe as sim_frame
 import template_maker as script_maker
 
@@ -22,7 +24,15 @@ FILEOPTIONS = {'defaultextension': '*.ert_model'}
 FILEOPTIONS['filetypes'] = (("Eyring_rate_model", ".ert_model"),)
 TESTING = True
 SAVE_FILENAME = 'random2'
-MP_DPS_VALUE = 80
+# mp.dps levels the mpmath models are solved with, each voltage starts at the lowest and only
+# the voltages that are not accurate enough are solved again at the higher levels,
+# see mp_func.eyring_rate_algo_adaptive
+MP_DPS_LEVELS = [15, 30, 60, 80]
+# method to find the steady states with, None uses the default of the math package,
+# 'all' solves with eig, svd and qr and shows the results of each to compare them
+SOLVE_METHOD = None
+# milliseconds between checking the progress of a running simulation
+POLL_INTERVAL = 100
 
 
 class EyringGUI(tk.Tk):
@@ -44,6 +54,10 @@ class EyringGUI(tk.Tk):
         self.parameter_frame = None
         self.simulation_frame = None
         self.run_button = None
+        self.eyring_rate_model = None  # model made by process_parameters
+        self.simulation_worker = None  # sim_worker.SimulationWorker of the last simulation
+        self.progress_frame = None  # holds the progress bar while a simulation runs
+        self.progress_bar = None
 
         self.top_frame = tk.Frame(self)
         self.top_frame.pack(side='top')
@@ -82,17 +96,13 @@ class EyringGUI(tk.Tk):
         solutes, charges = self.get_settings(initial_settings)
 
         QR_str = "single Q" + R_str
-        # make the script for the Eyring rate model
+        # make the Eyring rate model, or get it from the models already made
         if initial_settings.mpmath_used:
             math_package = 'mpmath'
         else:
             math_package = 'numpy'
-        _eyring_rate_script = script_maker.make_template(math_package, num_binding_sites,
-                                                         solutes, charges, QR_str)
-        with open("eyring_rate_script.py", "w") as _file:
-            _file.write(_eyring_rate_script)
-        _file.close()
-        reload(eyring_rate_script)
+        self.eyring_rate_model = script_maker.get_model(math_package, num_binding_sites,
+                                                        solutes, charges, QR_str)
 
         self.set_parameters(solutes, initial_settings.charges,
                             initial_settings.num_binding_sites.get(), _saved_settings)
@@ -167,55 +177,105 @@ class EyringGUI(tk.Tk):
 
     def run_simulation(self, num_sites):
         """
-        Run the simulation by calling the eyring rate script and display the results
+        Start solving the eyring rate model in a worker thread, the progress is shown with a
+        progress bar and the results are displayed by show_results when all the voltages are
+        solved.  The tkinter event loop keeps running so the window does not freeze
         :param num_sites: number of sites, for testing documentation
-        :return: display the results
         """
+        if self.simulation_worker and self.simulation_worker.is_alive():
+            return  # only run one simulation at a time
         voltages, concentrations, conc_labels = self.simulation_frame.get_run_simulation_settings()
         if not self.Q_value:
             self.Q_value = [1]  # hack
-        barriers = self.parameter_frame.energy_barriers
+        # copy the barriers so changes made in the parameter frame while the simulation is
+        # running do not change the simulation
+        barriers = dict((key, list(values)) for key, values in
+                        self.parameter_frame.energy_barriers.items())
+        self.simulation_worker = sim_worker.SimulationWorker(self.eyring_rate_model, voltages,
+                                                             concentrations, barriers,
+                                                             self.Q_value, self.R_value,
+                                                             MP_DPS_LEVELS, SOLVE_METHOD)
+        # show the progress of the simulation with a cancel button under the run button
+        self.run_button.config(state=tk.DISABLED)
+        self.progress_frame = tk.Frame(self.run_button_frame)
+        self.progress_frame.pack(side='top')
+        self.progress_bar = ttk.Progressbar(self.progress_frame, length=300,
+                                            maximum=len(voltages), mode='determinate')
+        self.progress_bar.pack(side='left')
+        tk.Button(self.progress_frame, text="Cancel",
+                  command=self.simulation_worker.cancel).pack(side='left')
+
+        self.simulation_worker.start()
+        self.after(POLL_INTERVAL, self.poll_simulation,
+                   (num_sites, voltages, barriers, conc_labels))
+
+    def poll_simulation(self, settings):
+        """
+        Check the messages of the simulation worker, update the progress bar and display the
+        results when the simulation is finished, called by the tkinter event loop every
+        POLL_INTERVAL milliseconds until the simulation is finished
+        :param settings: tuple of the number of sites, voltages, barriers and concentration
+        labels of the simulation, passed to show_results
+        """
+        for message, value in self.simulation_worker.get_messages():
+            if message == sim_worker.PROGRESS:
+                self.progress_bar.config(value=value)
+            else:
+                self.end_simulation()
+                if message == sim_worker.DONE:
+                    self.show_results(value, *settings)
+                elif message == sim_worker.ERROR:
+                    tkMessageBox.showerror("Simulation failed", str(value))
+                return
+        self.after(POLL_INTERVAL, self.poll_simulation, settings)
+
+    def end_simulation(self):
+        """
+        Remove the progress bar and let the user run another simulation
+        """
+        self.progress_frame.destroy()
+        self.progress_frame = None
+        self.run_button.config(state=tk.NORMAL)
+
+    def show_results(self, results, num_sites, voltages, barriers, conc_labels):
+        """
+        Display the results of a simulation
+        :param results: list of results, or of tuples of the results by eig, svd and qr if
+        SOLVE_METHOD is 'all'
+        :param num_sites: number of sites, for testing documentation
+        :param voltages: list of voltages the model was solved at
+        :param barriers: dict of the energy barriers the model was solved with
+        :param conc_labels: dict of the labels of the concentrations used
+        """
         # results have the class Results found in numpy_helper_functions and has the attributes
         # voltage, matrix_specs, ion_transport self.fitting,  current and steady_state
-
-        results_eig, results_svd, results_qr = eyring_rate_script.eyring_rate_algo(voltages,
-                                                                                   concentrations,
-                                                                                   barriers,
-                                                                                   Qs=self.Q_value,
-                                                                                   Rs=self.R_value,
-                                                                                   mp_dps=MP_DPS_VALUE)
+        if SOLVE_METHOD == 'all':
+            titled_results = zip(["Eig results", "SVD results", "QR results"],
+                                 [list(method_results) for method_results in zip(*results)])
+        else:
+            titled_results = [("Results", results)]
 
         solutes = []
-        for solute in results_qr[0].ion_transport:
+        for solute in titled_results[0][1][0].ion_transport:
             solutes.append(solute)
-        if results_eig:
-            r1 = result_disp.MultiPlotWindows(self, voltages, barriers, results_eig,
-                                              solutes, conc_labels, "Eig results")
-
-        r2 = result_disp.MultiPlotWindows(self, voltages, barriers, results_svd,
-                                          solutes, conc_labels, "SVD results")
-
-        r3 = result_disp.MultiPlotWindows(self, voltages, barriers, results_qr,
-                                          solutes, conc_labels, "QR results")
+        windows = []
+        for title, method_results in titled_results:
+            windows.append(result_disp.MultiPlotWindows(self, voltages, barriers, method_results,
+                                                        solutes, conc_labels, title))
 
         if TESTING:
-            print 'testing with: ', num_sites, MP_DPS_VALUE, len(solutes)
+            print 'testing with: ', num_sites, MP_DPS_LEVELS, len(solutes)
             if self.initial_frame.mpmath_used:
-                math_str = 'mp_'+str(MP_DPS_VALUE) + 'dps'
+                math_str = 'mp_'+str(MP_DPS_LEVELS[-1]) + 'dps'
             else:
                 math_str = 'np'
 
             filename = (str(num_sites) + 'x' + str(len(solutes)) + '_'
                         + SAVE_FILENAME + '_' + math_str + '.csv')
-            r1.save_data(filename)
-            r1.save_custom_data(filename)
-            r1.save_custom_data2(filename)
-            r2.save_data(filename)
-            r2.save_custom_data(filename)
-            r2.save_custom_data2(filename)
-            r3.save_data(filename)
-            r3.save_custom_data(filename)
-            r3.save_custom_data2(filename)
+            for window in windows:
+                window.save_data(filename)
+                window.save_custom_data(filename)
+                window.save_custom_data2(filename)
         # rerun with new MP_DPS
         # MP_DPS_VALUE = 15
         # results_eig, results_svd, results_qr = eyring_rate_script.eyring_rate_algo(voltages,
@@ -1,6 +1,6 @@
 import eyring_rate_script as test
 import matplotlib.pyplot as plt
-import shelve
+import results_store
 from mpmath import nprint
 import numpy as np
 
@@ -34,13 +34,15 @@ num_barriers = 3
 ion_conc = {'solute_1i': 0.001, 'solute_1e': 0.001}
 energy_barriers = {'distance': [0.25, 0.5, 0.75], 'solute_1': [8.0, -10.0, 8.0]}
 
-results_eig, results_svd = test.eyring_rate_algo(voltages,
-                                                 ion_conc,
-                                                 energy_barriers,
-                                                 2,
-                                                 [1],
-                                                 [0.5, 0.9, 1, 0.5, 0.9, 0.5, 1, 0.9, 0.5],
-                                                 10)
+# solve with eig, svd and qr to compare the methods
+results_eig, results_svd, results_qr = test.eyring_rate_algo(voltages,
+                                                             ion_conc,
+                                                             energy_barriers,
+                                                             Qs=[1],
+                                                             Rs=[0.5, 0.9, 1, 0.5, 0.9, 0.5, 1,
+                                                                 0.9, 0.5],
+                                                             mp_dps=10,
+                                                             method='all')
 print 'test1'
 """
 results has the fields
@@ -52,10 +54,9 @@ current
 
 """
 print 'test a'
-result_shelf = shelve.open("Results1")
-result_shelf["results eig"] = results_eig
-result_shelf["results svd"] = results_svd
-result_shelf.close()
+store = results_store.ResultsStore("Results1")
+store.save("eig", results_eig)
+store.save("svd", results_svd)
 ion_transport = []
 currents = []
 #
@@ -1,6 +1,12 @@
-from numpy import exp, matrix
+import logging
+import sys
+from multiprocessing.pool import ThreadPool
 
+import result_set
+import result_stream
 import np_func as helper
+from numpy import exp, matrix
+
 
 states = [[0, 0, 0, 0],
           ['solute_1', 0, 0, 0],
@@ -262,28 +268,98 @@ states = [[0, 0, 0, 0],
 ions = ['solute_1', 'solute_2', 'solute_3']
 ion_charges = {'solute_1': 2, 'solute_2': 2, 'solute_3': 1}
 q_charge = 1.602e-19
+LOGGER = logging.getLogger('timer')
+# arguments of template_maker.get_model that make this model, used by the worker processes
+MODEL_SPEC = ('numpy', 4, ['solute_1', 'solute_2', 'solute_3'], [2, 2, 1], 'single Q', None)
+
+
+class RateContext(object):
+    """
+    The transition matrix and rates of the model at one voltage, made by eyring_rate_context.
+    Has the eyring_rate_transport and current_calc functions of the model so it is passed to
+    the helper instead of the module, and several voltages or parameter sets can be solved at
+    the same time in different threads
+    """
+    def __init__(self, transition_matrix, rates):
+        self.transition_matrix = transition_matrix
+        self.rates = rates
+
+    def eyring_rate_transport(self, steady_state):
+        return eyring_rate_transport(steady_state, self.rates)
+
+    def current_calc(self, transport_rates):
+        return current_calc(transport_rates)
+
+
+def eyring_rate_algo(voltages, ion_conc, energy_barriers, Qs=None, Rs=1, mp_dps=15, method=None,
+                     threads=None, workers=None):
+    if workers:
+        # each process makes its own model and sets its own mp.dps
+        import sweep_driver
+        return sweep_driver.run_voltages(MODEL_SPEC, voltages, ion_conc, energy_barriers, Qs, Rs,
+                                         mp_dps, method, workers)
+    
+    if not Qs:
+        Qs = [1]
+    if not method:
+        method = helper.DEFAULT_METHOD
+    results = result_set.sweep_results(sys.modules[__name__], len(voltages), method)
+    if threads:
+        # each thread solves a continuous part of the sweep so the iterative methods can still
+        # start each voltage from the steady state of the last one, and writes into its own
+        # part of the results
+        chunk_size = -(-len(voltages) // threads)
+        pool = ThreadPool(threads)
+        try:
+            pool.map(lambda start: solve_sweep(voltages[start:start+chunk_size], ion_conc,
+                                               energy_barriers, Qs, Rs, method,
+                                               result_set.sweep_slice(results, start,
+                                                                      start+chunk_size)),
+                     range(0, len(voltages), chunk_size))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        solve_sweep(voltages, ion_conc, energy_barriers, Qs, Rs, method, results)
+    return results
 
 
-def eyring_rate_algo(voltages, ion_conc, energy_barriers, Qs=None, Rs=1, mp_dps=15):
+def eyring_rate_stream(voltages, ion_conc, energy_barriers, Qs=None, Rs=1, mp_dps=15,
+                       method=None, chunk_size=None):
+    """
+    Solve the model at each voltage in order and give each result as soon as it is solved,
+    takes the same arguments as eyring_rate_algo.  Each result is a tuple of the results by
+    eig, svd and qr if method is 'all'
+    :param chunk_size: if given the results are given in lists of this many results
+    :return: iterator of results, or of lists of results if chunk_size is given
+    """
     
     if not Qs:
         Qs = [1]
-    results_eig = []
-    results_svd = []
-    results_qr = []
-    for voltage in voltages:
-        print 'voltage: ', voltage
+    if not method:
+        method = helper.DEFAULT_METHOD
+    return result_stream.chunked(iter_sweep(voltages, ion_conc, energy_barriers, Qs, Rs, method),
+                                 chunk_size)
+
+
+def solve_sweep(voltages, ion_conc, energy_barriers, Qs, Rs, method, results):
+    # the results of each voltage are written into the preallocated result sets
+    for _ in iter_sweep(voltages, ion_conc, energy_barriers, Qs, Rs, method, results):
+        pass
 
-        # 1: make the transition matrix
-        trans_matrix = eyring_rate_matrix(voltage, ion_conc, energy_barriers, Qs, Rs)
 
-        result_eig, result_svd, result_qr = helper.solve_eyring_rate_model(voltage, trans_matrix)
+def iter_sweep(voltages, ion_conc, energy_barriers, Qs, Rs, method, results=None):
+    # iterative methods keep the last steady state to start the next voltage with
+    method = helper.make_sweep_method(method)
+    for index, voltage in enumerate(voltages):
+        LOGGER.debug('voltage: %s', voltage)
+        out = None if results is None else result_set.sweep_row(results, index)
 
-        results_eig.append(result_eig)
-        results_svd.append(result_svd)
-        results_qr.append(result_qr)
+        # 1: make the transition matrix and keep the rates to calculate the transport with
+        context = eyring_rate_context(voltage, ion_conc, energy_barriers, Qs, Rs)
 
-    return results_eig, results_svd, results_qr
+        yield helper.solve_eyring_rate_model(voltage, context.transition_matrix, context, method,
+                                             out)
 
 
 def convert_mp_int(_vector):
@@ -294,6 +370,10 @@ def convert_mp_int(_vector):
 
 
 def eyring_rate_matrix(voltage, ion_concs, energy_barriers, Qs, Rs):
+    return eyring_rate_context(voltage, ion_concs, energy_barriers, Qs, Rs).transition_matrix
+
+
+def eyring_rate_context(voltage, ion_concs, energy_barriers, Qs, Rs):
     k0 = 6.1*10**12
     V = voltage
     q = 1/25.  # unit is e- / kT
@@ -305,8 +385,6 @@ def eyring_rate_matrix(voltage, ion_concs, energy_barriers, Qs, Rs):
     solute_3i = ion_concs['solute_3i']
     solute_3e = ion_concs['solute_3e']
 
-    global Q  
-
     Q = Qs[0]
 
     d1 = energy_barriers['distance'][0]
@@ -349,15 +427,6 @@ def eyring_rate_matrix(voltage, ion_concs, energy_barriers, Qs, Rs):
     Gsolute_38 = energy_barriers['solute_3'][7]
     Gsolute_39 = energy_barriers['solute_3'][8]
 
-    global k_0_1_solute_1, k_1_0_solute_1, k_0_1_solute_2, k_1_0_solute_2
-    global k_0_1_solute_3, k_1_0_solute_3, k_1_2_solute_1, k_2_1_solute_1
-    global k_1_2_solute_2, k_2_1_solute_2, k_1_2_solute_3, k_2_1_solute_3
-    global k_2_3_solute_1, k_3_2_solute_1, k_2_3_solute_2, k_3_2_solute_2
-    global k_2_3_solute_3, k_3_2_solute_3, k_3_4_solute_1, k_4_3_solute_1
-    global k_3_4_solute_2, k_4_3_solute_2, k_3_4_solute_3, k_4_3_solute_3
-    global k_4_5_solute_1, k_5_4_solute_1, k_4_5_solute_2, k_5_4_solute_2
-    global k_4_5_solute_3, k_5_4_solute_3
-
     k_0_1_solute_1 = solute_1e*k0*exp(-Gsolute_11)*exp(2*q*-d1*V)
     k_1_0_solute_1 = k0*exp(Gsolute_12-Gsolute_11)*exp(2*q*(d2-d1)*V)
     k_0_1_solute_2 = solute_2e*k0*exp(-Gsolute_21)*exp(2*q*-d1*V)
@@ -648,10 +717,58 @@ def eyring_rate_matrix(voltage, ion_concs, energy_barriers, Qs, Rs):
     [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, k_5_4_solute_3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, k_0_1_solute_3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, -(Q * k_4_5_solute_3 + Q * k_1_0_solute_3)]
     ])
 
-    return transition_matrix
+    rates = {'k_0_1_solute_1': k_0_1_solute_1, 'k_1_0_solute_1': k_1_0_solute_1,
+             'k_0_1_solute_2': k_0_1_solute_2, 'k_1_0_solute_2': k_1_0_solute_2,
+             'k_0_1_solute_3': k_0_1_solute_3, 'k_1_0_solute_3': k_1_0_solute_3,
+             'k_1_2_solute_1': k_1_2_solute_1, 'k_2_1_solute_1': k_2_1_solute_1,
+             'k_1_2_solute_2': k_1_2_solute_2, 'k_2_1_solute_2': k_2_1_solute_2,
+             'k_1_2_solute_3': k_1_2_solute_3, 'k_2_1_solute_3': k_2_1_solute_3,
+             'k_2_3_solute_1': k_2_3_solute_1, 'k_3_2_solute_1': k_3_2_solute_1,
+             'k_2_3_solute_2': k_2_3_solute_2, 'k_3_2_solute_2': k_3_2_solute_2,
+             'k_2_3_solute_3': k_2_3_solute_3, 'k_3_2_solute_3': k_3_2_solute_3,
+             'k_3_4_solute_1': k_3_4_solute_1, 'k_4_3_solute_1': k_4_3_solute_1,
+             'k_3_4_solute_2': k_3_4_solute_2, 'k_4_3_solute_2': k_4_3_solute_2,
+             'k_3_4_solute_3': k_3_4_solute_3, 'k_4_3_solute_3': k_4_3_solute_3,
+             'k_4_5_solute_1': k_4_5_solute_1, 'k_5_4_solute_1': k_5_4_solute_1,
+             'k_4_5_solute_2': k_4_5_solute_2, 'k_5_4_solute_2': k_5_4_solute_2,
+             'k_4_5_solute_3': k_4_5_solute_3, 'k_5_4_solute_3': k_5_4_solute_3, 'Q': Q}
+
+    return RateContext(transition_matrix, rates)
+
 
+def eyring_rate_transport(steady_state, rates):
 
-def eyring_rate_transport(steady_state):
+    k_0_1_solute_1 = rates['k_0_1_solute_1']
+    k_1_0_solute_1 = rates['k_1_0_solute_1']
+    k_0_1_solute_2 = rates['k_0_1_solute_2']
+    k_1_0_solute_2 = rates['k_1_0_solute_2']
+    k_0_1_solute_3 = rates['k_0_1_solute_3']
+    k_1_0_solute_3 = rates['k_1_0_solute_3']
+    k_1_2_solute_1 = rates['k_1_2_solute_1']
+    k_2_1_solute_1 = rates['k_2_1_solute_1']
+    k_1_2_solute_2 = rates['k_1_2_solute_2']
+    k_2_1_solute_2 = rates['k_2_1_solute_2']
+    k_1_2_solute_3 = rates['k_1_2_solute_3']
+    k_2_1_solute_3 = rates['k_2_1_solute_3']
+    k_2_3_solute_1 = rates['k_2_3_solute_1']
+    k_3_2_solute_1 = rates['k_3_2_solute_1']
+    k_2_3_solute_2 = rates['k_2_3_solute_2']
+    k_3_2_solute_2 = rates['k_3_2_solute_2']
+    k_2_3_solute_3 = rates['k_2_3_solute_3']
+    k_3_2_solute_3 = rates['k_3_2_solute_3']
+    k_3_4_solute_1 = rates['k_3_4_solute_1']
+    k_4_3_solute_1 = rates['k_4_3_solute_1']
+    k_3_4_solute_2 = rates['k_3_4_solute_2']
+    k_4_3_solute_2 = rates['k_4_3_solute_2']
+    k_3_4_solute_3 = rates['k_3_4_solute_3']
+    k_4_3_solute_3 = rates['k_4_3_solute_3']
+    k_4_5_solute_1 = rates['k_4_5_solute_1']
+    k_5_4_solute_1 = rates['k_5_4_solute_1']
+    k_4_5_solute_2 = rates['k_4_5_solute_2']
+    k_5_4_solute_2 = rates['k_5_4_solute_2']
+    k_4_5_solute_3 = rates['k_4_5_solute_3']
+    k_5_4_solute_3 = rates['k_5_4_solute_3']
+    Q = rates['Q']
 
     inward = dict()
     inward['solute_1'] = [0, 0, 0, 0, 0]
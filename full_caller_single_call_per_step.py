@@ -1,8 +1,8 @@
 __author__ = 'Kyle Vitautas Lopin'
 
 
+import results_store
 import template_maker as tm
-import shelve
 import importlib
 
 
@@ -25,20 +25,13 @@ energy_barriers = {'GNa': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
 Qs = 30*[5]
 Rs = 30*[0.5]
 
-total_results_eig = []
-total_results_svd = []
+total_results = []
 num_binding_sites = 1
 num_ions = 1
 run_options = (num_binding_sites, num_ions)
 
-# make the script make an eyring rate model and save it to test_script.py
-eyring_rate_script = tm.make_template('numpy', num_binding_sites, ions[:num_ions], charges, 'full QR')
-with open("test_script.py", "w") as file:
-    file.write(eyring_rate_script)
-file.close()
-
-# import the eyring rate model file that was just made
-import test_script
+# make the eyring rate model in memory
+eyring_rate_model = tm.get_model('numpy', num_binding_sites, ions[:num_ions], charges, 'full QR')
 
 # make a list of the electrical distances to update the energy_barriers dict with
 distance_buffer = 2 * (num_binding_sites + 1)
@@ -47,18 +40,12 @@ for i in range(1, distance_buffer):
     distance.append(float(i)/distance_buffer)
 energy_barriers['distance'] = distance
 
-# call the erying rate model script made earlier
-results_eig, results_svd = test_script.eyring_rate_algo(voltages,
-                                                        ion_conc,
-                                                        energy_barriers,
-                                                        num_binding_sites, Qs, Rs)
-print results_eig
+# call the erying rate model made earlier
+results = eyring_rate_model.eyring_rate_algo(voltages, ion_conc, energy_barriers, Qs, Rs)
+print results
 print 'humm'
-total_results_eig.append(results_eig)
-total_results_svd.append(results_svd)
+total_results.append(results)
 
 
-total_results_shelf = shelve.open("Full_Results")
-total_results_shelf["total results eig"] = total_results_eig
-total_results_shelf["total resutls svd"] = total_results_svd
-total_results_shelf.close()
+store = results_store.ResultsStore("Full_Results")
+store.save('sites_{0}_solutes_{1}'.format(*run_options), results)
@@ -1,9 +1,6 @@
 __author__ = 'Kyle Vitautas Lopin'
 
-import template_maker as tm
-import shelve
-import importlib
-import test_script
+import sweep_driver
 
 ions = ['Na', 'Ca', 'Mg', 'Fe', 'Ba', 'Cd']
 charges = [1, 2, 2, 2, 2, 2]
@@ -15,45 +12,21 @@ ion_conc = {'Nai': 0.1, 'Nae': 0.000001,
             'Bai': 0.1, 'Bae': 0.000001,
             'Cdi': 0.000001, 'Cde': 0.1}
 
-energy_barriers = {'GNa': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
-                   'GCa': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
-                   'GMg': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
-                   'GFe': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
-                   'GBa': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
-                   'GCd': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8]}
+energy_barriers = {'Na': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Ca': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Mg': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Fe': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Ba': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Cd': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8]}
 Qs = 30*[5]
 Rs = 30*[0.5]
 
-total_results_eig = []
-total_results_svd = []
-for num_binding_sites in range(1, 5):
-    for num_ions in range(1, 5):
-        print 'num barriers: ', num_binding_sites
-        print 'num ions: ', num_ions
-        # make the script make an eyring rate model and save it to test_script.py
-        eyring_rate_script = tm.make_template('numpy', num_binding_sites, ions[:num_ions], charges, 'full QR')
-        with open("test_script.py", "w") as file:
-            file.write(eyring_rate_script)
-        file.close()
-
-        # make a list of the electrical distances to update the energy_barriers dict with
-        distance_buffer = 2 * (num_binding_sites + 1)
-        distance = []
-        for i in range(1, distance_buffer):
-            distance.append(float(i)/distance_buffer)
-        energy_barriers['distance'] = distance
-
-        # call the erying rate model script made earlier
-        results_eig, results_svd = test_script.eyring_rate_algo(voltages,
-                                                                ion_conc,
-                                                                energy_barriers,
-                                                                num_binding_sites, Qs, Rs)
-        print 'humm'
-        total_results_eig.append(results_eig)
-        total_results_svd.append(results_svd)
-
-
-total_results_shelf = shelve.open("Full_Results")
-total_results_shelf["total results eig"] = total_results_eig
-total_results_shelf["total resutls svd"] = total_results_svd
-total_results_shelf.close()
+if __name__ == '__main__':
+    # solve the models for 1 to 4 binding sites and 1 to 4 solutes, the (model, voltages)
+    # work units are spread over all the cpus, see sweep_driver
+    grid = [(num_binding_sites, num_ions)
+            for num_binding_sites in range(1, 5) for num_ions in range(1, 5)]
+    total_results = sweep_driver.run_grid(grid, voltages, ion_conc, energy_barriers, Qs, Rs,
+                                          ions=ions, charges=charges)
+    # each model is saved as a curve named by sweep_driver.curve_name
+    sweep_driver.save_grid("Full_Results", grid, total_results)
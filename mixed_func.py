@@ -0,0 +1,173 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Helper functions to solve an eyring rate model with mixed precision.  The transition matrix
+is factored once in float64 and the steady state is improved by iterative refinement with
+the residues calculated in extended precision (numpy longdouble or mpmath) from the non-zero
+rates only.  Uses the custom classes of np_func to save results
+"""
+# standard libraries
+import logging
+import threading
+import time
+
+import numpy as np
+from mpmath import MPContext
+from scipy import linalg as scipy_linalg
+
+import eyring_rate_script as eyring_script
+import np_func
+
+__author__ = 'Kyle Vitautas Lopin'
+
+LOGGER = logging.getLogger('timer')
+
+# precision to calculate the residues in if none is given, longdouble only has 3 more digits
+# than float64 which is not enough for the stiffest models
+DEFAULT_METHOD = 'mpmath'
+# most number of refinement steps for each steady state
+MAX_REFINEMENTS = 10
+# mp.dps used to calculate the residues with the 'mpmath' method
+RESIDUE_DPS = 40
+# the mpmath context of each thread, see residue_context
+_THREAD_CONTEXTS = threading.local()
+
+
+def solve_eyring_rate_model(voltage, transition_matrix, model=eyring_script,
+                            method=DEFAULT_METHOD, out=None):
+    """
+    Save the matrix specifications, calculate the steady state of the matrix by mixed
+    precision iterative refinement then save the results.  Results saves in custom class.
+    :param voltage:  voltage the matrix is at, used to save conditions
+    :param transition_matrix: numpy matrix of transition rates
+    :param model: the rate context the matrix was made with, made by the eyring_rate_context
+    function of the eyring rate script or compiled_model.CompiledEyringModel, used to
+    calculate the transport rates
+    :param method: string of the precision to calculate the residues in,
+    'longdouble' or 'mpmath'
+    :param out: result_set.ResultRow to write the results into instead of making a Results,
+    see np_func.solve_eyring_rate_model
+    :return: custom class that saves the results, see np_func.Results, or out if it is given
+    """
+    if method not in ('longdouble', 'mpmath'):
+        raise IOError("method should be 'longdouble' or 'mpmath'")
+    largest_matrix_element, smallest_matrix_element = np_func.smallest_largest_elements(
+        transition_matrix)
+    start = time.time()
+    bordered_matrix = np_func.make_bordered_matrix(transition_matrix)
+    lu_factors = scipy_linalg.lu_factor(bordered_matrix)
+    matrix_specs = np_func.MatrixSpecs(largest_matrix_element,
+                                       smallest_matrix_element,
+                                       np_func.lu_condition_estimate(bordered_matrix, lu_factors))
+    rows, columns, rates = off_diagonal_rates(transition_matrix)
+    if method == 'mpmath':
+        residue_mp = residue_context()
+        rates = np.array([residue_mp.mpf(rate) for rate in rates], dtype=object)
+        # the steady state is returned as float64 so it only has to be refined that far
+        steady_state, test_values = refine_steady_state(
+            lu_factors, (rows, columns, rates), residue_mp.mpf(1), np.finfo(float).eps)
+        steady_state = np.array([float(state) for state in steady_state])
+    else:
+        steady_state, test_values = refine_steady_state(
+            lu_factors, (rows, columns, rates.astype(np.longdouble)), np.longdouble(1),
+            np.finfo(np.longdouble).eps)
+    LOGGER.info('mixed precision time %s for matrix size %d: %5.10f, refinements: %d',
+                method, len(transition_matrix), time.time()-start, test_values[0])
+    return np_func.solve_eyring_rate_model_ss(voltage, np.matrix(steady_state).T,
+                                              transition_matrix, test_values,
+                                              matrix_specs, model, method, out)
+
+
+def make_sweep_method(method):
+    """
+    Make the method used to solve every voltage of a sweep, see np_func.make_sweep_method,
+    the mixed precision methods do not keep anything between voltages
+    :param method: string of the precision to calculate the residues in
+    :return: method
+    """
+    return method
+
+
+def residue_context():
+    """
+    Get the mpmath context of this thread to calculate the residues in, the global mp context
+    is not used because setting its precision would change it for every thread
+    :return: mpmath.MPContext with the precision RESIDUE_DPS
+    """
+    context = getattr(_THREAD_CONTEXTS, 'context', None)
+    if context is None:
+        context = MPContext()
+        context.dps = RESIDUE_DPS
+        _THREAD_CONTEXTS.context = context
+    return context
+
+
+def off_diagonal_rates(_matrix):
+    """
+    Get the non-zero off diagonal elements of a transition matrix, the diagonal elements
+    are not used because they are float64 sums of rates that can be many orders of magnitude
+    different and are calculated again in extended precision by bordered_residues
+    :param _matrix: numpy matrix of transition rates
+    :return: arrays of the rows, columns and values of the elements
+    """
+    rates = np.asarray(_matrix)
+    rows, columns = np.nonzero(rates)
+    off_diagonal = rows != columns
+    rows = rows[off_diagonal]
+    columns = columns[off_diagonal]
+    return rows, columns, rates[rows, columns]
+
+
+def bordered_residues(steady_state, triplets, one):
+    """
+    Calculate the residues of a steady state for the bordered matrix, i.e. the transition
+    matrix with the last equation replaced by the constraint that the steady state sums to 1,
+    in the precision of the steady state and rates
+    :param steady_state: array of the steady state, longdouble or mpf objects
+    :param triplets: arrays of the rows, columns and values of the off diagonal rates
+    :param one: 1 in the precision to calculate the residues in
+    :return: array of the residues, constraint - bordered matrix * steady state
+    """
+    rows, columns, rates = triplets
+    flows = rates * steady_state[columns]  # rate of going from state column to state row
+    residues = np.zeros(len(steady_state), dtype=steady_state.dtype) * one
+    # each flow goes into its row and leaves its column, i.e. the diagonal element
+    np.add.at(residues, columns, flows)
+    np.subtract.at(residues, rows, flows)
+    residues[-1] = one - np.sum(steady_state)
+    return residues
+
+
+def refine_steady_state(lu_factors, triplets, one, tolerance):
+    """
+    Find the steady state from the float64 LU factors of the bordered matrix and improve it
+    with iterative refinement, each correction is found with the float64 factors from the
+    residues calculated in the precision of the rates
+    :param lu_factors: LU factors made by scipy.linalg.lu_factor of the bordered matrix
+    :param triplets: arrays of the rows, columns and values of the off diagonal rates,
+    the values are in the precision to calculate the residues in
+    :param one: 1 in the precision to calculate the residues in
+    :param tolerance: stop when no state is changed by more than this relative amount
+    :return: array of steady state, and the number of refinements made and the
+    largest relative correction of the last refinement
+    """
+    constraint = np.zeros(len(lu_factors[0]))
+    constraint[-1] = 1.0
+    steady_state = scipy_linalg.lu_solve(lu_factors, constraint) * one
+    relative_correction = np.inf
+    refinements = 0
+    for refinements in range(1, MAX_REFINEMENTS+1):
+        residues = bordered_residues(steady_state, triplets, one)
+        correction = scipy_linalg.lu_solve(lu_factors, residues.astype(float))
+        steady_state = steady_state + correction * one
+        state_sizes = np.fabs(steady_state.astype(float))
+        changes = np.fabs(correction)
+        # states with a steady state of 0 are divided by 1 instead
+        last_relative_correction = relative_correction
+        relative_correction = np.max(changes / np.where(state_sizes > 0, state_sizes, 1.0))
+        if relative_correction <= tolerance:
+            break
+        # the residues are not accurate enough to improve the steady state any more
+        if relative_correction > 0.5 * last_relative_correction:
+            break
+    return steady_state, (refinements, relative_correction)
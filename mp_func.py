@@ -10,6 +10,7 @@ import time
 from mpmath import mp, eig, fsum, fabs, norm, qr, mnorm
 
 import eyring_rate_script as eyring_script
+import result_set
 
 __author__ = 'Kyle Vitautas Lopin'
 
@@ -18,21 +19,165 @@ HANDLER = logging.FileHandler('timing_logger_mp_3x4extreme1_15dps.txt')
 LOGGER.addHandler(HANDLER)
 LOGGER.setLevel(logging.INFO)
 
-def solve_eyring_rate_model(voltage, transition_matrix):
+# method used to find the steady state if none is given, 'all' runs eig, svd and qr to compare
+DEFAULT_METHOD = 'lu'
+# largest relative residue and relative difference in the transport rates over the barriers
+# allowed before eyring_rate_algo_adaptive tries a higher precision
+ADAPTIVE_TOLERANCE = 1e-10
+
+
+def solve_eyring_rate_model(voltage, transition_matrix, model=eyring_script,
+                            method=DEFAULT_METHOD, out=None):
+    """
+    Save the matrix specifications, calculate the steady state of the matrix with one method
+    then save the results.  Results saves in custom class.
+    :param voltage:  voltage the matrix is at, used to save conditions
+    :param transition_matrix: mpmath matrix of transition rates
+    :param model: the rate context the matrix was made with, made by the eyring_rate_context
+    function of the eyring rate script or compiled_model.CompiledEyringModel, used to
+    calculate the transport rates
+    :param method: string of the method to find the steady state with, 'lu', 'qr', or 'eig'
+    and 'svd' that are much slower and should be used to check the results, or 'all'
+    to compare the eig, svd and qr methods.  'lu' changes to 'qr' if the bordered matrix is
+    numerically singular at mp.dps, the method used is saved in Results.method
+    :param out: result_set.ResultRow to write the results into instead of making a Results,
+    or a tuple of the rows for eig, svd and qr if method is 'all', used by the sweeps
+    :return: custom class that saves the results, see Results class at bottom of file, or
+    a tuple of the results by eig, svd and qr if method is 'all', out if it is given
+    """
+    if method == 'all':
+        return solve_eyring_rate_model_all(voltage, transition_matrix, model, out)
+    steady_state_func = get_steady_state_function(method)
+    largest_matrix_element, smallest_matrix_element = smallest_largest_elements(transition_matrix)
+    # the LU factors of the bordered matrix give the condition number estimate and
+    # are reused to find the steady state by the 'lu' method, timing includes both
+    start = time.time()
+    bordered_matrix = make_bordered_matrix(transition_matrix)
+    lu_factors = lu_decomposition(bordered_matrix)
+    matrix_specs = MatrixSpecs(largest_matrix_element,
+                               smallest_matrix_element,
+                               lu_condition_estimate(bordered_matrix, lu_factors))
+    if method == 'lu' and lu_factors is None:
+        # qr finds the null space of the transition matrix without dividing by the pivots
+        LOGGER.info('bordered matrix at %s mV is numerically singular at %d dps, '
+                    'lu changed to qr', voltage, mp.dps)
+        method = 'qr'
+        steady_state_func = get_steady_state_function(method)
+    if method == 'lu':
+        steady_state, test_values = steady_state_lu(lu_factors)
+    else:
+        steady_state, test_values = steady_state_func(transition_matrix)
+    LOGGER.info('mpmath time %s for matrix size %d: %5.10f',
+                method, len(transition_matrix), time.time()-start)
+    return solve_eyring_rate_model_ss(voltage, steady_state, transition_matrix,
+                                      test_values, matrix_specs, model, method, out)
+
+
+def eyring_rate_algo_adaptive(model, voltages, ion_conc, energy_barriers, Qs, Rs, dps_levels,
+                              method=None, tolerance=ADAPTIVE_TOLERANCE):
+    """
+    Solve the model at each voltage starting with the lowest precision and only remake and
+    solve the matrix at higher precisions for the voltages where the solution does not pass
+    solution_passes.  The precision used for each voltage is saved in Results.precision
+    :param model: the eyring rate script or compiled_model.CompiledEyringModel to solve,
+    its eyring_rate_context function is used to make the matrix at each precision
+    :param voltages: list of voltages to solve the model at
+    :param ion_conc: dict of the concentrations, keys are the solutes + 'i' or 'e'
+    :param energy_barriers: dict of the energy barriers and electrical distances
+    :param Qs: list of Q values
+    :param Rs: list of R values
+    :param dps_levels: list of increasing mp.dps values to try
+    :param method: string of the method to find the steady state with, see
+    solve_eyring_rate_model
+    :param tolerance: relative error allowed, see solution_passes
+    :return: result_set.ResultSet, or a tuple of the ResultSets by the eigenvector, svd and qr
+    methods if method is 'all'
+    """
+    results = result_set.sweep_results(model, len(voltages), method or DEFAULT_METHOD)
+    for _ in iter_eyring_rate_adaptive(model, voltages, ion_conc, energy_barriers, Qs, Rs,
+                                       dps_levels, method, tolerance, results):
+        pass
+    return results
+
+
+def iter_eyring_rate_adaptive(model, voltages, ion_conc, energy_barriers, Qs, Rs, dps_levels,
+                              method=None, tolerance=ADAPTIVE_TOLERANCE, results=None):
+    """
+    Solve the model at each voltage like eyring_rate_algo_adaptive but give each result as
+    soon as it is solved, used by eyring_rate_stream
+    :param results: result sets made by result_set.sweep_results to write the results into,
+    a Results is made for each voltage if None
+    :return: iterator of results, or of tuples of the results by the eigenvector, svd and qr
+    methods if method is 'all'
+    """
+    if not Qs:
+        Qs = [1]
+    if not method:
+        method = DEFAULT_METHOD
+    # the precision of the caller is used between the voltages and after the sweep
+    caller_dps = mp.dps
+    try:
+        for index, voltage in enumerate(voltages):
+            LOGGER.debug('voltage: %s', voltage)
+            out = None if results is None else result_set.sweep_row(results, index)
+            for dps in dps_levels:
+                mp.dps = dps
+                context = model.eyring_rate_context(voltage, ion_conc, energy_barriers, Qs, Rs)
+                try:
+                    result = solve_eyring_rate_model(voltage, context.transition_matrix,
+                                                     context, method, out)
+                except ZeroDivisionError:
+                    # the matrix is numerically singular at this precision
+                    if dps == dps_levels[-1]:
+                        raise
+                    LOGGER.info('voltage %s is singular at %d dps', voltage, dps)
+                    continue
+                method_results = result if method == 'all' else (result,)
+                if all(solution_passes(_result, tolerance) for _result in method_results):
+                    break
+                LOGGER.info('voltage %s failed at %d dps', voltage, dps)
+            mp.dps = caller_dps
+            yield result
+    finally:
+        mp.dps = caller_dps
+
+
+def solution_passes(result, tolerance=ADAPTIVE_TOLERANCE):
+    """
+    Check if a solution is accurate enough, the residues of the steady state times the matrix
+    have to be small compared to the largest element of the matrix and the transport rate of
+    each solute has to be the same over every barrier
+    :param result: Results or result_set.ResultRow to check
+    :param tolerance: largest relative error allowed
+    :return: True if the solution is accurate enough
+    """
+    if result.fitting.sae_residues > tolerance * result.matrix_spec.largest_element:
+        return False
+    for solute, transport in result.ion_transport.items():
+        largest_transport = max(fabs(rate) for rate in transport)
+        if result.fitting.transport_errors[solute] > tolerance * largest_transport:
+            return False
+    return True
+
+
+def solve_eyring_rate_model_all(voltage, transition_matrix, model=eyring_script, out=None):
     """
     Save all the matrix specifications, calculate the steady state of the matrix,
     NOTE: using 3 methods for testing purposes
     then save all the results.  Results saves in custom class.
-    NOTE: too many local variables for testing; TODO: pick best method for final use
-    :param voltage:  voltage the matrix is at, used to save conditions, TODO: take out for final use
-    :param transition_matrix: numpy matrix of transition rates
-    :return: custom class that saves the results, see Results class at bottom of file
+    :param voltage:  voltage the matrix is at, used to save conditions
+    :param transition_matrix: mpmath matrix of transition rates
+    :param model: the model the matrix was made with, used to calculate the transport rates
+    :param out: tuple of the result_set.ResultRows to write the eig, svd and qr results into
+    :return: tuple of the results by the eigenvector, svd and qr methods
     """
+    eig_out, svd_out, qr_out = out or (None, None, None)
     len_matrix = len(transition_matrix)
     # get the largest and smallest elements from the matrix to characterize the difficulty of
     # solving null space of the matrix and save it to be retrieved later
     largest_matrix_element, smallest_matrix_element = smallest_largest_elements(transition_matrix)
-    condition_number = mnorm(transition_matrix, 1)
+    bordered_matrix = make_bordered_matrix(transition_matrix)
+    condition_number = lu_condition_estimate(bordered_matrix, lu_decomposition(bordered_matrix))
     matrix_specs = MatrixSpecs(largest_matrix_element,
                                smallest_matrix_element,
                                condition_number)
@@ -45,7 +190,7 @@ def solve_eyring_rate_model(voltage, transition_matrix):
     # save all the results in a custom data class and return it
     results_eig = solve_eyring_rate_model_ss(voltage, ss_by_eig,
                                              transition_matrix, test_eigs_by_eig,
-                                             matrix_specs)
+                                             matrix_specs, model, 'eig', eig_out)
     # get the steady state (ss) solution by using the svd decomposition
     start = time.time()
     ss_by_svd, test_eig_by_svd = svd_func(transition_matrix)
@@ -54,10 +199,14 @@ def solve_eyring_rate_model(voltage, transition_matrix):
     if any(ss_by_svd):  # incase the svd fails because of singularity
         results_svd = solve_eyring_rate_model_ss(voltage, ss_by_svd,
                                                  transition_matrix, test_eig_by_svd,
-                                                 matrix_specs)
+                                                 matrix_specs, model, 'svd', svd_out)
+    elif svd_out is not None:
+        # hack to make the program work if svd fails, the eig results are used
+        results_svd = solve_eyring_rate_model_ss(voltage, ss_by_eig,
+                                                 transition_matrix, test_eigs_by_eig,
+                                                 matrix_specs, model, 'eig', svd_out)
     else:
-        pass
-        # results_svd = results_eig  # hack to make the program work
+        results_svd = results_eig  # hack to make the program work
     # get the steady state (ss) solution by using qr factorization
     start = time.time()
     ss_by_qr, test_eig_by_qr = qr_func(transition_matrix)
@@ -65,14 +214,15 @@ def solve_eyring_rate_model(voltage, transition_matrix):
     print 'qr: ', qr_time
     results_qr = solve_eyring_rate_model_ss(voltage, ss_by_qr,
                                             transition_matrix, test_eig_by_qr,
-                                            matrix_specs)
+                                            matrix_specs, model, 'qr', qr_out)
     LOGGER.info('mpmath times eig; svd; qr for matrix size %d: %5.10f %5.10f %5.10f',
                 len_matrix, eig_time, svd_time, qr_time)
     print eig_time
     return results_eig, results_svd, results_qr
 
 
-def solve_eyring_rate_model_ss(voltage, _ss, _matrix, _test, _specs):
+def solve_eyring_rate_model_ss(voltage, _ss, _matrix, _test, _specs, model=eyring_script,
+                               method=None, out=None):
     """
     Take the steady state of a matrix, the matrix and calculate the transport rates of
     the solutes and current created
@@ -81,23 +231,186 @@ def solve_eyring_rate_model_ss(voltage, _ss, _matrix, _test, _specs):
     :param _matrix: matrix of transition rates
     :param _test: tuple of testing characteristics to pass through to results
     :param _specs: matrix specifications to pass to the results
-    :return: custom class Results
+    :param model: the model to calculate the transport rates and current with
+    :param method: string of the method the steady state was found with, to pass to results
+    :param out: result_set.ResultRow to write the results into instead of making a Results
+    :return: custom class Results, or out if it is given
     """
     # 3 calculate the ion transport rates
-    solute_transport = eyring_script.eyring_rate_transport(_ss)
+    solute_transport = model.eyring_rate_transport(_ss)
     # characterize how well the steady state is by getting the residues of the steady state times
     # the transition matrix
-    sum_squared_errors, sum_absolute_errors = characterize_solution(_ss, _matrix)
+    sum_absolute_errors, sum_squared_errors = characterize_solution(_ss, _matrix)
 
     # 4 calculate the current from the solute transport rates
-    current = eyring_script.current_calc(solute_transport)
+    current = model.current_calc(solute_transport)
+
+    if out is not None:
+        out.set_result(voltage, _specs, solute_transport, _test, sum_absolute_errors,
+                       sum_squared_errors, current, _ss, mp.dps, method)
+        return out
 
     # save the fitting results in a custom class
     fitting_specs_eig = FittingMetrics(_test, sum_absolute_errors,
                                        sum_squared_errors, solute_transport)
 
     return Results(voltage, _specs, solute_transport, fitting_specs_eig,
-                   current, _ss)
+                   current, _ss, mp.dps, method)
+
+
+def make_sweep_method(method):
+    """
+    Make the method used to solve every voltage of a sweep, the same as np_func.make_sweep_method
+    but mpmath has no iterative methods that need a solver kept between voltages
+    :param method: string of the method to find the steady state with
+    :return: method
+    """
+    return method
+
+
+def get_steady_state_function(method):
+    """
+    Get the function that finds the steady state of a matrix by a method
+    :param method: string, 'lu', 'eig', 'svd' or 'qr'
+    :return: function that takes a matrix and returns the steady state and 2 test values
+    """
+    steady_state_functions = {'lu': steady_state_solve,
+                              'eig': steady_state_eig,
+                              'svd': svd_func,
+                              'qr': qr_func}
+    if method not in steady_state_functions:
+        raise IOError("method should be one of: {0}".format(sorted(steady_state_functions)))
+    return steady_state_functions[method]
+
+
+def make_bordered_matrix(_matrix):
+    """
+    Make a copy of a transition matrix with the last equation replaced by the normalization
+    constraint that the steady state sums to 1, see np_func.make_bordered_matrix
+    :param _matrix: mpmath transition matrix
+    :return: mpmath matrix of the bordered matrix
+    """
+    bordered_matrix = _matrix.copy()
+    for j in range(bordered_matrix.cols):
+        bordered_matrix[bordered_matrix.rows-1, j] = 1
+    return bordered_matrix
+
+
+def steady_state_solve(_matrix):
+    """
+    Find the steady state of a matrix by solving the bordered matrix with an LU factorization,
+    one O(n^3) elimination instead of the iterations of eig and svd
+    :param _matrix: mpmath matrix to solve steady state for
+    :return: vector of steady state and 2 smallest pivots of the LU factorization
+    """
+    return steady_state_lu(mp.LU_decomp(make_bordered_matrix(_matrix)))
+
+
+def steady_state_lu(lu_factors):
+    """
+    Find the steady state from the LU factors of a bordered matrix
+    :param lu_factors: LU factors and pivots made by mp.LU_decomp of make_bordered_matrix
+    :return: vector of steady state and 2 smallest pivots of the LU factorization,
+    the smallest last so FittingMetrics saves it as the smallest value
+    """
+    lu_matrix, pivots = lu_factors
+    size = lu_matrix.rows
+    constraint = mp.matrix(size, 1)
+    constraint[size-1] = 1
+    steady_state = mp.U_solve(lu_matrix, mp.L_solve(lu_matrix, constraint, pivots))
+    sorted_pivots = sorted(fabs(lu_matrix[i, i]) for i in range(size))
+    if size < 2:
+        return steady_state, (sorted_pivots[0], sorted_pivots[0])
+    return steady_state, (sorted_pivots[1], sorted_pivots[0])
+
+
+def lu_decomposition(bordered_matrix):
+    """
+    Factor a bordered matrix with mp.LU_decomp, mpmath raises a ZeroDivisionError if a pivot
+    is too small for the precision to tell apart from zero
+    :param bordered_matrix: mpmath matrix made by make_bordered_matrix
+    :return: LU factors and pivots made by mp.LU_decomp, or None if the matrix is numerically
+    singular at the current mp.dps
+    """
+    try:
+        return mp.LU_decomp(bordered_matrix)
+    except ZeroDivisionError:
+        return None
+
+
+def lu_condition_estimate(bordered_matrix, lu_factors):
+    """
+    Estimate the 1-norm condition number of a bordered matrix from its LU factors
+    :param bordered_matrix: mpmath matrix made by make_bordered_matrix
+    :param lu_factors: LU factors and pivots of the bordered matrix made by lu_decomposition
+    :return: estimate of the condition number, mp.inf if the matrix is numerically singular
+    (lu_factors is None)
+    """
+    if lu_factors is None:
+        return mp.inf
+    lu_matrix, pivots = lu_factors
+    return condition_estimate(mnorm(bordered_matrix, 1),
+                              lambda x: mp.U_solve(lu_matrix, mp.L_solve(lu_matrix, x, pivots)),
+                              lambda x: lu_transpose_solve(lu_matrix, pivots, x),
+                              bordered_matrix.rows)
+
+
+def lu_transpose_solve(lu_matrix, pivots, vector):
+    """
+    Solve A.T * x = vector with the LU factors of A made by mp.LU_decomp, where the rows of A
+    were swapped by pivots so that P*A = L*U and A.T = U.T * L.T * P
+    :param lu_matrix: mpmath matrix with L below the diagonal and U on and above it
+    :param pivots: list of the row swapped with each row by mp.LU_decomp
+    :param vector: mpmath vector to solve for
+    :return: mpmath vector x
+    """
+    size = lu_matrix.rows
+    solution = [vector[i] for i in range(size)]
+    # U.T is lower triangular
+    for i in range(size):
+        solution[i] = ((solution[i] - fsum(lu_matrix[k, i]*solution[k] for k in range(i)))
+                       / lu_matrix[i, i])
+    # L.T is upper triangular with ones on the diagonal
+    for i in range(size-1, -1, -1):
+        solution[i] -= fsum(lu_matrix[k, i]*solution[k] for k in range(i+1, size))
+    # undo the row swaps in the reverse order they were made
+    for i in range(len(pivots)-1, -1, -1):
+        solution[i], solution[pivots[i]] = solution[pivots[i]], solution[i]
+    return mp.matrix(solution)
+
+
+def condition_estimate(matrix_norm, solve, solve_transpose, size, max_iterations=5):
+    """
+    Estimate the 1-norm condition number of a matrix with Hager's method as improved by
+    Higham, see np_func.condition_estimate.  Costs O(n^2) once the matrix is factored
+    :param matrix_norm: 1-norm of the matrix
+    :param solve: function that returns inv(A)*x
+    :param solve_transpose: function that returns inv(A.T)*x
+    :param size: number of rows in the matrix
+    :param max_iterations: most number of times to improve the estimate
+    :return: estimate of the condition number
+    """
+    test_vector = mp.matrix([mp.mpf(1)/size]*size)
+    inverse_norm = mp.zero
+    for iteration in range(max_iterations):
+        solution = solve(test_vector)
+        new_inverse_norm = norm(solution, 1)
+        if iteration and new_inverse_norm <= inverse_norm:
+            break
+        inverse_norm = new_inverse_norm
+        gradient = solve_transpose(mp.matrix([1 if solution[i] >= 0 else -1
+                                              for i in range(size)]))
+        largest_index = max(range(size), key=lambda i: fabs(gradient[i]))
+        # stop at a local maximum
+        if fabs(gradient[largest_index]) <= fsum(gradient[i]*test_vector[i]
+                                                 for i in range(size)):
+            break
+        test_vector = mp.matrix(size, 1)
+        test_vector[largest_index] = 1
+    # Higham's extra vector with alternating signs catches matrices the iterations miss
+    alternating = mp.matrix([(-1)**i * (1 + mp.mpf(i)/max(size-1, 1)) for i in range(size)])
+    inverse_norm = max(inverse_norm, 2*norm(solve(alternating), 1) / (3*size))
+    return matrix_norm * inverse_norm
 
 
 def svd_func(_matrix):
@@ -239,10 +552,26 @@ class Results(object):
     """
     Custom class to store the results, currently stores all ion transported over each barrier
     """
-    def __init__(self, _voltage, _matrix_specs, _ion_transport, _fitting_specs, _current, _ss):
+    def __init__(self, _voltage, _matrix_specs, _ion_transport, _fitting_specs, _current, _ss,
+                 _precision=None, _method=None):
         self.voltage = _voltage
         self.matrix_spec = _matrix_specs
         self.ion_transport = _ion_transport
         self.fitting = _fitting_specs
         self.current = _current
         self.steady_state = _ss
+        self.precision = _precision  # mp.dps the results were calculated with, None for numpy
+        self.method = _method  # method the steady state was found with
+
+    def __getstate__(self):
+        # mpmath matrices can not be pickled, save the steady state as a list so the results
+        # can be sent between processes and saved in shelves
+        state = self.__dict__.copy()
+        if isinstance(self.steady_state, mp.matrix):
+            state['steady_state'] = self.steady_state.tolist()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.steady_state, list):
+            self.steady_state = mp.matrix(self.steady_state)
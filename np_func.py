@@ -8,6 +8,9 @@ import logging
 import time
 
 import numpy as np
+from scipy import linalg as scipy_linalg
+from scipy import sparse
+from scipy.sparse import linalg as sparse_linalg
 
 import eyring_rate_script as eyring_script
 
@@ -21,22 +24,84 @@ HANDLER = logging.FileHandler('np_timing.txt')
 LOGGER.addHandler(HANDLER)
 LOGGER.setLevel(logging.INFO)
 
+# method used to find the steady state if none is given, 'all' runs eig, svd and qr to compare
+DEFAULT_METHOD = 'solve'
+# Krylov methods that keep the last steady state and preconditioner between voltages
+ITERATIVE_METHODS = ('gmres', 'bicgstab')
+# the 'solve' method uses the GTH algorithm if the ratio of the largest to smallest non-zero
+# elements of the transition matrix is larger than this, see steady_state_gth
+STIFF_THRESHOLD = 1e6
 
-def solve_eyring_rate_model(voltage, transition_matrix):
+
+def solve_eyring_rate_model(voltage, transition_matrix, model=eyring_script,
+                            method=DEFAULT_METHOD, out=None):
+    """
+    Save the matrix specifications, calculate the steady state of the matrix with one method
+    then save the results.  Results saves in custom class.
+    :param voltage:  voltage the matrix is at, used to save conditions
+    :param transition_matrix: numpy matrix of transition rates
+    :param model: the rate context the matrix was made with, made by the eyring_rate_context
+    function of the eyring rate script or compiled_model.CompiledEyringModel, used to
+    calculate the transport rates
+    :param method: string of the method to find the steady state with, 'solve', 'gth', 'eig',
+    'svd' or 'qr', or 'all' to compare the eig, svd and qr methods, or an IterativeSteadyState
+    made by make_sweep_method.  'solve' changes to 'gth' for stiff matrices, the method used
+    is saved in Results.method
+    :param out: result_set.ResultRow to write the results into instead of making a Results,
+    or a tuple of the rows for eig, svd and qr if method is 'all', used by the sweeps
+    :return: custom class that saves the results, see Results class at bottom of file, or
+    a tuple of the results by eig, svd and qr if method is 'all', out if it is given
+    """
+    if method == 'all':
+        return solve_eyring_rate_model_all(voltage, transition_matrix, model, out)
+    if isinstance(method, IterativeSteadyState):
+        return solve_eyring_rate_model_iterative(voltage, transition_matrix, method, model, out)
+    largest_matrix_element, smallest_matrix_element = smallest_largest_elements(transition_matrix)
+    if method == 'solve' and largest_matrix_element > STIFF_THRESHOLD * smallest_matrix_element:
+        # the small rates are lost when added to the large rates in the diagonal elements
+        LOGGER.info('largest to smallest element ratio %.2e is above STIFF_THRESHOLD, '
+                    'solve changed to gth', largest_matrix_element / smallest_matrix_element)
+        method = 'gth'
+    steady_state_func = get_steady_state_function(method)
+    # the LU factors of the bordered matrix give the condition number estimate and
+    # are reused to find the steady state by the 'solve' method, timing includes both
+    start = time.time()
+    bordered_matrix = make_bordered_matrix(transition_matrix)
+    lu_factors = scipy_linalg.lu_factor(bordered_matrix)
+    matrix_specs = MatrixSpecs(largest_matrix_element,
+                               smallest_matrix_element,
+                               lu_condition_estimate(bordered_matrix, lu_factors))
+    if method == 'solve':
+        steady_state, test_values = steady_state_lu(lu_factors)
+    else:
+        steady_state, test_values = steady_state_func(transition_matrix)
+    if method == 'svd' and not any(steady_state):  # in case the svd fails
+        steady_state, test_values = steady_state_eig(transition_matrix)
+    LOGGER.info('numpy time %s for matrix size %d: %5.10f',
+                method, len(transition_matrix), time.time()-start)
+    return solve_eyring_rate_model_ss(voltage, steady_state, transition_matrix,
+                                      test_values, matrix_specs, model, method, out)
+
+
+def solve_eyring_rate_model_all(voltage, transition_matrix, model=eyring_script, out=None):
     """
     Save all the matrix specifications, calculate the steady state of the matrix,
     NOTE: using 3 methods for testing purposes
     then save all the results.  Results saves in custom class.
-    NOTE: too many local variables for testing; TODO: pick best method for final use
-    :param voltage:  voltage the matrix is at, used to save conditions, TODO: take out for final use
+    :param voltage:  voltage the matrix is at, used to save conditions
     :param transition_matrix: numpy matrix of transition rates
-    :return: custom class that saves the results, see Results class at bottom of file
+    :param model: the model the matrix was made with, used to calculate the transport rates
+    :param out: tuple of the result_set.ResultRows to write the eig, svd and qr results into
+    :return: tuple of the results by the eigenvector, svd and qr methods
     """
+    eig_out, svd_out, qr_out = out or (None, None, None)
     # get the largest and smallest elements from the matrix to characterize the difficulty of
     # solving null space of the matrix and save it to be retrieved later
     len_matrix = len(transition_matrix)
     largest_matrix_element, smallest_matrix_element = smallest_largest_elements(transition_matrix)
-    condition_number = np.linalg.cond(transition_matrix)
+    bordered_matrix = make_bordered_matrix(transition_matrix)
+    condition_number = lu_condition_estimate(bordered_matrix,
+                                             scipy_linalg.lu_factor(bordered_matrix))
     matrix_specs = MatrixSpecs(largest_matrix_element,
                                smallest_matrix_element,
                                condition_number)
@@ -48,7 +113,7 @@ def solve_eyring_rate_model(voltage, transition_matrix):
     # save all the results in a custom data class and return it
     results_eig = solve_eyring_rate_model_ss(voltage, ss_by_eig,
                                              transition_matrix, test_eigs_by_eig,
-                                             matrix_specs)
+                                             matrix_specs, model, 'eig', eig_out)
 
     # get the steady state (ss) solution by using the svd decomposition
     start = time.time()
@@ -57,7 +122,12 @@ def solve_eyring_rate_model(voltage, transition_matrix):
     if any(ss_by_svd):  # in case the svd fails because of singularity
         results_svd = solve_eyring_rate_model_ss(voltage, ss_by_svd,
                                                  transition_matrix, test_eig_by_svd,
-                                                 matrix_specs)
+                                                 matrix_specs, model, 'svd', svd_out)
+    elif svd_out is not None:
+        # hack to make the program work if svd fails, the eig results are used
+        results_svd = solve_eyring_rate_model_ss(voltage, ss_by_eig,
+                                                 transition_matrix, test_eigs_by_eig,
+                                                 matrix_specs, model, 'eig', svd_out)
     else:
         results_svd = results_eig  # hack to make the program work if svd fails
 
@@ -67,13 +137,83 @@ def solve_eyring_rate_model(voltage, transition_matrix):
     qr_time = time.time()-start
     results_qr = solve_eyring_rate_model_ss(voltage, ss_by_qr,
                                             transition_matrix, test_eig_by_qr,
-                                            matrix_specs)
+                                            matrix_specs, model, 'qr', qr_out)
     LOGGER.info('numpy times eig; svd; qr for matrix size %d: %5.10f %5.10f %5.10f',
                 len_matrix, eig_time, svd_time, qr_time)
     return results_eig, results_svd, results_qr
 
 
-def solve_eyring_rate_model_ss(voltage, _ss, _matrix, _test, _specs):
+def solve_eyring_rate_model_sparse(voltage, transition_matrix, model=eyring_script,
+                                   out=None):
+    """
+    Calculate the steady state of a sparse transition matrix with a sparse LU factorization
+    and save the results, for large models where the dense methods take too much memory
+    :param voltage: voltage the matrix is at, used to save conditions
+    :param transition_matrix: scipy sparse matrix of transition rates
+    :param model: the model the matrix was made with, used to calculate the transport rates
+    :param out: result_set.ResultRow to write the results into, see solve_eyring_rate_model
+    :return: custom class that saves the results, see Results class at bottom of file
+    """
+    largest_matrix_element, smallest_matrix_element = smallest_largest_elements_sparse(
+        transition_matrix)
+    start = time.time()
+    bordered_matrix = make_sparse_bordered_matrix(transition_matrix)
+    lu_factors = sparse_linalg.splu(bordered_matrix)
+    matrix_specs = MatrixSpecs(largest_matrix_element,
+                               smallest_matrix_element,
+                               splu_condition_estimate(bordered_matrix, lu_factors))
+    ss_by_lu, test_pivots = steady_state_splu(lu_factors)
+    LOGGER.info('numpy time sparse lu for matrix size %d: %5.10f',
+                transition_matrix.shape[0], time.time()-start)
+    return solve_eyring_rate_model_ss(voltage, ss_by_lu, transition_matrix,
+                                      test_pivots, matrix_specs, model, 'sparse', out)
+
+
+def solve_eyring_rate_model_iterative(voltage, transition_matrix, solver, model=eyring_script,
+                                      out=None):
+    """
+    Calculate the steady state of a dense or sparse transition matrix with a Krylov solver
+    that is started from the steady state of the last voltage it solved, and save the results.
+    No factorization of the matrix is made so the condition number is not estimated
+    :param voltage: voltage the matrix is at, used to save conditions
+    :param transition_matrix: numpy matrix or scipy sparse matrix of transition rates
+    :param solver: IterativeSteadyState used for every voltage of the sweep
+    :param model: the model the matrix was made with, used to calculate the transport rates
+    :param out: result_set.ResultRow to write the results into, see solve_eyring_rate_model
+    :return: custom class that saves the results, see Results class at bottom of file
+    """
+    if sparse.issparse(transition_matrix):
+        largest_matrix_element, smallest_matrix_element = smallest_largest_elements_sparse(
+            transition_matrix)
+    else:
+        largest_matrix_element, smallest_matrix_element = smallest_largest_elements(
+            transition_matrix)
+    matrix_specs = MatrixSpecs(largest_matrix_element,
+                               smallest_matrix_element,
+                               None)
+    start = time.time()
+    steady_state, test_values = solver(transition_matrix)
+    LOGGER.info('numpy time %s for matrix size %d: %5.10f, iterations: %d, fallbacks: %d of %d',
+                solver, transition_matrix.shape[0], time.time()-start, solver.iterations,
+                solver.fallbacks, solver.solves)
+    return solve_eyring_rate_model_ss(voltage, steady_state, transition_matrix,
+                                      test_values, matrix_specs, model, str(solver), out)
+
+
+def make_sweep_method(method):
+    """
+    Make the method used to solve every voltage of a sweep, the iterative methods need a
+    solver that keeps its state from one voltage to the next
+    :param method: string of the method to find the steady state with
+    :return: IterativeSteadyState if method is in ITERATIVE_METHODS, else method
+    """
+    if method in ITERATIVE_METHODS:
+        return IterativeSteadyState(method)
+    return method
+
+
+def solve_eyring_rate_model_ss(voltage, _ss, _matrix, _test, _specs, model=eyring_script,
+                               method=None, out=None):
     """
     Take the steady state of a matrix, the matrix and calculate the transport rates of
     the solutes and current created
@@ -82,10 +222,13 @@ def solve_eyring_rate_model_ss(voltage, _ss, _matrix, _test, _specs):
     :param _matrix: numpy matrix of transition rates
     :param _test: tuple of testing characteristics to pass through to results
     :param _specs: matrix specifications to pass to the results
-    :return: custom class Results
+    :param model: the model to calculate the transport rates and current with
+    :param method: string of the method the steady state was found with, to pass to results
+    :param out: result_set.ResultRow to write the results into instead of making a Results
+    :return: custom class Results, or out if it is given
     """
     # 3 calculate the ion transport rates
-    _solute_transport = eyring_script.eyring_rate_transport(_ss)
+    _solute_transport = model.eyring_rate_transport(_ss)
     # transports are in 1x1 matrix form, so convert them to just scalars
     solute_transport = dict()
     for solute in _solute_transport:
@@ -93,17 +236,218 @@ def solve_eyring_rate_model_ss(voltage, _ss, _matrix, _test, _specs):
 
     # characterize how well the steady state is by getting the residues of the steady
     # state times the transition matrix
-    sum_squared_errors, sum_absolute_errors = characterize_solution(_ss, _matrix)
+    sum_absolute_errors, sum_squared_errors = characterize_solution(_ss, _matrix)
 
     # 4 calculate the current from the solute transport rates
-    current = eyring_script.current_calc(solute_transport)
+    current = model.current_calc(solute_transport)
+
+    if out is not None:
+        out.set_result(voltage, _specs, solute_transport, _test, sum_absolute_errors,
+                       sum_squared_errors, current, _ss, method=method)
+        return out
 
     # save the fitting results in a custom class
     fitting_specs_eig = FittingMetrics(_test, sum_absolute_errors,
                                        sum_squared_errors, solute_transport)
 
     return Results(voltage, _specs, solute_transport, fitting_specs_eig,
-                   current, _ss)
+                   current, _ss, _method=method)
+
+
+def get_steady_state_function(method):
+    """
+    Get the function that finds the steady state of a matrix by a method
+    :param method: string, 'solve', 'gth', 'eig', 'svd' or 'qr'
+    :return: function that takes a matrix and returns the steady state and 2 test values
+    """
+    steady_state_functions = {'solve': steady_state_solve,
+                              'gth': steady_state_gth,
+                              'eig': steady_state_eig,
+                              'svd': svd_func,
+                              'qr': qr_func}
+    if method not in steady_state_functions:
+        raise IOError("method should be one of: {0}".format(sorted(steady_state_functions)))
+    return steady_state_functions[method]
+
+
+def make_bordered_matrix(_matrix):
+    """
+    Make a copy of a transition matrix with the last equation replaced by the normalization
+    constraint that the steady state sums to 1.  The columns of a transition matrix sum to
+    zero so the equation replaced is not needed and the bordered matrix is not singular
+    :param _matrix: transition matrix
+    :return: numpy array of the bordered matrix
+    """
+    bordered_matrix = np.array(_matrix, dtype=float)  # copy to not overwrite
+    bordered_matrix[-1, :] = 1.0
+    return bordered_matrix
+
+
+def steady_state_solve(_matrix):
+    """
+    Find the steady state of a matrix by solving the bordered matrix with an LU factorization
+    :param _matrix: matrix to solve steady state for
+    :return: vector of steady state and 2 smallest pivots of the LU factorization
+    """
+    return steady_state_lu(scipy_linalg.lu_factor(make_bordered_matrix(_matrix)))
+
+
+def steady_state_lu(lu_factors):
+    """
+    Find the steady state from the LU factors of a bordered matrix
+    :param lu_factors: LU factors made by scipy.linalg.lu_factor of make_bordered_matrix
+    :return: vector of steady state and 2 smallest pivots of the LU factorization
+    """
+    constraint = np.zeros(len(lu_factors[0]))
+    constraint[-1] = 1.0
+    steady_state = scipy_linalg.lu_solve(lu_factors, constraint)
+    # ordered the same as two_largest with the smallest last
+    pivots = np.sort(np.fabs(np.diag(lu_factors[0])))[1::-1]
+    return np.matrix(steady_state).T, pivots
+
+
+def steady_state_gth(_matrix):
+    """
+    Find the steady state of a matrix with the Grassmann-Taksar-Heyman (GTH) algorithm, a
+    version of Gaussian elimination for Markov chains that has no subtractions.  The diagonal
+    elements are not used, they are found again from the off diagonal rates at each step,
+    so every element of the steady state has a small relative error no matter how many orders
+    of magnitude the rates cover.  This lets float64 solve models that needed mpmath before
+    :param _matrix: matrix to solve steady state for
+    :return: vector of steady state and 2 smallest total rates out of the eliminated states,
+    ordered the same as two_largest with the smallest last
+    """
+    # rates[i, j] is the rate from state i to state j, the transpose of the transition matrix
+    rates = np.array(_matrix, dtype=float).T
+    np.fill_diagonal(rates, 0.0)
+    num_states = len(rates)
+    out_rates = np.zeros(num_states)
+    # eliminate the states from the last to the first, the rates between the states left
+    # are increased by the rates of going through the state eliminated
+    for state in range(num_states-1, 0, -1):
+        out_rates[state] = np.sum(rates[state, :state])
+        rates[:state, state] /= out_rates[state]
+        rates[:state, :state] += np.outer(rates[:state, state], rates[state, :state])
+    # back substitute, starting from an unnormalized value of 1 for the first state
+    steady_state = np.zeros(num_states)
+    steady_state[0] = 1.0
+    for state in range(1, num_states):
+        steady_state[state] = np.dot(steady_state[:state], rates[:state, state])
+    smallest_out_rates = np.sort(out_rates[1:])[1::-1] if num_states > 2 else (0.0, 0.0)
+    return np.matrix(steady_state / np.sum(steady_state)).T, smallest_out_rates
+
+
+def steady_state_batched(transition_matrices):
+    """
+    Find the steady states of a stack of transition matrices with one stacked linear solve.
+    The columns of a transition matrix sum to zero so the last equation is replaced with the
+    normalization constraint that the steady state sums to 1
+    :param transition_matrices: array of shape (number of voltages, n, n)
+    :return: array of shape (number of voltages, n) of the steady states
+    """
+    bordered_matrices = np.array(transition_matrices, dtype=float)  # copy to not overwrite
+    bordered_matrices[:, -1, :] = 1.0
+    constraint = np.zeros(bordered_matrices.shape[:2] + (1,))
+    constraint[:, -1, 0] = 1.0
+    return np.linalg.solve(bordered_matrices, constraint)[:, :, 0]
+
+
+def make_sparse_bordered_matrix(_matrix):
+    """
+    Make a sparse matrix with the last equation of a transition matrix replaced by the
+    normalization constraint, see make_bordered_matrix
+    :param _matrix: scipy sparse transition matrix
+    :return: scipy.sparse.csc_matrix of the bordered matrix
+    """
+    num_states = _matrix.shape[0]
+    return sparse.vstack([sparse.csr_matrix(_matrix)[:-1],
+                          np.ones((1, num_states))], format='csc')
+
+
+def steady_state_sparse_lu(_matrix):
+    """
+    Find the steady state of a sparse matrix by solving the bordered matrix with a
+    sparse LU factorization
+    :param _matrix: scipy sparse matrix to solve steady state for
+    :return: vector of steady state and 2 smallest pivots of the LU factorization
+    """
+    return steady_state_splu(sparse_linalg.splu(make_sparse_bordered_matrix(_matrix)))
+
+
+def steady_state_splu(lu_factors):
+    """
+    Find the steady state from the sparse LU factors of a bordered matrix
+    :param lu_factors: scipy.sparse.linalg.SuperLU of make_sparse_bordered_matrix
+    :return: vector of steady state and 2 smallest pivots of the LU factorization
+    """
+    constraint = np.zeros(lu_factors.shape[0])
+    constraint[-1] = 1.0
+    steady_state = lu_factors.solve(constraint)
+    # the smallest pivots tell how close the bordered matrix is to being singular,
+    # ordered the same as two_largest with the smallest last
+    pivots = np.sort(np.fabs(lu_factors.U.diagonal()))[1::-1]
+    return np.matrix(steady_state).T, pivots
+
+
+def lu_condition_estimate(bordered_matrix, lu_factors):
+    """
+    Estimate the 1-norm condition number of a bordered matrix from its LU factors
+    :param bordered_matrix: numpy array made by make_bordered_matrix
+    :param lu_factors: LU factors of the bordered matrix made by scipy.linalg.lu_factor
+    :return: estimate of the condition number
+    """
+    return condition_estimate(np.linalg.norm(bordered_matrix, 1),
+                              lambda x: scipy_linalg.lu_solve(lu_factors, x),
+                              lambda x: scipy_linalg.lu_solve(lu_factors, x, trans=1),
+                              len(bordered_matrix))
+
+
+def splu_condition_estimate(bordered_matrix, lu_factors):
+    """
+    Estimate the 1-norm condition number of a sparse bordered matrix from its LU factors
+    :param bordered_matrix: scipy sparse matrix made by make_sparse_bordered_matrix
+    :param lu_factors: scipy.sparse.linalg.SuperLU of the bordered matrix
+    :return: estimate of the condition number
+    """
+    return condition_estimate(sparse_linalg.norm(bordered_matrix, 1),
+                              lu_factors.solve,
+                              lambda x: lu_factors.solve(x, trans='T'),
+                              bordered_matrix.shape[0])
+
+
+def condition_estimate(matrix_norm, solve, solve_transpose, size, max_iterations=5):
+    """
+    Estimate the 1-norm condition number of a matrix, norm(A, 1) * norm(inv(A), 1), with
+    Hager's method as improved by Higham (the LAPACK xLACON estimator).  The norm of the inverse
+    is found from a few solves with the factors of the matrix so it costs O(n^2) instead of
+    the O(n^3) of the SVD used by np.linalg.cond
+    :param matrix_norm: 1-norm of the matrix
+    :param solve: function that returns inv(A)*x
+    :param solve_transpose: function that returns inv(A.T)*x
+    :param size: number of rows in the matrix
+    :param max_iterations: most number of times to improve the estimate, usually 2 are needed
+    :return: estimate of the condition number, it is never more than the actual value
+    """
+    test_vector = np.full(size, 1.0/size)
+    inverse_norm = 0.0
+    for iteration in range(max_iterations):
+        solution = solve(test_vector)
+        new_inverse_norm = np.sum(np.fabs(solution))
+        if iteration and new_inverse_norm <= inverse_norm:
+            break
+        inverse_norm = new_inverse_norm
+        gradient = solve_transpose(np.where(solution >= 0, 1.0, -1.0))
+        largest_index = np.argmax(np.fabs(gradient))
+        # stop at a local maximum
+        if np.fabs(gradient[largest_index]) <= np.dot(gradient, test_vector):
+            break
+        test_vector = np.zeros(size)
+        test_vector[largest_index] = 1.0
+    # Higham's extra vector with alternating signs catches matrices the iterations miss
+    alternating = (np.where(np.arange(size) % 2, -1.0, 1.0)
+                   * (1 + np.arange(size) / max(size-1.0, 1.0)))
+    inverse_norm = max(inverse_norm, 2*np.sum(np.fabs(solve(alternating))) / (3.0*size))
+    return matrix_norm * inverse_norm
 
 
 def svd_func(_matrix):
@@ -191,6 +535,201 @@ def smallest_largest_elements(_matrix):
     return largest_element, smallest_element
 
 
+def smallest_largest_elements_sparse(_matrix):
+    """
+    get the smallest and largest non-zero elements of a sparse matrix in absolute terms
+    :param _matrix: scipy sparse matrix to search
+    :return: largest number, smallest number
+    """
+    abs_elements = np.fabs(sparse.csr_matrix(_matrix).data)
+    abs_elements = abs_elements[np.nonzero(abs_elements)]
+    return np.amax(abs_elements), np.amin(abs_elements)
+
+
+class IterativeSteadyState(object):
+    """
+    Find the steady states of the transition matrices of a voltage sweep with a preconditioned
+    Krylov solver (GMRES or BiCGSTAB) of the bordered matrix.  The steady states of voltages
+    next to each other are close, so each solve is started from the last accepted steady state
+    and first tries the incomplete LU preconditioner of an earlier voltage, the preconditioner
+    is only remade when the solver does not converge with it in refactor_iterations iterations.
+    Make one instance for each sweep.
+
+    The probabilities of the states of a stiff model cover many orders of magnitude, so the
+    matrix is solved for the flux through each state instead: the columns are multiplied by a
+    reference steady state (the last one accepted) and the rows are scaled to a largest element
+    of 1.  The solution of the scaled matrix is close to 1 for every state, so the small
+    probabilities are found with the same relative accuracy as the large ones.  If the solution
+    is not accepted (see flux_residual) the reference is replaced by the new steady state and
+    the matrix is solved again, up to max_rescales times, then a sparse LU factorization of the
+    scaled matrix is used; the number of these fallbacks is kept in fallbacks.
+
+    Called like the other steady state functions, it returns the steady state and the
+    number of iterations and flux residual (see flux_residual) as the test values
+    """
+    def __init__(self, method='gmres', tolerance=1e-14, max_iterations=500,
+                 refactor_iterations=20, drop_tolerance=1e-6, residual_tolerance=None,
+                 max_rescales=4):
+        """
+        :param method: string, 'gmres' or 'bicgstab'
+        :param tolerance: relative residual of the scaled bordered matrix to stop at
+        :param max_iterations: most number of iterations before the solve has failed
+        :param refactor_iterations: remake the preconditioner if a solve with the preconditioner
+        of an earlier voltage does not converge in this many iterations
+        :param drop_tolerance: drop tolerance of the incomplete LU preconditioner
+        :param residual_tolerance: largest flux residual a solution is accepted with, if None
+        10 times the larger of tolerance and the rounding error of adding up the fluxes of
+        every state is used, see get_residual_tolerance
+        :param max_rescales: most number of times a voltage is solved again with the new
+        steady state as the reference before the sparse LU fallback is used
+        """
+        krylov_solvers = {'gmres': sparse_linalg.gmres,
+                          'bicgstab': sparse_linalg.bicgstab}
+        if method not in krylov_solvers:
+            raise IOError("method should be one of: {0}".format(sorted(krylov_solvers)))
+        self.method = method
+        self.krylov_solver = krylov_solvers[method]
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.refactor_iterations = refactor_iterations
+        self.drop_tolerance = drop_tolerance
+        self.residual_tolerance = residual_tolerance
+        self.max_rescales = max_rescales
+        self.preconditioner = None
+        self.steady_state = None  # last accepted steady state, used to start the next solve
+        self.iterations = 0  # iterations of the last voltage, of every rescaled solve
+        self.solves = 0  # number of voltages solved
+        self.fallbacks = 0  # number of voltages solved with the sparse LU fallback
+
+    def __str__(self):
+        return self.method
+
+    def __call__(self, _matrix):
+        """
+        Find the steady state of a transition matrix
+        :param _matrix: numpy matrix or scipy sparse matrix of transition rates
+        :return: vector of steady state and the number of iterations and the flux residual
+        """
+        bordered_matrix = make_sparse_bordered_matrix(_matrix).tocsc()
+        num_states = bordered_matrix.shape[0]
+        residual_tolerance = self.get_residual_tolerance(num_states)
+        if self.steady_state is None:
+            reference = np.ones(num_states) / num_states
+        else:
+            reference = self.steady_state
+        self.iterations = 0
+        self.solves += 1
+        accepted = False
+        # first try the preconditioner of an earlier voltage for a few iterations
+        reuse_preconditioner = self.preconditioner is not None
+        for _ in range(self.max_rescales+1):
+            scaled_matrix, scaled_constraint = flux_scale(bordered_matrix, reference)
+            converged = False
+            if reuse_preconditioner:
+                flux, converged = self._solve(scaled_matrix, scaled_constraint,
+                                              self.refactor_iterations)
+                reuse_preconditioner = False
+            if not converged:
+                # the preconditioner was made for a matrix too different from this one
+                self._make_preconditioner(scaled_matrix)
+                flux, converged = self._solve(scaled_matrix, scaled_constraint,
+                                              self.max_iterations)
+            steady_state = reference * flux
+            if not np.all(np.isfinite(steady_state)):
+                break
+            accepted = (converged and np.min(steady_state) > 0 and
+                        self.flux_residual(bordered_matrix, steady_state) <= residual_tolerance)
+            if accepted:
+                break
+            # solve again with the fluxes through the new steady state, this is needed for
+            # the first voltage of a stiff sweep that has no earlier steady state to start with
+            reference = np.fmax(np.fabs(steady_state), np.finfo(float).tiny)
+        if not accepted:
+            self.fallbacks += 1
+            LOGGER.info('%s solution not accepted, using sparse LU, fallbacks: %d of %d',
+                        self.method, self.fallbacks, self.solves)
+            scaled_matrix, scaled_constraint = flux_scale(bordered_matrix, reference)
+            steady_state = reference * sparse_linalg.splu(scaled_matrix).solve(scaled_constraint)
+        self.steady_state = steady_state
+        return (np.matrix(steady_state).T,
+                (self.iterations, self.flux_residual(bordered_matrix, steady_state)))
+
+    def get_residual_tolerance(self, num_states):
+        """
+        Get the largest flux residual a solution of a matrix is accepted with
+        :param num_states: number of states of the matrix
+        :return: residual_tolerance, or 10 times the larger of the Krylov tolerance and the
+        rounding error of adding up num_states fluxes if it is None
+        """
+        if self.residual_tolerance is not None:
+            return self.residual_tolerance
+        return 10 * max(self.tolerance, num_states * np.finfo(float).eps)
+
+    @staticmethod
+    def flux_residual(bordered_matrix, steady_state):
+        """
+        Calculate the residual of each equation of the bordered system relative to the largest
+        flux into or out of its state, so the equations of the states with small probabilities
+        are checked as closely as the others
+        :param bordered_matrix: scipy sparse bordered matrix, not scaled
+        :param steady_state: array of the solution
+        :return: largest relative residual (constraint - bordered matrix * steady state)
+        """
+        scaled_matrix, scaled_constraint = flux_scale(bordered_matrix, steady_state)
+        residues = scaled_constraint - scaled_matrix.dot(np.ones(len(steady_state)))
+        return np.max(np.fabs(residues))
+
+    def _make_preconditioner(self, scaled_matrix):
+        """
+        Make an incomplete LU preconditioner of a scaled bordered matrix
+        :param scaled_matrix: scipy sparse csc matrix
+        """
+        incomplete_lu = sparse_linalg.spilu(scaled_matrix, drop_tol=self.drop_tolerance)
+        self.preconditioner = sparse_linalg.LinearOperator(scaled_matrix.shape,
+                                                           incomplete_lu.solve)
+
+    def _solve(self, scaled_matrix, scaled_constraint, max_iterations):
+        """
+        Solve the scaled bordered matrix with the Krylov solver started from a flux of 1
+        through every state, i.e. from the reference steady state
+        :param scaled_matrix: scipy sparse csc matrix made by flux_scale
+        :param scaled_constraint: right hand side made by flux_scale
+        :param max_iterations: most number of iterations before the solve has failed
+        :return: solution and if the solver converged
+        """
+        def count_iterations(_):
+            self.iterations += 1
+
+        options = dict()
+        if self.method == 'gmres':
+            # the maxiter of gmres is the number of restarts, of refactor_iterations each
+            options['restart'] = self.refactor_iterations
+            max_iterations = -(-max_iterations // self.refactor_iterations)
+        solution, info = self.krylov_solver(scaled_matrix, scaled_constraint,
+                                            x0=np.ones(scaled_matrix.shape[0]),
+                                            tol=self.tolerance, maxiter=max_iterations,
+                                            M=self.preconditioner, callback=count_iterations,
+                                            **options)
+        return solution, info == 0
+
+
+def flux_scale(bordered_matrix, reference):
+    """
+    Scale a bordered matrix so its solution is the flux through each state relative to a
+    reference steady state: the columns are multiplied by the reference and the rows are
+    scaled to have a largest element of 1
+    :param bordered_matrix: scipy sparse bordered matrix, see make_sparse_bordered_matrix
+    :param reference: array of positive probabilities of each state
+    :return: scipy sparse csc matrix and the scaled constraint (right hand side), the steady
+    state is the reference times the solution
+    """
+    column_scaled = bordered_matrix.dot(sparse.diags(reference))
+    row_scales = 1.0 / sparse_linalg.norm(column_scaled, np.inf, axis=1)
+    constraint = np.zeros(len(reference))
+    constraint[-1] = row_scales[-1]
+    return sparse.diags(row_scales).dot(column_scaled).tocsc(), constraint
+
+
 # bad style below for numerical testing, set to be fixed after testing
 class MatrixSpecs(object):
     """
@@ -234,10 +773,13 @@ class Results(object):
     """
     Custom class to store the results, currently stores all ion transported over each barrier
     """
-    def __init__(self, _voltage, _matrix_specs, _ion_transport, _fitting_specs, _current, _ss):
+    def __init__(self, _voltage, _matrix_specs, _ion_transport, _fitting_specs, _current, _ss,
+                 _precision=None, _method=None):
         self.voltage = _voltage
         self.matrix_spec = _matrix_specs
         self.ion_transport = _ion_transport
         self.fitting = _fitting_specs
         self.current = _current
         self.steady_state = _ss
+        self.precision = _precision  # mp.dps the results were calculated with, None for numpy
+        self.method = _method  # method the steady state was found with, e.g. 'gth' or 'gmres'
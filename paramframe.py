@@ -10,6 +10,10 @@ import pyplot_to_tkinter as pytink
 
 __author__ = 'Kyle Vitautas Lopin'
 
+# milliseconds to wait after the last change before the energy profile is redrawn, so typing
+# in the spinboxes only redraws the plot once
+REDRAW_DELAY = 150
+
 
 class ParameterSelectionFrame(tk.Frame):
     """
@@ -38,6 +42,7 @@ class ParameterSelectionFrame(tk.Frame):
         """
         tk.Frame.__init__(self, master=_master, bd=5, relief='raised')
         self.done_initialize = False
+        self.redraw_id = None  # id of the after call of the next redraw, see schedule_redraw
         charges = []
         if not _settings:
             _settings = dict()
@@ -107,8 +112,27 @@ class ParameterSelectionFrame(tk.Frame):
                     except:
                         pass  # ignore if user put in something weird and keep old value
             # TODO; check that barriers are higher than binding sites
-            # update the barrier plots
-            self.parameter_plot.draw_barriers(self.energy_barriers, solutes_list)
+            # update the barrier plots, the energy barriers are always up to date but the plot
+            # is only redrawn after the user stops changing the values
+            self.schedule_redraw(solutes_list)
+
+    def schedule_redraw(self, solutes_list):
+        """
+        Redraw the energy profile plot REDRAW_DELAY milliseconds from now, any redraw already
+        waiting is cancelled so a burst of changes is drawn once
+        :param solutes_list: list of strings of the solutes
+        """
+        if self.redraw_id:
+            self.after_cancel(self.redraw_id)
+        self.redraw_id = self.after(REDRAW_DELAY, self.redraw, solutes_list)
+
+    def redraw(self, solutes_list):
+        """
+        Draw the energy barriers in the energy profile plot
+        :param solutes_list: list of strings of the solutes
+        """
+        self.redraw_id = None
+        self.parameter_plot.draw_barriers(self.energy_barriers, solutes_list)
 
     def parameter_changed(self, *args):
         """
@@ -118,6 +142,15 @@ class ParameterSelectionFrame(tk.Frame):
         """
         self.update_energies(self.solutes)
 
+    def destroy(self):
+        """
+        Cancel any redraw waiting to be done before destroying the frame
+        """
+        if self.redraw_id:
+            self.after_cancel(self.redraw_id)
+            self.redraw_id = None
+        tk.Frame.destroy(self)
+
     def pyplot_embed(self):
         """
         Get a custom class that is a pyplot that is embedded in a tkinter Frame
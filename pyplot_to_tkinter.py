@@ -25,6 +25,9 @@ class PyplotEmbed(tk.Frame):
 
         self.extra_text = None  # initialize the text options variables
         self.intra_text = None
+        # Line2D of the energy profile of each solute, the lines are updated with set_data
+        # instead of being plotted again each time the profile changes
+        self.lines = dict()
 
         self.figure_bed = plt.figure(figsize=_size)
         self.axis = self.figure_bed.add_subplot(111)
@@ -41,32 +44,49 @@ class PyplotEmbed(tk.Frame):
 
     def draw_barriers(self, energy_barriers, solutes):
         """
-        Draw the energy profile
+        Draw the energy profile, the lines, legend and labels are made the first time and
+        only updated after that.  The canvas is redrawn with draw_idle so the redraw is done
+        by the tkinter event loop when it is idle
         :param energy_barriers: dict with keys of 'distance' and solutes the energy
         barriers are for
         :param solutes: list of solutes
         :return: display the pyplot
         """
-        while self.axis.lines:  # if lines are already plotted, go through and delete them all
-            self.axis.lines.pop()
+        if sorted(self.lines) != sorted(solutes):
+            self.make_lines(solutes)
         x = [-0.2, 0] + energy_barriers['distance'] + [1, 1.2]  # pad the ends of the plot
-        for i, solute in enumerate(solutes):
+        for solute in solutes:
             y = [0, 0] + energy_barriers[solute] + [0, 0]  # pad the ends of the plot
             if len(x) == len(y):  # incase the user inputted something weird just ignore it
-                self.axis.plot(x, y, COLORS[i], label=solute)  # draw the plot
-        # move the legend off to the side
-        self.axis.legend(prop={'size': 11}, loc='center left', bbox_to_anchor=(1, 0.5))
+                self.lines[solute].set_data(x, y)
+                self.lines[solute].set_visible(True)
+            else:
+                self.lines[solute].set_visible(False)
+        # rescale the axis, only the visible lines are used
+        self.axis.relim(visible_only=True)
+        self.axis.autoscale_view()
+        # move the labels in case the y axis has changed
         ymin, ymax = self.axis.get_ylim()
         y_spacing = ymin + (ymax-ymin)/7.
-        if self.extra_text:  # remove previous labels in case they have moved
-            self.extra_text.remove()
-            self.intra_text.remove()
+        self.extra_text.set_y(y_spacing)
+        self.intra_text.set_y(y_spacing)
+        self.canvas.draw_idle()  # redraw the canvas when tkinter is idle
 
-        self.extra_text = self.axis.text(-0.15, y_spacing, r'Extracellular',
-                                         color='#323280', fontsize=12)
-        self.intra_text = self.axis.text(0.83, y_spacing, r'Intracellular',
-                                         color='#323280', fontsize=12)
-        # rescale the axis
-        self.axis.relim()
-        self.axis.autoscale()
-        self.canvas.show()  # redraw the canvas to update it
+    def make_lines(self, solutes):
+        """
+        Make a line for the energy profile of each solute and the legend and labels of the plot,
+        any lines already made are removed
+        :param solutes: list of solutes
+        """
+        for line in self.lines.values():
+            line.remove()
+        self.lines = dict()
+        for i, solute in enumerate(solutes):
+            self.lines[solute], = self.axis.plot([], [], COLORS[i], label=solute)
+        # move the legend off to the side
+        self.axis.legend(prop={'size': 11}, loc='center left', bbox_to_anchor=(1, 0.5))
+        if not self.extra_text:
+            self.extra_text = self.axis.text(-0.15, 0, r'Extracellular',
+                                             color='#323280', fontsize=12)
+            self.intra_text = self.axis.text(0.83, 0, r'Intracellular',
+                                             color='#323280', fontsize=12)
@@ -0,0 +1,120 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+""" Closed form enumeration of the states of a single file Eyring rate model
+"""
+
+import numpy as np
+
+__author__ = 'Kyle Vitautas Lopin'
+
+
+class MixedRadixStates(object):
+    """
+    Enumerate all the states of a channel with num_binding_sites binding sites that can each be
+    empty or hold one of num_ions solutes.  Every channel configuration is encoded as a mixed
+    radix integer where each binding site is a digit, 0 for an empty site and i+1 for the ith
+    solute, and the first binding site (extracellular side) is the most significant digit.
+
+    example for 2 sites and the solutes ['Na', 'Ca']:
+    [0, 0] -> 0,  [0, 'Na'] -> 1,  ['Na', 'Ca'] -> 5,  ['Ca', 'Ca'] -> 8
+
+    Without a restriction on the occupancy all (num_ions+1)**num_binding_sites configurations can
+    be reached, so the neighbours of every state can be found with integer arithmetic on the codes
+    instead of by searching the states
+    """
+    def __init__(self, num_binding_sites, num_ions):
+        """
+        Make the codes and digits of all the states and the index of the states each one can
+        transition to
+        :param num_binding_sites: integer, number of binding sites in the channel
+        :param num_ions: integer, number of solutes that can bind in the channel
+        """
+        self.num_binding_sites = num_binding_sites
+        self.num_ions = num_ions
+        self.radix = num_ions + 1
+        self.num_states = self.radix ** num_binding_sites
+        # value of a digit in each binding site, the first site is the most significant
+        self.place_values = self.radix ** np.arange(num_binding_sites-1, -1, -1, dtype=np.int64)
+        self.codes = np.arange(self.num_states, dtype=np.int64)
+        # the digit in each binding site for every state, shape is (num_states, num_binding_sites)
+        self.digits = (self.codes[:, np.newaxis] // self.place_values) % self.radix
+        self.neighbours = self._make_neighbours()
+
+    def _make_neighbours(self):
+        """
+        Find the code of the state each state goes to for every forward transition.  The columns
+        are in the order the transitions are checked for in EryingRateModelMaker:
+        one column for each solute entering the first binding site, one column for each binding
+        site (except the last) an ion can hop forward from and one column for an ion exiting the
+        last binding site to the intracellular side.
+        :return: integer array of shape (num_states, num_ions + num_binding_sites), -1 is used
+        where the transition is not possible
+        """
+        codes = self.codes
+        digits = self.digits
+        place_values = self.place_values
+        num_columns = self.num_ions + self.num_binding_sites
+        neighbours = np.full((self.num_states, num_columns), -1, dtype=np.int64)
+
+        # an ion can enter the first binding site from the extracellular side if it is empty
+        first_site_empty = digits[:, 0] == 0
+        for ion_digit in range(1, self.num_ions+1):
+            neighbours[first_site_empty, ion_digit-1] = (codes[first_site_empty]
+                                                         + ion_digit*place_values[0])
+        # an ion can hop forward if the next binding site is empty
+        for site in range(self.num_binding_sites-1):
+            can_hop = (digits[:, site] != 0) & (digits[:, site+1] == 0)
+            neighbours[can_hop, self.num_ions+site] = (codes[can_hop]
+                                                       + digits[can_hop, site]
+                                                       * (place_values[site+1]-place_values[site]))
+        # an ion in the last binding site can exit to the intracellular side
+        can_exit = digits[:, -1] != 0
+        neighbours[can_exit, -1] = codes[can_exit] - digits[can_exit, -1]*place_values[-1]
+        return neighbours
+
+    def bfs_order(self):
+        """
+        Get the codes of the states in the order a breadth first search starting from the empty
+        channel finds them, this is the order EryingRateModelMaker puts the states in.
+        Each level of the search is done at once, the new states are the neighbours of the last
+        level that have not been found yet, in the order they are first seen
+        :return: integer array of codes, the ith element is the code of the ith state found
+        """
+        found = np.zeros(self.num_states, dtype=bool)
+        found[0] = True
+        frontier = np.zeros(1, dtype=np.int64)
+        levels = [frontier]
+        while frontier.size:
+            candidates = self.neighbours[frontier].ravel()
+            candidates = candidates[candidates >= 0]
+            candidates = candidates[~found[candidates]]
+            # keep only the first time each new state is seen
+            _, first_seen = np.unique(candidates, return_index=True)
+            frontier = candidates[np.sort(first_seen)]
+            found[frontier] = True
+            levels.append(frontier)
+        order = np.concatenate(levels)
+        if order.size != self.num_states:
+            raise ValueError("not all states can be reached from the empty channel")
+        return order
+
+    def get_configs(self, order, list_ions):
+        """
+        Convert the codes of states into channel configurations
+        :param order: array of codes of the states to convert
+        :param list_ions: list of strings that represent the ions
+        :return: list of channel configurations, e.g. [['Na', 0], [0, 'Ca']]
+        """
+        names = [0] + list(list_ions)
+        return [[names[digit] for digit in row] for row in self.digits[order].tolist()]
+
+
+def inverse_permutation(order):
+    """
+    Get the position of each code in an ordering of the states
+    :param order: integer array with a permutation of the codes
+    :return: integer array where position[code] is the index of code in order
+    """
+    position = np.empty_like(order)
+    position[order] = np.arange(order.size, dtype=order.dtype)
+    return position
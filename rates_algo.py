@@ -36,6 +36,9 @@ class EryingRateMaker(object):
 
         # make a copy of the rates to be used to make a global statement in the script
         self.global_rate_names = self.rates[:]
+        # the parts of each rate equation to calculate the rates numerically,
+        # indexed the same as global_rate_names, see make_right_side_rate_equation
+        self.rate_specs = []
 
         # make the right side of the rate assignment equations,
         # ie. = mp.mpf(Nae*k0*exp(-GNa1)*exp(1*q*-d1*V))
@@ -54,8 +57,13 @@ class EryingRateMaker(object):
 
         ie. = mp.mpf(Nae*k0*exp(-GNa1)*exp(1*q*-d1*V)) for k_0_1_Na
 
+        also save the parts of each equation in self.rate_specs as a tuple of
+        (ion, concentration key or None, energy terms, electrical distance constant,
+        electrical distance terms), the terms are lists of (index, sign) tuples
+        where the index is 0 based, ie. ('Na', 'Nae', [(0, -1)], 0, [(0, -1)]) for k_0_1_Na
+
         :param math_package: check if mpmath is being used
-        :return: bind all results to self.rates
+        :return: bind all results to self.rates and self.rate_specs
         """
         # check if mpmath is being used
         if math_package == 'mpmath':
@@ -82,15 +90,21 @@ class EryingRateMaker(object):
                 energy_barrier_str = '-G'+ion+'1'
                 electrical_distance_str = '-d1'
                 rate_start += (ion+"e*")
+                self.rate_specs.append((ion, ion+'e', [(0, -1)], 0, [(0, -1)]))
             elif (rate_elements[1] == self.num_binding_sites+1 and  # the ion is from the last
                   rate_elements[2] == self.num_binding_sites):  # site to the intracellular side
                 str_num = str(2*self.num_binding_sites+1)
                 energy_barrier_str = '-G'+ion+str_num
                 electrical_distance_str = '(1-d'+str_num+')'
                 rate_start += (ion+"i*")
+                last_index = 2*self.num_binding_sites
+                self.rate_specs.append((ion, ion+'i', [(last_index, -1)], 1, [(last_index, -1)]))
             else:
                 first_barrier_num = 2*rate_elements[1]
-                second_barrier_num = str(first_barrier_num - (rate_elements[1]-rate_elements[2]))
+                second_barrier_num = first_barrier_num - (rate_elements[1]-rate_elements[2])
+                terms = [(first_barrier_num-1, 1), (second_barrier_num-1, -1)]
+                self.rate_specs.append((ion, None, terms, 0, terms))
+                second_barrier_num = str(second_barrier_num)
                 first_barrier_num = str(first_barrier_num)
                 energy_barrier_str = 'G'+ion+first_barrier_num+'-G'+ion+second_barrier_num
                 electrical_distance_str = '(d'+first_barrier_num+'-d'+second_barrier_num+')'
@@ -118,24 +132,20 @@ class EryingRateMaker(object):
         """
         return '    ' + '\n    '.join(self.rates)
 
-    def get_global_variables_str(self):
+    def get_rate_names(self):
         """
-        Get a string to make the rates global
-        :return:
+        Get the names of all the rates, i.e. k_0_1_Na
+        :return: list of strings
         """
-        line_cutoff = 70  # make a new line if the current one gets too long
-        _str = "    global "
-        for rate in self.global_rate_names:
-            extra_ending = False
-            _str += rate + ', '
-            if (_str.find('\n', -line_cutoff) == -1) \
-               and (len(_str) > line_cutoff):
-                _str = _str[:-2] + '\n    global '
-                extra_ending = True
-        if extra_ending:
-            _str = _str[:-10]
+        return self.global_rate_names
 
-        return _str[:-2]
+    def get_rate_specs(self):
+        """
+        Get the parts of the rate equations, indexed the same as get_rate_names,
+        see make_right_side_rate_equation
+        :return: list of tuples
+        """
+        return self.rate_specs
 
     def _make_ion_assignment(self, solutes):
         """
@@ -205,4 +215,3 @@ class EryingRateMaker(object):
 if __name__ == "__main__":
     RATES = EryingRateMaker('numpy', 2, ['Na', 'Ca'], [1, 2])
     print RATES.get_rates_str()
-    print RATES.get_global_variables_str()
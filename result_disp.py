@@ -11,6 +11,9 @@ from tkFileDialog import asksaveasfilename
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
 
+# local files
+import result_set
+
 __author__ = 'Kyle Vitautas Lopin'
 
 COLORS = ['k', 'r', 'b', 'g', 'm', 'c']
@@ -31,7 +34,8 @@ class MultiPlotWindows(tk.Toplevel):
         solutes used plus a 'distance'  entry, the values are a list of the energy potentials
         of the barriers and binding sites except for the 'distance' value which is a list
         of the electrical distances used
-        :param results: claa Results found in numpy_helper_function
+        :param results: result_set.ResultSet or list of Results of np_func or mp_func,
+        lists are converted into a ResultSet
         :param solutes:  list of the strings of the solutes used
         :param conc_label: dict of concentrations used, the keys are the solutes + a 'e' or 'i'
         to represent if the concentration is the extra or intracellular concentration, the values
@@ -43,30 +47,16 @@ class MultiPlotWindows(tk.Toplevel):
         # bind variables to self so they don't have to be passed around as much
         self.voltages = voltage
         self.energy_profile = energy_profile
-        self.results = results
-        self.conc_label = conc_label
+        self.results = result_set.ResultSet.from_results(results)
         self.conc_label = conc_label
         self.solutes = solutes
-        # make variables to hold measurements
-        # dictionary to hold transport rates, keys are solutes and values are the a list
-        # transport rates over each barrier
+        # make variables to hold measurements, use the current and transport over the
+        # second barrier.  The transport dictionary has the solutes as keys and arrays of
+        # the transport rates at each voltage as values
+        self.current = self.results.current[:, 1]
         self.transport = dict()
-        # keep any differences between different transport rates over different barriers
-        transport_errors = dict()
-        self.current = []  # calculated current
-        steady_state = []  # steady state solution of states
         for solute in solutes:
-            self.transport[solute] = []
-            transport_errors[solute] = []
-        for result in results:
-            steady_state.append(result.steady_state)
-            self.current.append(result.current[1])  # use the transport over the second barrier
-            for solute in solutes:
-                # get the ions transported over the 2nd barrier
-                self.transport[solute].append(result.ion_transport[solute][1])
-                # get errors calculated for the ions transported over the different barriers
-                transport_errors[solute].append(max(result.ion_transport[solute])
-                                                -min(result.ion_transport[solute]))
+            self.transport[solute] = self.results.solute_transport(solute)[:, 1]
         if len(solutes) < 2:
             self._size = (2, 2)
         elif len(solutes) > 3:
@@ -195,45 +185,25 @@ class MultiPlotWindows(tk.Toplevel):
         smallest eig : second smallest eig : absolute errors in ss : sum squared errors in ss
         """
         voltages = self.voltages
+        results = self.results
         # make predictor variables
-        largest_element = []
-        smallest_element = []
-        element_difference = []
-        ratio_of_elements = []
-        condition_number = []
+        largest_element = results.largest_element
+        smallest_element = results.smallest_element
+        element_difference = largest_element - smallest_element
+        ratio_of_elements = largest_element / smallest_element
+        condition_number = results.condition_number
 
         # make variables of how well the calculation was performed
-        smallest_eig = []
-        second_smallest_eig = []
-        sae = []
-        sse = []
+        smallest_eig = results.smallest_eig
+        second_smallest_eig = results.second_smallest_eig
+        sae = results.sae_residues
+        sse = results.sse_residues
 
         transport_errors = dict()
-        current_errors = []
-
+        current_errors = results.current_errors()
         for solute in self.solutes:
-
-            # self.transport[solute] = []
-            transport_errors[solute] = []
-
-        for result in self.results:
-            largest_element.append(result.matrix_spec.largest_element)
-            smallest_element.append(result.matrix_spec.smallest_element)
-            element_difference.append(largest_element[-1]-smallest_element[-1])
-            ratio_of_elements.append(largest_element[-1]/smallest_element[-1])
-            condition_number.append(result.matrix_spec.condition_number)
-
-            smallest_eig.append(result.fitting.smallest_eig)
-            second_smallest_eig.append(result.fitting.second_smallest_eig)
-            sae.append(result.fitting.sae_residues)
-            sse.append(result.fitting.sse_residues)
-
-            current_errors.append(max(result.current)-min(result.current))
-
-            for solute in self.solutes:
-                # get errors calculated for the ions transported over the different barriers
-                transport_errors[solute].append(max(result.ion_transport[solute])
-                                                -min(result.ion_transport[solute]))
+            # get errors calculated for the ions transported over the different barriers
+            transport_errors[solute] = results.transport_errors(solute)
 
         if not filename:  # get filename from user and open file
             filename = asksaveasfilename(defaultextension=".csv")
@@ -279,7 +249,7 @@ class MultiPlotWindows(tk.Toplevel):
             writer.writerow(header_row)
             # make column headers with details of the columns
             _row = ['voltage']
-            len_results = len(self.results[0].current)
+            len_results = self.results.current.shape[1]
             for i in range(len_results):
                 _row.append('current, barrier %d' % i)
             for solute in self.solutes:
@@ -288,11 +258,12 @@ class MultiPlotWindows(tk.Toplevel):
             writer.writerow(_row)
 
             # write the results for each variable and write the row
-            for result in self.results:
-                _row = [result.voltage]
-                _row.extend(result.current)
-                for solute in self.solutes:
-                    _row.extend(result.ion_transport[solute])
+            solute_transport = [self.results.solute_transport(solute) for solute in self.solutes]
+            for i, voltage in enumerate(self.results.voltage):
+                _row = [voltage]
+                _row.extend(self.results.current[i])
+                for transport in solute_transport:
+                    _row.extend(transport[i])
                 writer.writerow(_row)
         # file automatically closes with with statement
 
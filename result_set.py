@@ -0,0 +1,383 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Struct of arrays to save the results of a voltage sweep, each field of the np_func and
+mp_func Results, MatrixSpecs and FittingMetrics classes is one numpy array indexed by voltage.
+Indexing or iterating over a ResultSet gives ResultRow views with the same attributes as
+Results so code written for lists of Results still works.  The sweeps of the models make
+empty ResultSets with sweep_results and write each voltage into its row
+"""
+import numpy as np
+
+__author__ = 'Kyle Vitautas Lopin'
+
+# columns with one value for each voltage
+SCALAR_COLUMNS = ('voltage', 'largest_element', 'smallest_element', 'condition_number',
+                  'smallest_eig', 'second_smallest_eig', 'sae_residues', 'sse_residues')
+# all the columns of a ResultSet, current is (voltages x barriers), transport is
+# (voltages x solutes x barriers) and steady_state is (voltages x states)
+COLUMNS = SCALAR_COLUMNS + ('current', 'transport', 'steady_state', 'precision', 'method')
+# longest name of a steady state method saved in the method column
+METHOD_LENGTH = 16
+
+
+class ResultSet(object):
+    """
+    Results of a voltage sweep with every field saved as a float64 array indexed by voltage,
+    mpmath values are saved as float64 and the values that were not calculated are nan
+
+    Public attributes:
+    ::solutes: list of the solutes in the order of the second axis of transport
+    ::voltage, largest_element, smallest_element, condition_number, smallest_eig,
+    second_smallest_eig, sae_residues, sse_residues: arrays of shape (number of voltages)
+    ::current: array of the current over each barrier, shape (voltages, barriers)
+    ::transport: array of the transport of each solute over each barrier,
+    shape (voltages, solutes, barriers)
+    ::steady_state: array of the steady states, shape (voltages, states)
+    ::precision: int array of the mp.dps each result was calculated with, 0 for numpy
+    ::method: string array of the method each steady state was found with, '' if not known
+    """
+    def __init__(self, solutes, voltage, current, transport, steady_state, **columns):
+        """
+        :param solutes: list of the solutes in the order of the transport array
+        :param voltage: array of voltages
+        :param current: array of the currents, (voltages x barriers)
+        :param transport: array of the transport, (voltages x solutes x barriers)
+        :param steady_state: array of the steady states, (voltages x states)
+        :param columns: the other columns of COLUMNS, columns that are not given are nan
+        (or 0 for precision and '' for method)
+        """
+        self.solutes = list(solutes)
+        self.voltage = voltage
+        self.current = current
+        self.transport = transport
+        self.steady_state = steady_state
+        for column in SCALAR_COLUMNS[1:]:
+            setattr(self, column, columns.pop(column, np.full(len(voltage), np.nan)))
+        self.precision = columns.pop('precision', np.zeros(len(voltage), dtype=np.int32))
+        self.method = columns.pop('method', np.zeros(len(voltage), dtype=method_dtype()))
+        if columns:
+            raise TypeError("unknown columns: {0}".format(', '.join(columns)))
+
+    @classmethod
+    def empty(cls, solutes, num_voltages, num_barriers, num_states):
+        """
+        Make a ResultSet with every value nan to be filled one voltage at a time with
+        ResultRow.set_result, so a sweep does not make any objects for each voltage
+        :param solutes: list of the solutes in the order of the transport array
+        :param num_voltages: number of voltages of the sweep
+        :param num_barriers: number of energy barriers of the model
+        :param num_states: number of states of the model
+        :return: ResultSet
+        """
+        return cls(solutes, np.full(num_voltages, np.nan),
+                   np.full((num_voltages, num_barriers), np.nan),
+                   np.full((num_voltages, len(solutes), num_barriers), np.nan),
+                   np.full((num_voltages, num_states), np.nan))
+
+    @classmethod
+    def concatenate(cls, result_sets):
+        """
+        Join the result sets of consecutive parts of a sweep
+        :param result_sets: list of ResultSets with the same solutes, in voltage order
+        :return: ResultSet
+        """
+        columns = dict((column, np.concatenate([getattr(_set, column) for _set in result_sets]))
+                       for column in COLUMNS)
+        return cls(result_sets[0].solutes, **columns)
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Make a ResultSet from a list of results, a ResultSet is returned as it is
+        :param results: list of np_func.Results or mp_func.Results (or ResultRows)
+        :return: ResultSet
+        """
+        if isinstance(results, cls):
+            return results
+        solutes = sorted(results[0].ion_transport)
+        columns = dict((column, []) for column in COLUMNS)
+        for result in results:
+            columns['voltage'].append(result.voltage)
+            columns['largest_element'].append(optional_float(
+                result.matrix_spec.largest_element))
+            columns['smallest_element'].append(optional_float(
+                result.matrix_spec.smallest_element))
+            columns['condition_number'].append(optional_float(
+                result.matrix_spec.condition_number))
+            columns['smallest_eig'].append(optional_float(result.fitting.smallest_eig))
+            columns['second_smallest_eig'].append(optional_float(
+                result.fitting.second_smallest_eig))
+            columns['sae_residues'].append(optional_float(result.fitting.sae_residues))
+            columns['sse_residues'].append(optional_float(result.fitting.sse_residues))
+            columns['current'].append(float_list(result.current))
+            columns['transport'].append([float_list(result.ion_transport[solute])
+                                         for solute in solutes])
+            columns['steady_state'].append(float_list(result.steady_state))
+            columns['precision'].append(getattr(result, 'precision', None) or 0)
+            columns['method'].append(getattr(result, 'method', None) or '')
+        methods = np.array(columns.pop('method'), dtype=method_dtype())
+        arrays = dict((column, np.array(values, dtype=float))
+                      for column, values in columns.items())
+        arrays['precision'] = arrays['precision'].astype(np.int32)
+        arrays['method'] = methods
+        return cls(solutes, **arrays)
+
+    def columns(self):
+        """
+        Get the arrays of the result set
+        :return: dict of the column names in COLUMNS to their arrays
+        """
+        return dict((column, getattr(self, column)) for column in COLUMNS)
+
+    def solute_transport(self, solute):
+        """
+        Get the transport of a solute
+        :param solute: string of the solute
+        :return: array of the transport over each barrier, (voltages x barriers)
+        """
+        return self.transport[:, self.solutes.index(solute)]
+
+    def transport_errors(self, solute):
+        """
+        Calculate the difference between the largest and smallest transport of a solute over
+        the different barriers, see np_func.FittingMetrics.set_transport_errors
+        :param solute: string of the solute
+        :return: array of the errors at each voltage
+        """
+        return np.ptp(self.solute_transport(solute), axis=1)
+
+    def current_errors(self):
+        """
+        Calculate the difference between the largest and smallest current over the barriers
+        :return: array of the errors at each voltage
+        """
+        return np.ptp(self.current, axis=1)
+
+    def __len__(self):
+        return len(self.voltage)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # slices of the arrays are views so no data is copied
+            columns = dict((column, array[index]) for column, array in self.columns().items())
+            return ResultSet(self.solutes, **columns)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("result set index out of range")
+        return ResultRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ResultRow(self, index)
+
+
+def _row_column(column):
+    """
+    Make a property of ResultRow that reads one element of a scalar column of its ResultSet
+    :param column: name of the column
+    :return: property
+    """
+    return property(lambda row: getattr(row.result_set, column)[row.index],
+                    doc="{0} of the result".format(column))
+
+
+class ResultRow(object):
+    """
+    View of the results at one voltage of a ResultSet, has the attributes of np_func.Results
+    and its MatrixSpecs and FittingMetrics, the matrix_spec and fitting attributes are
+    the row itself.  Only the result set and index are saved so making a row is cheap
+    """
+    __slots__ = ('result_set', 'index')
+
+    def __init__(self, result_set, index):
+        self.result_set = result_set
+        self.index = index
+
+    def set_result(self, voltage, matrix_specs, solute_transport, test_values, sae_residues,
+                   sse_residues, current, steady_state, precision=None, method=None):
+        """
+        Write the results of one voltage into the arrays of the result set, takes the
+        values np_func.solve_eyring_rate_model_ss would save in a Results
+        :param voltage: voltage of the result
+        :param matrix_specs: np_func.MatrixSpecs or mp_func.MatrixSpecs of the matrix
+        :param solute_transport: dict of the transport of each solute over each barrier
+        :param test_values: tuple of the second smallest and smallest eigenvalues (or the
+        values the method gives in their place)
+        :param sae_residues: sum of the absolute residues
+        :param sse_residues: square root of the sum of the squared residues
+        :param current: list of the current over each barrier
+        :param steady_state: numpy matrix or mpmath matrix of the steady state
+        :param precision: mp.dps the result was calculated with, None for numpy
+        :param method: string of the method the steady state was found with
+        """
+        result_set, index = self.result_set, self.index
+        result_set.voltage[index] = voltage
+        result_set.largest_element[index] = optional_float(matrix_specs.largest_element)
+        result_set.smallest_element[index] = optional_float(matrix_specs.smallest_element)
+        result_set.condition_number[index] = optional_float(matrix_specs.condition_number)
+        result_set.smallest_eig[index] = optional_float(test_values[1])
+        result_set.second_smallest_eig[index] = optional_float(test_values[0])
+        result_set.sae_residues[index] = optional_float(sae_residues)
+        result_set.sse_residues[index] = optional_float(sse_residues)
+        result_set.current[index] = float_array(current)
+        for i, solute in enumerate(result_set.solutes):
+            result_set.transport[index, i] = float_array(solute_transport[solute])
+        result_set.steady_state[index] = float_array(steady_state)
+        result_set.precision[index] = precision or 0
+        result_set.method[index] = method or ''
+
+    voltage = _row_column('voltage')
+    largest_element = _row_column('largest_element')
+    smallest_element = _row_column('smallest_element')
+    condition_number = _row_column('condition_number')
+    smallest_eig = _row_column('smallest_eig')
+    second_smallest_eig = _row_column('second_smallest_eig')
+    sae_residues = _row_column('sae_residues')
+    sse_residues = _row_column('sse_residues')
+
+    @property
+    def matrix_spec(self):
+        return self
+
+    @property
+    def fitting(self):
+        return self
+
+    @property
+    def element_different(self):
+        return self.largest_element - self.smallest_element
+
+    @property
+    def precision(self):
+        """ mp.dps the result was calculated with, None for numpy """
+        return int(self.result_set.precision[self.index]) or None
+
+    @property
+    def method(self):
+        """ method the steady state was found with, None if not known """
+        return str(self.result_set.method[self.index]) or None
+
+    @property
+    def current(self):
+        return self.result_set.current[self.index].tolist()
+
+    @property
+    def ion_transport(self):
+        transport = self.result_set.transport[self.index]
+        return dict((solute, transport[i].tolist())
+                    for i, solute in enumerate(self.result_set.solutes))
+
+    @property
+    def transport_errors(self):
+        transport = self.result_set.transport[self.index]
+        return dict((solute, np.ptp(transport[i]))
+                    for i, solute in enumerate(self.result_set.solutes))
+
+    @property
+    def steady_state(self):
+        """ steady state as a numpy column matrix, the same as np_func.Results """
+        return np.matrix(self.result_set.steady_state[self.index]).T
+
+
+def method_dtype():
+    """
+    Get the numpy dtype of the method column, byte strings so the column can be saved and
+    memory mapped by results_store
+    :return: numpy dtype
+    """
+    return np.dtype('S{0}'.format(METHOD_LENGTH))
+
+
+def sweep_results(model, num_voltages, method):
+    """
+    Make the empty result sets a sweep of a model writes its results into
+    :param model: script made by template_maker or compiled_model.CompiledEyringModel,
+    its ions and states give the shapes of the arrays
+    :param num_voltages: number of voltages of the sweep
+    :param method: method the steady states are found with
+    :return: ResultSet, or a tuple of the ResultSets of the eig, svd and qr methods if method
+    is 'all'
+    """
+    shape = (sorted(model.ions), num_voltages, len(model.states[0]) + 1, len(model.states))
+    if method == 'all':
+        return tuple(ResultSet.empty(*shape) for _ in range(3))
+    return ResultSet.empty(*shape)
+
+
+def sweep_row(results, index):
+    """
+    Get the row of the results made by sweep_results to write one voltage into
+    :param results: ResultSet or tuple of ResultSets
+    :param index: index of the voltage
+    :return: ResultRow, or tuple of ResultRows if results is a tuple
+    """
+    if isinstance(results, tuple):
+        return tuple(ResultRow(_set, index) for _set in results)
+    return ResultRow(results, index)
+
+
+def sweep_slice(results, start, stop):
+    """
+    Get a part of the results made by sweep_results, the arrays are views so writing into
+    the part fills the whole results
+    :param results: ResultSet or tuple of ResultSets
+    :return: ResultSet, or tuple of ResultSets if results is a tuple
+    """
+    if isinstance(results, tuple):
+        return tuple(_set[start:stop] for _set in results)
+    return results[start:stop]
+
+
+def concatenate_sweeps(chunk_results):
+    """
+    Join the results of consecutive parts of a sweep
+    :param chunk_results: list of ResultSets or of tuples of ResultSets, in voltage order
+    :return: ResultSet, or tuple of ResultSets by eig, svd and qr
+    """
+    if isinstance(chunk_results[0], tuple):
+        return tuple(ResultSet.concatenate(list(method_sets))
+                     for method_sets in zip(*chunk_results))
+    return ResultSet.concatenate(chunk_results)
+
+
+def float_array(values):
+    """
+    Convert a numpy array or matrix, list or mpmath matrix into a flat array or list of the
+    real parts, numpy values are converted without looping over them
+    :param values: array, list or matrix of numbers
+    :return: numpy array or list of floats
+    """
+    if isinstance(values, np.ndarray):
+        return np.real(np.asarray(values)).ravel()
+    return float_list(values)
+
+
+def float_list(values):
+    """
+    Convert a list, numpy matrix or mpmath matrix of real or complex numbers into a flat list
+    of floats of their real parts
+    :param values: list or matrix of numbers
+    :return: list of floats
+    """
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    floats = []
+    for value in values:
+        if isinstance(value, list):
+            floats.extend(float_list(value))
+        else:
+            floats.append(complex(value).real)
+    return floats
+
+
+def optional_float(value):
+    """
+    Convert a number into a float, None is saved as nan
+    :param value: number or None
+    :return: float
+    """
+    if value is None:
+        return np.nan
+    return complex(value).real
@@ -0,0 +1,88 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Functions to use the results of eyring_rate_stream as they are solved, so a sweep can be
+plotted or written to file while it runs with only the current chunk kept in memory
+"""
+# standard libraries
+import csv
+
+__author__ = 'Kyle Vitautas Lopin'
+
+
+def chunked(results, chunk_size):
+    """
+    Group a stream of results into lists
+    :param results: iterable of results
+    :param chunk_size: number of results in each list, the last list can be shorter,
+    if None or 0 the stream is returned as it is
+    :return: iterator of lists of results
+    """
+    if not chunk_size:
+        return results
+    return _chunks(results, chunk_size)
+
+
+def _chunks(results, chunk_size):
+    chunk = []
+    for result in results:
+        chunk.append(result)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class CSVResultWriter(object):
+    """
+    Write results to a comma separated values file one row at a time, the columns are
+    the same as MultiPlotWindows.save_custom_data2:
+    voltage, current over each barrier, transport of each solute over each barrier
+    """
+    def __init__(self, csvfile, solutes, header_row=None):
+        """
+        :param csvfile: file opened for writing
+        :param solutes: list of the solutes to write the transport of
+        :param header_row: list of simulation details to write as the first line
+        """
+        self.csvfile = csvfile
+        self.writer = csv.writer(csvfile, dialect='excel')  # write file as excel dialect
+        self.solutes = solutes
+        self.num_barriers = None  # the column labels are made from the first result
+        if header_row:
+            self.writer.writerow(header_row)
+
+    def write(self, result):
+        """
+        Write the row of one result, the column labels are written before the first row
+        :param result: np_func.Results, mp_func.Results or result_set.ResultRow
+        """
+        if self.num_barriers is None:
+            self.num_barriers = len(result.current)
+            _row = ['voltage']
+            for i in range(self.num_barriers):
+                _row.append('current, barrier %d' % i)
+            for solute in self.solutes:
+                for i in range(self.num_barriers):
+                    _row.append('%s transport over barrier %d' % (solute, i))
+            self.writer.writerow(_row)
+        _row = [result.voltage]
+        _row.extend(result.current)
+        for solute in self.solutes:
+            _row.extend(result.ion_transport[solute])
+        self.writer.writerow(_row)
+
+    def write_stream(self, results):
+        """
+        Write each result as it is solved, the file is flushed after every row so the rows
+        can be read while the sweep is running
+        :param results: iterable of results, e.g. made by eyring_rate_stream
+        :return: number of rows written
+        """
+        num_rows = 0
+        for result in results:
+            self.write(result)
+            self.csvfile.flush()
+            num_rows += 1
+        return num_rows
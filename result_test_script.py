@@ -1,48 +1,30 @@
-import shelve
 import matplotlib.pyplot as plt
+import results_store
 
 __author__ = 'Kyle Vitautas Lopin'
 
-result_shelf = shelve.open("Results1")
+# open only the eig curve, the arrays are memory mapped so nothing else is read
+store = results_store.ResultsStore("Results1")
+print store.names()
+curve_eig = store.load("eig")
 
-results_eig = result_shelf["results eig"]
-results_svd = result_shelf["results svd"]
-result_shelf.close()
-
-states = []
+voltages = curve_eig.voltage
+# steady_state is (voltages x states), each column is the population of a state
+steady_states = curve_eig.steady_state
 labels = []
-for i in range(9):
-    states.append([])
+for i in range(steady_states.shape[1]):
     labels.append("line " + str(i))
 
-print dir(results_eig[0])
-print results_eig[0]
-i2 = 0
-
-for result in results_eig:
-    # print result.voltage
-    # print result.steady_state[5], result.steady_state[8]
-    # print 'i2: ', i2, result.voltage
-    i2 += 1
-    # print result.steady_state
-    for i, state in enumerate(result.steady_state):
-
-        states[i].append(state)
-# print states
+print curve_eig.solutes
+print steady_states[0]
 
-# Na_transport_figure = plt.figure()
-# Na_transport_axis = Na_transport_figure.add_subplot(111)
-# Na_transport_axis.plot(voltages, Na_transport0, voltages, Na_transport1, voltages, Na_transport2)
-voltages = range(-150, 100, 10)
 state_fig = plt.figure()
 state_axis = state_fig.add_subplot(111)
-#state_axis.plot(voltages, states[0])
-for state in states:
-    state_axis.plot(voltages, state)
-    print state
+for i in range(steady_states.shape[1]):
+    state_axis.plot(voltages, steady_states[:, i])
+    print steady_states[:, i]
 
 
 state_axis.legend(labels)
 state_axis.set_yscale('log')
 plt.show()
-# plt.legend(handles=range(0, 9))
\ No newline at end of file
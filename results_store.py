@@ -0,0 +1,105 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Store lists of results as columns of typed numpy arrays instead of pickling the Results
+objects.  Each curve (list of results of a voltage sweep) is saved as a folder of .npy files,
+so one curve of a large store can be opened with memory mapping without reading or
+unpickling anything else
+"""
+# standard libraries
+import json
+import os
+import shutil
+
+import numpy as np
+
+# local files
+import result_set
+
+__author__ = 'Kyle Vitautas Lopin'
+
+# name of the file with the order of the solutes in the transport array of a curve
+SOLUTES_FILE = 'solutes.json'
+
+
+class ResultsStore(object):
+    """
+    A folder of curves, each curve is a folder with a .npy file of each column of a
+    result_set.ResultSet and the solutes of the transport array in SOLUTES_FILE
+    """
+    def __init__(self, directory):
+        """
+        :param directory: folder to save the curves in, it is made if it does not exist
+        """
+        self.directory = directory
+
+    def names(self):
+        """
+        Get the names of the curves saved in the store
+        :return: sorted list of strings
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        # folders starting with '.' are curves that are being written or replaced by save
+        return sorted(name for name in os.listdir(self.directory)
+                      if not name.startswith('.') and
+                      os.path.isfile(os.path.join(self.directory, name, SOLUTES_FILE)))
+
+    def save(self, name, results):
+        """
+        Save a list of results as a curve, a curve with the same name is replaced
+        :param name: name of the curve, used as the name of its folder
+        :param results: result_set.ResultSet or list of np_func.Results or mp_func.Results
+        of a voltage sweep
+        """
+        results = result_set.ResultSet.from_results(results)
+        folder = os.path.join(self.directory, name)
+        # the curve is written in a temporary folder that is renamed into place when it is
+        # complete, so a curve never has the columns of two different saves
+        temp_folder = os.path.join(self.directory, '.{0}.{1}.tmp'.format(name, os.getpid()))
+        if os.path.isdir(temp_folder):
+            shutil.rmtree(temp_folder)  # left by a save that did not finish
+        os.makedirs(temp_folder)
+        for column, array in results.columns().items():
+            np.save(os.path.join(temp_folder, column + '.npy'), array)
+        with open(os.path.join(temp_folder, SOLUTES_FILE), 'w') as _file:
+            json.dump(results.solutes, _file)
+        if os.path.isdir(folder):
+            # a folder can not be renamed onto another folder, move the old curve aside first
+            old_folder = os.path.join(self.directory, '.{0}.{1}.old'.format(name, os.getpid()))
+            os.rename(folder, old_folder)
+            os.rename(temp_folder, folder)
+            shutil.rmtree(old_folder)
+        else:
+            os.rename(temp_folder, folder)
+
+    def save_all(self, name, results):
+        """
+        Save the results of eyring_rate_algo, if the method was 'all' each of the eig, svd
+        and qr lists is saved as its own curve with '_eig', '_svd' or '_qr' added to the name
+        :param name: name of the curve
+        :param results: list of results, or tuple of the lists of results by eig, svd and qr
+        """
+        if isinstance(results, tuple):
+            for method, method_results in zip(['eig', 'svd', 'qr'], results):
+                self.save(name + '_' + method, method_results)
+        else:
+            self.save(name, results)
+
+    def load(self, name, mmap_mode='r'):
+        """
+        Open a curve, the arrays are memory mapped so only the parts used are read from disk
+        :param name: name of the curve
+        :param mmap_mode: mmap_mode of numpy.load, None reads the arrays into memory
+        :return: result_set.ResultSet with the arrays of the curve
+        """
+        folder = os.path.join(self.directory, name)
+        with open(os.path.join(folder, SOLUTES_FILE), 'r') as _file:
+            solutes = [str(solute) for solute in json.load(_file)]
+        columns = dict()
+        for column in result_set.COLUMNS:
+            filename = os.path.join(folder, column + '.npy')
+            # curves saved before a column was added do not have its file
+            if os.path.isfile(filename):
+                columns[column] = np.load(filename, mmap_mode=mmap_mode)
+        return result_set.ResultSet(solutes, **columns)
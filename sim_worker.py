@@ -0,0 +1,78 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Thread to solve an Eyring rate model away from the tkinter event loop, the results are
+passed back to the GUI with a queue that the GUI polls with after()
+"""
+# standard libraries
+import Queue
+import threading
+
+__author__ = 'Kyle Vitautas Lopin'
+
+# the messages put on the queue are tuples of one of these and a value:
+# PROGRESS with the number of voltages solved, DONE with the list of results,
+# CANCELLED with None and ERROR with the exception raised
+PROGRESS = 'progress'
+DONE = 'done'
+CANCELLED = 'cancelled'
+ERROR = 'error'
+
+
+class SimulationWorker(threading.Thread):
+    """
+    Solve a model at each voltage with its eyring_rate_stream function in a daemon thread.
+    The thread only talks to the GUI through the messages queue, tkinter widgets must only
+    be used from the thread running the event loop
+    """
+    def __init__(self, model, voltages, concentrations, barriers, Qs, Rs, mp_dps, method):
+        """
+        :param model: eyring rate script or compiled_model.CompiledEyringModel to solve
+        :param voltages: list of voltages to solve the model at
+        :param concentrations: dict of the concentrations, keys are the solutes + 'i' or 'e'
+        :param barriers: dict of the energy barriers and electrical distances
+        :param Qs: list of Q values
+        :param Rs: list of R values
+        :param mp_dps: precision to use with mpmath, or a list of increasing precisions,
+        see mp_func.eyring_rate_algo_adaptive
+        :param method: method to find the steady states with, see the helper modules
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True  # do not keep the program open if the window is closed
+        self.model = model
+        self.args = (voltages, concentrations, barriers, Qs, Rs, mp_dps, method)
+        self.messages = Queue.Queue()
+        self._cancel_event = threading.Event()
+
+    def run(self):
+        results = []
+        try:
+            for result in self.model.eyring_rate_stream(*self.args):
+                results.append(result)
+                # a voltage can not be stopped while it is being solved so check between them
+                if self._cancel_event.is_set():
+                    self.messages.put((CANCELLED, None))
+                    return
+                self.messages.put((PROGRESS, len(results)))
+        except Exception as error:
+            self.messages.put((ERROR, error))
+            return
+        self.messages.put((DONE, results))
+
+    def cancel(self):
+        """
+        Stop the simulation after the voltage being solved is finished
+        """
+        self._cancel_event.set()
+
+    def get_messages(self):
+        """
+        Get all the messages put on the queue since the last call, does not block
+        :return: list of (message type, value) tuples
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except Queue.Empty:
+                return messages
@@ -3,11 +3,34 @@
 """ Classes and methods to use to make an Eyring Rate Model
 """
 
+# standard libraries
+from collections import deque
+
+import numpy as np
+
+# local files
+import radix_states
+
 __author__ = 'Kyle Vitautas Lopin'
 
 POWER_SYMBOL = '**'
 
 
+def q_factors_str(q_factors):
+    """
+    Make a string of the pre exponential Q or R values a rate is multiplied by
+    :param q_factors: list of (Q or R name, power) tuples
+    :return: string to put in front of the rate, ie. 'Q * R**2 * '
+    """
+    _str = ""
+    for name, power in q_factors:
+        if power == 1:
+            _str += name + " * "
+        else:
+            _str += name + POWER_SYMBOL + str(power) + " * "
+    return _str
+
+
 class QClass(object):
     """
     Make a class to represent an ion in a position in the channel with a charge
@@ -40,21 +63,28 @@ class TransportClass(object):
           {'Ca': [('k_0_1_Ca', 2), ('k_0_1_Ca', 4)]}
         """
         self.list = []
+        # same structure as self.list but saves the Q values of the rate instead of its string,
+        # ie. [ {'Na': [([('Q', 1)], 1), ([], 3)]} ]
+        self.factors = []
         for barrier_number in range(1, number_of_barriers+1):
             self.list.append(dict())
+            self.factors.append(dict())
             for ion in ions:
                 self.list[barrier_number-1][ion] = []
+                self.factors[barrier_number-1][ion] = []
 
-    def update(self, barrier, ion, rate_str, state_index):
+    def update(self, barrier, ion, rate_str, state_index, q_factors=()):
         """
         add a new rate to the class
         :param barrier: barrier the rate is for
         :param ion: ion the rate is for
         :param rate_str: rate string
         :param state_index: which state the rate is for, indexed to state vector
+        :param q_factors: list of (Q or R name, power) tuples the rate is multiplied by
         :return:
         """
         self.list[barrier-1][ion].append((rate_str, state_index))
+        self.factors[barrier-1][ion].append((q_factors, state_index))
 
     def display(self):
         """
@@ -89,7 +119,8 @@ class EryingRateModelMaker(object):
     Class to create a transition matrix to describe an Erying Rate model with an
     arbitrary amount of binding sites and solutes that may bind at the sites
     """
-    def __init__(self, num_binding_sites, list_ions, ion_charges, q_type=None):
+    def __init__(self, num_binding_sites, list_ions, ion_charges, q_type=None,
+                 enumeration=None, bfs_order=True):
         """
         Take an arbitrary number and a list of solutes that can interact with the channel and create
         a transition matrix of the different states and rates that can occur
@@ -101,7 +132,12 @@ class EryingRateModelMaker(object):
         'single QR' puts a Q or a R when 2 ions are adjacent (Q) or moving to be adjacent
         'full Q' puts a Q for each ion-ion interaction
         'full QR' puts Q's and Rs for each ion-ion interact
-        :return: makes a matrix bound to self that represents the transition matrix of the form
+        :param enumeration: how to find the states of the model, None searches the states one
+        transition at a time, 'mixed radix' makes all the states at once and finds the transitions
+        with integer arithmetic, see radix_states.MixedRadixStates
+        :param bfs_order: only used with 'mixed radix', True puts the states in the same order
+        the search finds them, False leaves them in the order of their mixed radix codes
+        :return: makes the (row, column, rate) triplets of a transition matrix of the form
         X' = A*X, where X is a vector of possible channel configurations and A is matrix
         that describes how the channel configurations change
         also make a vector (channel_configs) that represents the different configurations
@@ -113,22 +149,36 @@ class EryingRateModelMaker(object):
         self.ion_charges = ion_charges
         self.q_type = q_type
         self.q_str = ""
-        self.q_global_list = []
+        self.q_sources = dict()
         if q_type:
             self._make_Q_assignment()
         self.channel_configs = [[0] * num_binding_sites]
-        self.new_channel_configs = self.channel_configs[:]  # prevent aliasing
-        self.matrix = [['0']]
+        # registry of the states already found, keys are the tuple of a channel configuration
+        # and the values are the index of that configuration in self.channel_configs
+        self.state_registry = {tuple(self.channel_configs[0]): 0}
+        # indexes of the states that still have to be checked for transitions, first in first out
+        self.new_channel_configs = deque([0])
+        # the transition matrix is stored sparsely as (row, column, rate string) triplets of the
+        # off diagonal elements, the diagonal elements are made at the end from the rates
+        # kept for each column
+        self.transitions = []
+        # the name of the rate and Q values of each triplet, for the numerical models
+        self.transition_factors = []
+        self.column_rates = [[]]
+        self.diagonal_rates = []
         # to make the equations for the transport equation
         self.forward_transport = TransportClass(list_ions, num_binding_sites+1)
         self.backward_transport = TransportClass(list_ions, num_binding_sites+1)
+        if enumeration == 'mixed radix':
+            self._enumerate_mixed_radix(bfs_order)
+        elif enumeration:
+            raise ValueError("enumeration should be None or 'mixed radix'")
         # go through all channel configurations and check if they can transition to another state
         while self.new_channel_configs:
-            # get the first config in the new_channel_config list and see if that state can
-            # transition to another state
-            channel_state = self.new_channel_configs.pop(0)
-            # keep track of what the original state is
-            original_state_index = self.channel_configs.index(channel_state)
+            # get the first config in the new_channel_config queue and see if that state can
+            # transition to another state, keep track of what the original state is
+            original_state_index = self.new_channel_configs.popleft()
+            channel_state = self.channel_configs[original_state_index]
             # check if an ion can enter the channel configuration from the extracellular side
             self._check_for_ion_entry(channel_state, original_state_index)
             # check if an ions can move forward in the pore
@@ -140,6 +190,102 @@ class EryingRateModelMaker(object):
         # self.forward_transport.output_rate(1, "Na")
         # self.backward_transport.output_rate(1, "Na")
 
+    def _enumerate_mixed_radix(self, bfs_order):
+        """
+        Make all the channel configurations and transitions at once by encoding each
+        configuration as a mixed radix integer, see radix_states.MixedRadixStates.
+        The transitions are added in the same order the search would add them
+        :param bfs_order: True to put the states in the order the search finds them
+        :return: none, update self.channel_configs, self.state_registry and the transitions
+        """
+        radix = radix_states.MixedRadixStates(self.num_binding_sites, len(self.list_ions))
+        if bfs_order:
+            order = radix.bfs_order()
+        else:
+            order = radix.codes
+        position = radix_states.inverse_permutation(order)
+        self.channel_configs = radix.get_configs(order, self.list_ions)
+        self.state_registry = dict((tuple(config), i)
+                                   for i, config in enumerate(self.channel_configs))
+        self.new_channel_configs = deque()
+        self.column_rates = [[] for _ in range(len(self.channel_configs))]
+
+        # put the neighbours in the order of the states and change the codes into indexes
+        neighbours = radix.neighbours[order]
+        has_neighbour = neighbours >= 0
+        neighbours[has_neighbour] = position[neighbours[has_neighbour]]
+        num_ions = len(self.list_ions)
+        # np.nonzero goes through the rows in order so the transitions are added state by state
+        # in the order of entry, hops and then exit, same as the search
+        state_indexes, columns = has_neighbour.nonzero()
+        new_state_indexes = neighbours[state_indexes, columns]
+        digits = radix.digits[order][state_indexes]
+        # the site the ion moves from (0 is the extracellular side) and the digit of the ion,
+        # the columns after the entries are the hops from each site and then the exit
+        entries = columns < num_ions
+        start_sites = np.where(entries, 0, columns - num_ions + 1)
+        ion_digits = np.where(entries, columns + 1,
+                              digits[np.arange(len(columns)), np.maximum(columns - num_ions, 0)])
+        q_factor_ids, q_factors = self._mixed_radix_q_factors(digits, start_sites, ion_digits)
+
+        ions = [0] + list(self.list_ions)
+        for original_state_index, new_state_index, start_site, ion_digit, q_id in zip(
+                state_indexes.tolist(), new_state_indexes.tolist(), start_sites.tolist(),
+                ion_digits.tolist(), q_factor_ids.tolist()):
+            self._add_rate_pair((start_site, start_site+1), ions[ion_digit], original_state_index,
+                                new_state_index, *q_factors[q_id])
+
+    def _mixed_radix_q_factors(self, digits, start_sites, ion_digits):
+        """
+        Find the Q and R values of every transition at once from the digits of the states
+        they start from.  Which Q or R name an ion in a site adds only depends on the site the
+        moving ion starts from, so the names are found once for each pair of sites with
+        _check_for_Q_values and the powers are the products of the charges
+        :param digits: integer array of the digits of the state each transition starts from,
+        shape (number of transitions, number of binding sites)
+        :param start_sites: integer array of the site each moving ion starts from
+        :param ion_digits: integer array of the digit of each moving ion
+        :return: integer array with the index of the Q values of each transition in the list
+        of the different Q values, each is a tuple of the forward and backward lists of
+        (Q or R name, power) tuples and their strings made by q_factors_str
+        """
+        num_transitions = len(start_sites)
+        if not self.q_type:
+            return np.zeros(num_transitions, dtype=np.intp), [([], [], '', '')]
+        num_sites = self.num_binding_sites
+        # names of the forward and backward Q values an ion in each site adds when an ion
+        # moves from each start site, '' where the ion adds none
+        forward_names = np.zeros((num_sites+1, num_sites), dtype=object)
+        backward_names = np.zeros((num_sites+1, num_sites), dtype=object)
+        for start_site in range(num_sites+1):
+            for site in range(num_sites):
+                config = [0] * num_sites
+                config[site] = self.list_ions[0]
+                q_forward, q_backward = self._check_for_Q_values(config, start_site, 1)
+                forward_names[start_site, site] = q_forward[0][0] if q_forward else ''
+                backward_names[start_site, site] = q_backward[0][0] if q_backward else ''
+        charges = np.array([0] + list(self.ion_charges), dtype=np.int64)
+        powers = charges[digits] * charges[ion_digits][:, np.newaxis]
+        occupied = digits != 0
+        adds_forward = occupied & (forward_names[start_sites] != '')
+        adds_backward = occupied & (backward_names[start_sites] != '')
+        # the Q values of a transition are set by its start site and the powers of the sites
+        # that add one, so only the different combinations are made into lists
+        no_factor = np.iinfo(np.int64).min
+        keys = np.column_stack((start_sites, np.where(adds_forward, powers, no_factor),
+                                np.where(adds_backward, powers, no_factor)))
+        unique_keys, q_factor_ids = np.unique(keys, axis=0, return_inverse=True)
+        q_factors = []
+        for key in unique_keys.tolist():
+            start_site = key[0]
+            q_forward = [(forward_names[start_site, site], power)
+                         for site, power in enumerate(key[1:num_sites+1]) if power != no_factor]
+            q_backward = [(backward_names[start_site, site], power)
+                          for site, power in enumerate(key[num_sites+1:]) if power != no_factor]
+            q_factors.append((q_forward, q_backward,
+                              q_factors_str(q_forward), q_factors_str(q_backward)))
+        return q_factor_ids, q_factors
+
     def _check_for_ion_entry(self, config, original_state_index):
         """
         Check if a channel state can change if an ion can enters it and update
@@ -147,7 +293,7 @@ class EryingRateModelMaker(object):
         :param config: state configuration to test
         :param original_state_index: integer representing the index where _config is in
         self.channel_configs
-        :return: none, update self.channel_configs and self.matrix if possible
+        :return: none, update self.channel_configs and self.transitions if possible
         """
         # check if the channel config is empty in the first binding site
         if config[0] == 0:
@@ -157,13 +303,13 @@ class EryingRateModelMaker(object):
                 _new_config[0] = ion  # add the ion to the existing channel state
                 sites = (0, 1)  # the sites of ion movement are from the extracellular side (0)
                 # to the first binding site (1)
-                if _new_config not in self.channel_configs:
+                new_state_index = self.state_registry.get(tuple(_new_config))
+                if new_state_index is None:
                     # if the state has not been seen before, add the state and rates to the
                     # channel_config and matrix
                     self._add_new_state(_new_config, sites, ion, original_state_index)
                 else:
                     # else if the state has already been added, just update the rate matrix
-                    new_state_index = self.channel_configs.index(_new_config)
                     self._add_rates(sites, ion, original_state_index, new_state_index)
 
     def _check_for_hop(self, config, original_state_index):
@@ -190,7 +336,7 @@ class EryingRateModelMaker(object):
         :param config: state configuration to test
         :param original_state_index: integer representing the index where _config is in
         self.channel_configs
-        :return: none, update self.channel_configs and self.matrix if possible
+        :return: none, update self.channel_configs and self.transitions if possible
         """
         # check if an ion is in the binding site next to the intracelluar side and can move out
         # of the channel
@@ -202,13 +348,13 @@ class EryingRateModelMaker(object):
             sites = (self.num_binding_sites, self.num_binding_sites+1)
             # (indexed as num_binding_sites) to the extracellular side
             # (indexed as num_binding_sites + 1)
-            if _new_config not in self.channel_configs:
+            new_state_index = self.state_registry.get(tuple(_new_config))
+            if new_state_index is None:
                 # if the state has not been seen before, add the state and rates to the
                 # channel_config and matrix
                 self._add_new_state(_new_config, sites, ion, original_state_index)
             else:
                 # else if the state has already been added, just update the rate matrix
-                new_state_index = self.channel_configs.index(_new_config)
                 self._add_rates(sites, ion, original_state_index, new_state_index)
 
     def _add_hop(self, _config, binding_site, original_state_index):
@@ -227,12 +373,12 @@ class EryingRateModelMaker(object):
         _config[binding_site+1] = _config[binding_site]
         _config[binding_site] = 0
         sites = (binding_site+1, binding_site+2)
-        if _config not in self.channel_configs:
+        new_state_index = self.state_registry.get(tuple(_config))
+        if new_state_index is None:
             # the first binding site is labeled as 1, as the extracellular
             # side is 0 so increment the binding_site to reflect this
             self._add_new_state(_config, sites, ion, original_state_index)
         else:  # add the rates in here
-            new_state_index = self.channel_configs.index(_config)
             self._add_rates(sites, ion, original_state_index, new_state_index)
 
     def _add_new_state(self, _config, sites, ion, original_state_index):
@@ -248,16 +394,15 @@ class EryingRateModelMaker(object):
         was derived from
         :return:
         """
+        new_state_index = len(self.channel_configs)
         self.channel_configs.append(_config)  # add the configuration to the list of all configs
-        if _config not in self.new_channel_configs:
-            # add the config to list to check for further transitions
-            self.new_channel_configs.append(_config)
-        for i in range(len(self.matrix)):  # add another column to the transition matrix
-            self.matrix[i].append('0')
-        # add a new row to the bottom of the matrix
-        self.matrix.append(['0'] * (len(self.matrix)+1))
+        self.state_registry[tuple(_config)] = new_state_index
+        # add the config to queue to check for further transitions
+        self.new_channel_configs.append(new_state_index)
+        # add another column to keep the rates that leave the new state
+        self.column_rates.append([])
 
-        self._add_rates(sites, ion, original_state_index, len(self.channel_configs) - 1)
+        self._add_rates(sites, ion, original_state_index, new_state_index)
 
     def _add_rates(self, sites, ion, original_state_index, new_config_state_index):
         """
@@ -269,64 +414,110 @@ class EryingRateModelMaker(object):
         :param original_state_index:  index of the place the state the new state
         :param new_config_state_index: index of the channel configuration that is being
         transitioned to
-        :return:  none, the matrix is updated
+        :return:  none, the transitions are updated
         """
         _config = self.channel_configs[original_state_index]
-        # make a string that contains the pre-exponential Q values
+        # find the pre-exponential Q values
         if self.q_type:
             ion_charge = self.ion_charges[self.list_ions.index(ion)]
-            q_str_forward, q_str_backward = self._check_for_Q_values(_config, sites[0], ion_charge)
+            q_forward, q_backward = self._check_for_Q_values(_config, sites[0], ion_charge)
         else:
-            q_str_forward, q_str_backward = "", ""
-        # make a string to describe the rate for the ion moving to the extracellular side
-        backward_rate_str = q_str_backward+'k_'+str(sites[1])+'_'+str(sites[0])+'_'+ion
+            q_forward, q_backward = [], []
+        self._add_rate_pair(sites, ion, original_state_index, new_config_state_index,
+                            q_forward, q_backward)
 
-        if self.matrix[original_state_index][new_config_state_index] == '0':
-            self.matrix[original_state_index][new_config_state_index] = backward_rate_str
-        else:
-            self.matrix[original_state_index][new_config_state_index] += (' + ' + backward_rate_str)
+    def _add_rate_pair(self, sites, ion, original_state_index, new_config_state_index,
+                       q_forward, q_backward, q_forward_str=None, q_backward_str=None):
+        """
+        Add the rates of an ion moving between 2 states, in both directions, to the
+        transition matrix and transport rates
+        :param sites: tuple of the binding site the ion starts from and moves to
+        :param ion: string with the name of the ion that is moving
+        :param original_state_index: index of the state the ion moves forward from
+        :param new_config_state_index: index of the state the ion moves forward to
+        :param q_forward: list of (Q or R name, power) tuples of the forward rate
+        :param q_backward: list of (Q or R name, power) tuples of the backward rate
+        :param q_forward_str, q_backward_str: strings of q_forward and q_backward made by
+        q_factors_str, they are made if None
+        :return: none, the transitions are updated
+        """
+        if q_forward_str is None:
+            q_forward_str = q_factors_str(q_forward)
+        if q_backward_str is None:
+            q_backward_str = q_factors_str(q_backward)
+        # make a string to describe the rate for the ion moving to the extracellular side
+        backward_rate = 'k_'+str(sites[1])+'_'+str(sites[0])+'_'+ion
+        backward_rate_str = q_backward_str + backward_rate
+        self._add_transition(original_state_index, new_config_state_index, backward_rate_str,
+                             backward_rate, q_backward)
         # update the transport rates
-        self.backward_transport.update(sites[1], ion, backward_rate_str, new_config_state_index)
+        self.backward_transport.update(sites[1], ion, backward_rate_str, new_config_state_index,
+                                       q_backward)
 
         # make a string to describe the rate for the ion moving to the intracellular side
-        forward_rate_str = q_str_forward+'k_'+str(sites[0])+'_'+str(sites[1])+'_'+ion
-        if self.matrix[new_config_state_index][original_state_index] == '0':
-            self.matrix[new_config_state_index][original_state_index] = forward_rate_str
-        else:
-            self.matrix[new_config_state_index][original_state_index] += (' + ' + forward_rate_str)
+        forward_rate = 'k_'+str(sites[0])+'_'+str(sites[1])+'_'+ion
+        forward_rate_str = q_forward_str + forward_rate
+        self._add_transition(new_config_state_index, original_state_index, forward_rate_str,
+                             forward_rate, q_forward)
         # update the transport rates
-        self.forward_transport.update(sites[1], ion, forward_rate_str, original_state_index)
+        self.forward_transport.update(sites[1], ion, forward_rate_str, original_state_index,
+                                      q_forward)
+
+    def _add_transition(self, row, column, rate_str, rate_name, q_factors):
+        """
+        Save a rate as a (row, column, rate string) triplet of the transition matrix and keep
+        the rate with the column it is in so the diagonal element can be made later
+        :param row: index of the state the transition goes to
+        :param column: index of the state the transition comes from
+        :param rate_str: string of the rate of the transition
+        :param rate_name: name of the rate without the Q values, i.e. k_0_1_Na
+        :param q_factors: list of (Q or R name, power) tuples the rate is multiplied by
+        :return: none, update self.transitions, self.transition_factors and self.column_rates
+        """
+        self.transitions.append((row, column, rate_str))
+        self.transition_factors.append((rate_name, q_factors))
+        self.column_rates[column].append((row, rate_str))
 
     def _add_diagonal_rates(self):
         """
-        Add the rates along the diagonal of the transition matrix by summing all numbers in
-        each column and subtracting from the diagonal element
-        :return: none, update self.matrix
-        """
-        # for each element in the column
-        for i in range(len(self.matrix)):
-            # make a list of elements in the column to make the rates with at the end
-            _new_rate_list = []
-            # go through each row in the column
-            for j in range(len(self.matrix[i])):
-                # if there an element there, add it to the list
-                if self.matrix[j][i] != '0':
-                    _new_rate_list.append(self.matrix[j][i])
+        Make the rates along the diagonal of the transition matrix by summing all the rates in
+        each column and subtracting them from the diagonal element
+        :return: none, update self.diagonal_rates
+        """
+        self.diagonal_rates = []
+        for column in self.column_rates:
+            # keep the rates in the order of the rows they are in, the sort is stable so
+            # rates in the same element keep the order they were added in
+            _new_rate_list = [rate for _, rate in sorted(column, key=lambda entry: entry[0])]
             # make a string by subtracting all the elements in the column
-            _new_rate = '-(' + " + ".join(_new_rate_list) + ')'
-            # and add to the diagonal element of that column
-            self.matrix[i][i] = _new_rate
+            self.diagonal_rates.append('-(' + " + ".join(_new_rate_list) + ')')
+
+    def _get_matrix_rows(self):
+        """
+        Put the transition triplets into a list of rows, each row is a dictionary with the
+        column index as keys and the string of the element as values, only the non zero
+        elements are included
+        :return: list of dictionaries
+        """
+        rows = [dict() for _ in range(len(self.channel_configs))]
+        for row, column, rate_str in self.transitions:
+            if column in rows[row]:
+                rows[row][column] += (' + ' + rate_str)
+            else:
+                rows[row][column] = rate_str
+        for i, diagonal_rate in enumerate(self.diagonal_rates):
+            rows[i][i] = diagonal_rate
+        return rows
 
     def _check_for_Q_values(self, _config, site_index, ion_moving_charge):
         """
-        Make a string for the pre exponential Q or R values that account for the increase in
+        Find the pre exponential Q or R values that account for the increase in
         the rate of ion movement due to electrostatic repulsion
         :param _config: configuration of the channel to find the Q values for
         :param site_index: binding site the ion is currently in
-        :return: string that has the q
+        :return: 2 lists, for the forward and backward rate, of (Q or R name, power) tuples,
+        use q_factors_str to make them into a string
         """
-        return_str_forward = ""  # initialize string to save Q or R values to
-        return_str_backward = ""
         forward_rate = []
         backward_rate = []
         # make list of ions that are in sites towards the extracellular side of the current ion
@@ -346,51 +537,37 @@ class EryingRateModelMaker(object):
                 _charge = self.ion_charges[ion_charge_list_index]
                 right_ions.append(QClass(_charge, right_site_index))
         for left_ion in left_ions:
-            if left_ion.charge*ion_moving_charge == 1:
-                power_str = ""
-            else:
-                power_str = POWER_SYMBOL + str(left_ion.charge * ion_moving_charge)
+            power = left_ion.charge * ion_moving_charge
             if 'full Q' in self.q_type:
-                forward_rate.append('Q'
-                                    + str(left_ion.place)
-                                    + str(site_index)
-                                    + power_str)
+                forward_rate.append(('Q'
+                                     + str(left_ion.place)
+                                     + str(site_index), power))
             elif 'single Q' in self.q_type and int(left_ion.place)+1 == site_index:
-                forward_rate.append('Q' + power_str)
+                forward_rate.append(('Q', power))
 
             if  self.q_type == 'full QR':
-                backward_rate.append('R'
-                                     + str(left_ion.place)
-                                     + str(site_index+1)
-                                     + power_str)
+                backward_rate.append(('R'
+                                      + str(left_ion.place)
+                                      + str(site_index+1), power))
             elif self.q_type == 'single QR' and int(left_ion.place)+2 == site_index:
-                backward_rate.append('R' + power_str)
+                backward_rate.append(('R', power))
         for right_ion in right_ions:
-            if right_ion.charge*ion_moving_charge == 1:
-                power_str = ""
-            else:
-                power_str = POWER_SYMBOL + str(right_ion.charge * ion_moving_charge)
+            power = right_ion.charge * ion_moving_charge
             if self.q_type == 'full QR':
-                forward_rate.append('R'
-                                    + str(site_index)
-                                    + str(right_ion.place)
-                                    + power_str)
+                forward_rate.append(('R'
+                                     + str(site_index)
+                                     + str(right_ion.place), power))
             elif 'single QR' in self.q_type and int(right_ion.place)-1 == site_index:
-                forward_rate.append('R' + power_str)
+                forward_rate.append(('R', power))
 
             if 'full Q' in self.q_type:
-                backward_rate.append('Q'
-                                     + str(site_index+1)
-                                     + str(right_ion.place)
-                                     + power_str)
+                backward_rate.append(('Q'
+                                      + str(site_index+1)
+                                      + str(right_ion.place), power))
             elif 'single Q' in self.q_type and int(right_ion.place)-2 == site_index:
-                backward_rate.append('Q' + power_str)
+                backward_rate.append(('Q', power))
 
-        if forward_rate:
-            return_str_forward += " * ".join(forward_rate) + " * "
-        if backward_rate:
-            return_str_backward += " * ".join(backward_rate) + " * "
-        return return_str_forward, return_str_backward
+        return forward_rate, backward_rate
 
     def _make_Q_assignment(self):
         """
@@ -398,7 +575,9 @@ class EryingRateModelMaker(object):
         :return: bind to self and get with the get_q_str method
         """
         _str = ""
-        q_global_list = []  # make list of Qs to put in global call
+        # for the numerical models, keys are the Q or R names and the values are tuples of the
+        # argument ('Qs' or 'Rs') and index the value is taken from
+        q_sources = dict()
         q_list_index = 0
         r_list_index = 0
         if 'full' in self.q_type:
@@ -407,28 +586,30 @@ class EryingRateModelMaker(object):
                 for i in range(1, num):
                     for j in range(i+1, num+1):
                         _q_str = 'Q' + str(i) + str(j)
-                        q_global_list.append(_q_str)
                         _str += '    ' + _q_str + " = Qs[" + str(q_list_index) + ']\n'
+                        q_sources[_q_str] = ('Qs', q_list_index)
                         q_list_index += 1
             if 'R' in self.q_type:  # full R values should be added
                 for i in range(num-1):
                     for j in range(i+2, num+1):
                         _r_str = 'R' + str(i) + str(j)
-                        q_global_list.append(_r_str)
                         _str += '    ' + _r_str + " = Rs[" + str(r_list_index) + ']\n'
+                        q_sources[_r_str] = ('Rs', r_list_index)
                         r_list_index += 1
                 for k in range(1, num):
                     _r_str = 'R' + str(k) + str(num+1)
-                    q_global_list.append(_r_str)
                     _str += '    ' + _r_str + " = Rs[" + str(r_list_index) + ']\n'
+                    q_sources[_r_str] = ('Rs', r_list_index)
                     r_list_index += 1
         elif 'single' in self.q_type:
             if 'Q' in self.q_type:
                 _str += '    Q = Qs[0]\n'
+                q_sources['Q'] = ('Qs', 0)
             if 'R' in self.q_type:
                 _str += '    R = Rs[0]\n'
+                q_sources['R'] = ('Rs', 0)
         self.q_str = _str[:-1]
-        self.q_global_list = q_global_list
+        self.q_sources = q_sources
 
     def get_transport_rate(self, barrier_number, ion):
         """
@@ -480,10 +661,32 @@ class EryingRateModelMaker(object):
 
     def get_transition_matrix(self):
         """
-        Get the matrix
-        :return:
+        Get the matrix as a list of rows of strings, made from the transition triplets
+        :return: list of lists of strings, with '0' for elements without a rate
         """
-        return self.matrix
+        num_states = len(self.channel_configs)
+        matrix = []
+        for row in self._get_matrix_rows():
+            matrix_row = ['0'] * num_states
+            for column, rate_str in row.iteritems():
+                matrix_row[column] = rate_str
+            matrix.append(matrix_row)
+        return matrix
+
+    def get_transitions(self):
+        """
+        Get the off diagonal rates of the transition matrix
+        :return: list of (row, column, rate string) tuples
+        """
+        return self.transitions
+
+    def get_transition_factors(self):
+        """
+        Get the rate name and Q values of each off diagonal rate, indexed the same as
+        get_transitions
+        :return: list of (rate name, list of (Q or R name, power) tuples) tuples
+        """
+        return self.transition_factors
 
     def get_states_vector(self):
         """
@@ -509,10 +712,10 @@ class EryingRateModelMaker(object):
         :return: string
         """
         output_str = 'matrix([\n    '
-        for row in self.matrix:
-            output_str += str(row) + ',\n    '
-        output_str = output_str.translate(None, "'")
-        output_str = output_str[:-6] + '\n    ])'
+        row_strs = []
+        for row in self.get_transition_matrix():
+            row_strs.append('[' + ', '.join(row) + ']')
+        output_str += ',\n    '.join(row_strs) + '\n    ])'
         return output_str
 
     def get_number_states(self):
@@ -529,30 +732,19 @@ class EryingRateModelMaker(object):
         """
         return self.q_str
 
-    def get_qr_global_str(self):
+    def get_q_sources(self):
         """
-        Gets a string that will set the appropraite Q and Rs as global variables
-        :return: string
+        Get where the value of each Q and R used in the model comes from
+        :return: dict, keys are the Q or R names and values are ('Qs' or 'Rs', index) tuples
         """
-        if self.num_binding_sites < 2:  # if there is only 1 binding site, there are not Qs or Rs
-            return ""
-        if 'full QR' in self.q_type:  # keep order so if full QR, full Q will not be triggered
-            raise NotImplementedError
-        elif 'full Q' in self.q_type:
-            _str = "    global "
-            _str += ', '.join(self.q_global_list)
-        elif 'single QR' in self.q_type:
-            _str = "    global Q  \n    global R "
-        elif 'single Q' in self.q_type:
-            _str = "    global Q  "
-        return _str
+        return self.q_sources
 
     def print_matrix(self):
         """
         Print out the matrix for testing
         """
         print 'matrix:'
-        for row in self.matrix:
+        for row in self.get_transition_matrix():
             print row
 
     def make_chain(self):
@@ -566,15 +758,16 @@ class EryingRateModelMaker(object):
         :return: chain of the states and rates that can reach each state
         """
         chain = {}
-        for i in range(len(self.matrix)):
-            for j in range(len(self.matrix[0])):
-                if self.matrix[i][j] != 0:
+        matrix = self.get_transition_matrix()
+        for i in range(len(matrix)):
+            for j in range(len(matrix[0])):
+                if matrix[i][j] != 0:
                     # add states and rate to a chain
                     if tuple(self.channel_configs[i]) in chain:
-                        chain[tuple(self.channel_configs[i])][tuple(self.channel_configs[j])] = self.matrix[i][j]
+                        chain[tuple(self.channel_configs[i])][tuple(self.channel_configs[j])] = matrix[i][j]
                     else:
-                        chain[tuple(self.channel_configs[i])] = {tuple(self.channel_configs[j]): self.matrix[i][j]}
-                    # chain[(tuple(self.channel_configs[i]), tuple(self.channel_configs[j]))] = self.matrix[i][j]
+                        chain[tuple(self.channel_configs[i])] = {tuple(self.channel_configs[j]): matrix[i][j]}
+                    # chain[(tuple(self.channel_configs[i]), tuple(self.channel_configs[j]))] = matrix[i][j]
         return chain
 
     def __str__(self):
@@ -588,7 +781,7 @@ class EryingRateModelMaker(object):
         states_str = states_str[:-2] + ']\n'
 
         matrix_str = "matrix([\n"
-        for row in self.matrix:
+        for row in self.get_transition_matrix():
             matrix_str += '['
             matrix_str += ', '.join(row)
             matrix_str += '],\n'
@@ -630,7 +823,6 @@ if __name__ == "__main__":
 
     HOLD_FORWARD = INSTANCE.get_forward_transport_rates_str()
     HOLD_BACKWARDS = INSTANCE.get_backward_transport_rates_str()
-    print INSTANCE.get_qr_global_str()
     print ""
     print HOLD_FORWARD[:-1]
     print ""
@@ -0,0 +1,232 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Solve a grid of Eyring rate models (binding sites x solutes) over a voltage sweep with a
+pool of processes.  Each model and voltage chunk is a separate work unit, each process gets its
+models from template_maker.get_model so a model is only made once per process (and is loaded
+from the model cache after the first time), and the results are gathered back in order.
+
+usage: python sweep_driver.py --jobs 4
+       python sweep_driver.py --jobs 4 --math mpmath --dps 15 30 60
+"""
+# standard libraries
+import argparse
+import multiprocessing
+
+# local files
+import result_set
+import results_store
+import template_maker
+
+__author__ = 'Kyle Vitautas Lopin'
+
+IONS = ['Na', 'Ca', 'Mg', 'Fe', 'Ba', 'Cd']
+CHARGES = [1, 2, 2, 2, 2, 2]
+VOLTAGES = range(-200, 220, 20)
+ION_CONC = {'Nai': 0.1, 'Nae': 0.000001,
+            'Cai': 0.000001, 'Cae': 0.1,
+            'Mgi': 0.1, 'Mge': 0.000001,
+            'Fei': 0.000001, 'Fee': 0.1,
+            'Bai': 0.1, 'Bae': 0.000001,
+            'Cdi': 0.000001, 'Cde': 0.1}
+ENERGY_BARRIERS = {'Na': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Ca': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Mg': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Fe': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Ba': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8],
+                   'Cd': [8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8, -12, 8]}
+QS = 30*[5]
+RS = 30*[0.5]
+# models to solve, (number of binding sites, number of solutes)
+GRID = [(num_binding_sites, num_ions)
+        for num_binding_sites in range(1, 5) for num_ions in range(1, 5)]
+
+
+def run_grid(grid, voltages, ion_conc, energy_barriers, Qs, Rs, jobs=None, chunk_size=None,
+             math_type='numpy', q_type='full QR', method=None, ions=IONS, charges=CHARGES,
+             mp_dps=15):
+    """
+    Solve every model of the grid at every voltage, the voltages of each model are split into
+    chunks and the (model, voltage chunk) work units are solved by a pool of processes
+    :param grid: list of (number of binding sites, number of solutes) of the models, the
+    first solutes of ions are used
+    :param voltages: list of voltages to solve each model at
+    :param ion_conc: dict of the concentrations, keys are the solutes + 'i' or 'e'
+    :param energy_barriers: dict of the energy barriers with the solutes as keys, the
+    electrical distances are made for each model by make_distances
+    :param Qs: list of Q values
+    :param Rs: list of R values
+    :param jobs: number of processes to use, all the cpus are used if None and 1 solves
+    everything in this process
+    :param chunk_size: number of voltages in each work unit, if None the voltages of each
+    model are split into jobs chunks
+    :param math_type: math package of the models, 'numpy', 'mpmath' or 'mixed'
+    :param q_type: what type of repulsion / attraction coefficents to use
+    :param method: method to find the steady states with, see the helper modules
+    :param ions: list of the solutes to make the models with
+    :param charges: list of the charges of the solutes
+    :param mp_dps: precision to use with mpmath, or a list of increasing precisions to raise
+    each voltage through, see mp_func.eyring_rate_algo_adaptive
+    :return: list with the result_set.ResultSet of each model of the grid, in voltage order,
+    or a tuple of the ResultSets by eig, svd and qr if method is 'all'
+    """
+    if not chunk_size:
+        chunk_size = -(-len(voltages) // (jobs or multiprocessing.cpu_count()))
+    work_units = []
+    for num_binding_sites, num_ions in grid:
+        model_spec = (math_type, num_binding_sites, ions[:num_ions], charges[:num_ions], q_type)
+        model_barriers = dict(energy_barriers)
+        model_barriers['distance'] = make_distances(num_binding_sites)
+        work_units.extend(make_work_units(model_spec, voltages, chunk_size, ion_conc,
+                                          model_barriers, Qs, Rs, mp_dps, method))
+    chunk_results = map_work_units(work_units, jobs)
+    # put the chunks of each model back together, the chunks are in the order they were made
+    chunks_per_model = len(work_units) // len(grid)
+    return [join_chunks(chunk_results[i*chunks_per_model:(i+1)*chunks_per_model])
+            for i in range(len(grid))]
+
+
+def run_voltages(model_spec, voltages, ion_conc, energy_barriers, Qs, Rs, mp_dps=15,
+                 method=None, workers=None):
+    """
+    Solve one model with its voltages split between a pool of processes, used by the workers
+    option of the eyring_rate_algo of the scripts made by template_maker.make_template.
+    Each process makes its own model and sets its own mp.dps
+    :param model_spec: tuple of the arguments of template_maker.get_model that make the model
+    :param voltages: list of voltages to solve the model at
+    :param mp_dps: precision to use with mpmath, or a list of precisions
+    :param method: method to find the steady states with, see the helper modules
+    :param workers: number of processes to use, or a multiprocessing.Pool to use
+    :return: result_set.ResultSet in voltage order, or a tuple of the ResultSets by eig,
+    svd and qr if method is 'all'
+    """
+    if isinstance(workers, int):
+        chunk_size = -(-len(voltages) // workers)
+    else:
+        chunk_size = -(-len(voltages) // multiprocessing.cpu_count())
+    work_units = make_work_units(model_spec, voltages, chunk_size, ion_conc, energy_barriers,
+                                 Qs, Rs, mp_dps, method)
+    return join_chunks(map_work_units(work_units, workers))
+
+
+def make_work_units(model_spec, voltages, chunk_size, ion_conc, energy_barriers, Qs, Rs,
+                    mp_dps, method):
+    """
+    Split the voltages of a model into continuous chunks, each chunk is solved as a work unit
+    :return: list of tuples of the model specifications and the arguments of eyring_rate_algo
+    """
+    return [(model_spec, voltages[start:start+chunk_size], ion_conc, energy_barriers, Qs, Rs,
+             mp_dps, method) for start in range(0, len(voltages), chunk_size)]
+
+
+def map_work_units(work_units, jobs):
+    """
+    Solve the work units with a pool of processes
+    :param work_units: list of work units made by make_work_units
+    :param jobs: number of processes to use, all the cpus are used if None and 1 solves
+    everything in this process, or a multiprocessing.Pool to use
+    :return: list of the results of each work unit, in the order of the work units
+    """
+    if jobs == 1:
+        return [solve_work_unit(work_unit) for work_unit in work_units]
+    if hasattr(jobs, 'map'):
+        return jobs.map(solve_work_unit, work_units, chunksize=1)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        # map keeps the order of the work units
+        return pool.map(solve_work_unit, work_units, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def join_chunks(chunk_results):
+    """
+    Put the results of the voltage chunks of a model back together
+    :param chunk_results: list of the result_set.ResultSet of each chunk (or tuples of the
+    ResultSets by eig, svd and qr if the method was 'all'), in voltage order
+    :return: result_set.ResultSet, or a tuple of ResultSets by eig, svd and qr
+    """
+    return result_set.concatenate_sweeps(chunk_results)
+
+
+def solve_work_unit(work_unit):
+    """
+    Solve one model over a chunk of voltages, called in the processes of the pool
+    :param work_unit: tuple of the model specifications and the arguments of eyring_rate_algo,
+    see make_work_units
+    :return: result_set.ResultSet, or a tuple of ResultSets if the method is 'all'
+    """
+    model_spec, voltages, ion_conc, energy_barriers, Qs, Rs, mp_dps, method = work_unit
+    model = template_maker.get_model(*model_spec)
+    return model.eyring_rate_algo(voltages, ion_conc, energy_barriers, Qs, Rs, mp_dps=mp_dps,
+                                  method=method)
+
+
+def save_grid(directory, grid, total_results):
+    """
+    Save the results of run_grid as curves of a results_store.ResultsStore, one curve for
+    each model, named by curve_name
+    :param directory: folder of the results store
+    :param grid: list of (number of binding sites, number of solutes) the results were made with
+    :param total_results: list of the results of each model returned by run_grid
+    :return: results_store.ResultsStore the curves were saved in
+    """
+    store = results_store.ResultsStore(directory)
+    for (num_binding_sites, num_ions), results in zip(grid, total_results):
+        store.save_all(curve_name(num_binding_sites, num_ions), results)
+    return store
+
+
+def curve_name(num_binding_sites, num_ions):
+    """
+    Make the name the results of a model of the grid are saved under
+    :param num_binding_sites: number of binding sites of the model
+    :param num_ions: number of solutes of the model
+    :return: string, e.g. 'sites_2_solutes_3'
+    """
+    return 'sites_{0}_solutes_{1}'.format(num_binding_sites, num_ions)
+
+
+def make_distances(num_binding_sites):
+    """
+    Make evenly spaced electrical distances for the barriers and binding sites of a model
+    :param num_binding_sites: number of binding sites in the model
+    :return: list of the electrical distances
+    """
+    distance_buffer = 2 * (num_binding_sites + 1)
+    return [float(i)/distance_buffer for i in range(1, distance_buffer)]
+
+
+def main():
+    """
+    Solve the models of GRID and save the results in a results store
+    """
+    parser = argparse.ArgumentParser(description="Solve a grid of Eyring rate models "
+                                                 "with a pool of processes")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="number of processes to use, default is the number of cpus")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="number of voltages in each work unit")
+    parser.add_argument('--math', default='numpy', choices=['numpy', 'mpmath', 'mixed'],
+                        help="math package of the models")
+    parser.add_argument('--method', default=None,
+                        help="method to find the steady states with")
+    parser.add_argument('--dps', type=int, nargs='+', default=[15],
+                        help="precision of the mpmath models, several increasing values "
+                             "solve each voltage at the lowest precision that is accurate "
+                             "enough")
+    parser.add_argument('--output', default='Full_Results',
+                        help="folder of the results store to save the results in")
+    args = parser.parse_args()
+    # one precision is used for every voltage, more are used as an adaptive ladder
+    mp_dps = args.dps[0] if len(args.dps) == 1 else args.dps
+
+    total_results = run_grid(GRID, VOLTAGES, ION_CONC, ENERGY_BARRIERS, QS, RS,
+                             jobs=args.jobs, chunk_size=args.chunk_size, math_type=args.math,
+                             method=args.method, mp_dps=mp_dps)
+    save_grid(args.output, GRID, total_results)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,47 +3,101 @@
 
 """ function to make file that solves an eyring rate model
 """
+# standard libraries
+import collections
+import hashlib
+import marshal
+import os
+import sys
+import types
+import zipfile
 
 # local files
+import compiled_model
 import rates_algo
 import step_algo
 
 __author__ = 'Kyle Vitautas Lopin'
 
+# number of models get_model keeps, the least recently used model is removed first
+MODEL_CACHE_SIZE = 8
+# models made by get_model, keys are the model specifications
+_MODEL_CACHE = collections.OrderedDict()
 
-def make_template(_math_type, num_binding_sites, solutes, charges, q_type):
+_PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# folder load_model saves the models in, set to None to not save models
+MODEL_DIRECTORY = os.path.join(_PACKAGE_DIRECTORY, 'model_cache')
+# change when the models made change in a way the files below do not show
+GENERATOR_VERSION = 1
+# files the models are made from, changing any of them makes new models
+_GENERATOR_FILES = ('template.txt', 'template_maker.py', 'step_algo.py', 'rates_algo.py',
+                    'radix_states.py', 'compiled_model.py')
+# file in MODEL_DIRECTORY with the generator_hash of the models saved there
+_GENERATOR_HASH_FILE = 'generator_hash.txt'
+# extensions of the files load_model saves, files ending in .tmp are still being written
+_MODEL_FILE_EXTENSIONS = ('.npz', '.code', '.py')
+# model directories prune_model_cache has checked in this process
+_PRUNED_DIRECTORIES = set()
+
+
+def make_template(_math_type, num_binding_sites, solutes, charges, q_type, enumeration=None):
     """
     Make a string that can be saved as a file to solve an eyring rate model
-    :param _math_type:  string of type of math package to use, 'numpy' or 'mpmath'
+    :param _math_type:  string of type of math package to use, 'numpy', 'mpmath' or 'mixed'
+    (numpy matrices solved by mixed_func)
     :param num_binding_sites:  int of the number of binding sites in the model
     :param solutes:  list of strings of the solutes in the model
     :param charges:  list of int of the charges of the solutes
     :param q_type: what type of repulsion / attraction coefficents their are;
     options are: 'single Q', 'single QR', 'full Q', 'full QR'
+    :param enumeration: how the states of the model are found, None or 'mixed radix',
+    see step_algo.EryingRateModelMaker
     :return: string that is a python file to run an eyring rate model
     """
-    with open('template.txt', 'r') as temp_file:
+    with open(os.path.join(_PACKAGE_DIRECTORY, 'template.txt'), 'r') as temp_file:
         template = temp_file.read()  # get the template of the file to make
     # set the correct imports for the selected math type
     if _math_type == 'mpmath':
         _import_statement = "from mpmath import mp, exp, matrix, nstr, chop\n" \
                             "import mp_func as helper"
-        _mp_dps_statement = "mp.dps = mp_dps"
+        _mp_dps_statement = ("if isinstance(mp_dps, (list, tuple)):\n"
+                             "        # only use the higher precisions for voltages that need it\n"
+                             "        return helper.eyring_rate_algo_adaptive("
+                             "sys.modules[__name__], voltages, ion_conc,\n"
+                             "                                                "
+                             "energy_barriers, Qs, Rs, mp_dps, method)\n"
+                             "    mp.dps = mp_dps")
+        _mp_dps_stream_statement = (
+            "if isinstance(mp_dps, (list, tuple)):\n"
+            "        return result_stream.chunked(helper.iter_eyring_rate_adaptive(\n"
+            "            sys.modules[__name__], voltages, ion_conc, energy_barriers, Qs, Rs, "
+            "mp_dps, method),\n"
+            "            chunk_size)\n"
+            "    mp.dps = mp_dps")
     elif _math_type == 'numpy':
         _import_statement = "import np_func as helper\n" \
                             "from numpy import exp, matrix\n"
         _mp_dps_statement = ""
+        _mp_dps_stream_statement = ""
+    elif _math_type == 'mixed':
+        _import_statement = "import mixed_func as helper\n" \
+                            "from numpy import exp, matrix\n"
+        _mp_dps_statement = ""
+        _mp_dps_stream_statement = ""
     else:
-        raise IOError("_math_type should be 'mpmath' or 'numpy'")
+        raise IOError("_math_type should be 'mpmath', 'numpy' or 'mixed'")
 
     # put in the import statements
     template = template.replace('%%import statement%%', _import_statement)
     # set the precision levels if mpmath is being used
     template = template.replace('%%mp.dps statement%%', _mp_dps_statement)
+    template = template.replace('%%mp.dps stream statement%%', _mp_dps_stream_statement)
 
     # create instances of the 2 helper modules needed to make the eyring rate model
-    algo_instance = step_algo.EryingRateModelMaker(num_binding_sites, solutes, charges, q_type)
-    rates_helper_instance = rates_algo.EryingRateMaker(_math_type, num_binding_sites, solutes, charges)
+    algo_instance = step_algo.EryingRateModelMaker(num_binding_sites, solutes, charges, q_type,
+                                                   enumeration)
+    rates_helper_instance = rates_algo.EryingRateMaker(rates_math_type(_math_type),
+                                                       num_binding_sites, solutes, charges)
 
     # put in a list of the states that are possible for the model
     _states = algo_instance.get_states_str()
@@ -56,13 +110,10 @@ def make_template(_math_type, num_binding_sites, solutes, charges, q_type):
         index = solutes.index(ion)
         ions_str += ion + "': " + str(charges[index]) + ", '"
     template = template.replace('%%ions%%', ions_str[:-3] + '}')
-    # check if Q or R values are used and add statements to make them global if they are
-    if q_type:
-        _global_q = algo_instance.get_qr_global_str()
-        template = template.replace('%%global Q%%', _global_q)
-    else:
-        template = template.replace('\n%%global Q%%\n', "")
-
+    # save how the model was made so other processes can make it again
+    _model_spec = (_math_type, num_binding_sites, list(solutes), list(charges), q_type,
+                   enumeration)
+    template = template.replace('%%model spec%%', repr(_model_spec))
     # the energy barriers are inputted as a dict, make a series of assignments
     # to assign the individual values to the correct dict value
     _ion_assignment = rates_helper_instance.get_ion_assignment_str()
@@ -83,10 +134,6 @@ def make_template(_math_type, num_binding_sites, solutes, charges, q_type):
     _energy_barriers = rates_helper_instance.get_energy_barrier_str()
     template = template.replace('%%energy barriers%%', _energy_barriers)
 
-    # make all the rates global so that all the function in the script can use them
-    _global_calls = rates_helper_instance.get_global_variables_str()
-    template = template.replace('%%global rates%%', _global_calls)
-
     # calculate the equations to make the rates,
     # ex. k_0_1_solute_1 = solute_1e*k0*exp(-Gsolute_11)*exp(0*q*-d1*V)
     _ion_rates = rates_helper_instance.get_rates_str()
@@ -101,9 +148,292 @@ def make_template(_math_type, num_binding_sites, solutes, charges, q_type):
                         + algo_instance.get_backward_transport_rates_str())
     template = template.replace('%%transport rates%%', _transport_rates)
 
+    # the rates and Q values are passed from eyring_rate_context to eyring_rate_transport in
+    # a dict instead of as global variables so the model can be used by several threads
+    _context_names = (rates_helper_instance.get_rate_names()
+                      + sorted(algo_instance.get_q_sources()))
+    template = template.replace('%%rates context%%', get_rates_context_str(_context_names))
+    template = template.replace('%%unpack rates%%', get_unpack_rates_str(_context_names))
+
     return template
 
 
+def get_rates_context_str(names):
+    """
+    Make a string that saves the rates and Q values of a matrix in a dict
+    :param names: list of the names of the rates and Q values
+    :return: string, ex. "    rates = {'k_0_1_Na': k_0_1_Na, 'Q': Q}"
+    """
+    line_cutoff = 90  # make a new line if the current one gets too long
+    lines = []
+    line = "    rates = {"
+    for name in names:
+        entry = "'" + name + "': " + name + ", "
+        if len(line + entry) > line_cutoff:
+            lines.append(line.rstrip())
+            line = "             "
+        line += entry
+    lines.append(line[:-2] + "}")
+    return "\n".join(lines)
+
+
+def get_unpack_rates_str(names):
+    """
+    Make a string that gets the rates and Q values used by the transport equations out of the
+    dict made by the get_rates_context_str statement
+    :param names: list of the names of the rates and Q values
+    :return: string, ex. "    k_0_1_Na = rates['k_0_1_Na']"
+    """
+    return "\n".join("    " + name + " = rates['" + name + "']" for name in names)
+
+
+def get_model(_math_type, num_binding_sites, solutes, charges, q_type, enumeration=None,
+              compiled=False):
+    """
+    Get an Eyring rate model, the last MODEL_CACHE_SIZE models used are kept in memory so
+    switching between models only makes each one once, other models are loaded from
+    MODEL_DIRECTORY or made with load_model
+    :param _math_type:  string of type of math package to use, 'numpy', 'mpmath' or 'mixed'
+    :param num_binding_sites:  int of the number of binding sites in the model
+    :param solutes:  list of strings of the solutes in the model
+    :param charges:  list of int of the charges of the solutes
+    :param q_type: what type of repulsion / attraction coefficents their are;
+    options are: 'single Q', 'single QR', 'full Q', 'full QR'
+    :param enumeration: how the states of the model are found, None or 'mixed radix'
+    :param compiled: True to get a compiled_model.CompiledEyringModel instead of the module
+    made from make_template
+    :return: module made by make_module or compiled_model.CompiledEyringModel
+    """
+    key = (_math_type, num_binding_sites, tuple(solutes), tuple(charges), q_type, enumeration,
+           compiled)
+    if key in _MODEL_CACHE:
+        # move the model to the end so it is the last to be removed
+        model = _MODEL_CACHE.pop(key)
+    else:
+        model = load_model(_math_type, num_binding_sites, solutes, charges, q_type,
+                           enumeration, compiled)
+    _MODEL_CACHE[key] = model
+    while len(_MODEL_CACHE) > MODEL_CACHE_SIZE:
+        _, old_model = _MODEL_CACHE.popitem(last=False)
+        if isinstance(old_model, types.ModuleType):
+            sys.modules.pop(old_model.__name__, None)
+    return model
+
+
+def load_model(_math_type, num_binding_sites, solutes, charges, q_type, enumeration=None,
+               compiled=False):
+    """
+    Load an Eyring rate model saved in MODEL_DIRECTORY, or make it and save it there.
+    The compiled models are saved as the .npz file of CompiledEyringModel.save and the
+    scripts as their source and marshalled code, named by model_hash so a model is made
+    again if its specifications or the files it is made from change
+    :param _math_type:  string of type of math package to use, 'numpy', 'mpmath' or 'mixed'
+    :param num_binding_sites:  int of the number of binding sites in the model
+    :param solutes:  list of strings of the solutes in the model
+    :param charges:  list of int of the charges of the solutes
+    :param q_type: what type of repulsion / attraction coefficents their are;
+    options are: 'single Q', 'single QR', 'full Q', 'full QR'
+    :param enumeration: how the states of the model are found, None or 'mixed radix'
+    :param compiled: True to get a compiled_model.CompiledEyringModel instead of a module
+    :return: module made by make_module or compiled_model.CompiledEyringModel
+    """
+    spec = (_math_type, num_binding_sites, solutes, charges, q_type, enumeration)
+    if compiled and not MODEL_DIRECTORY:
+        return make_compiled_model(*spec)
+    if not MODEL_DIRECTORY:
+        return make_module(*spec)
+    prune_model_cache()
+    path = os.path.join(MODEL_DIRECTORY, model_hash(spec, compiled))
+    if compiled:
+        filename = path + '.npz'
+        if os.path.exists(filename):
+            try:
+                return compiled_model.CompiledEyringModel.load(_math_type, filename)
+            except (IOError, ValueError, KeyError, zipfile.BadZipfile):
+                pass  # the file is damaged, make the model again
+        model = make_compiled_model(*spec)
+        _save_model_file(filename, model.save)
+        return model
+
+    filename = path + '.code'
+    if os.path.exists(filename):
+        try:
+            with open(filename, 'rb') as _file:
+                return module_from_code(module_name(*spec), marshal.load(_file))
+        except (IOError, EOFError, ValueError, TypeError):
+            pass  # the file is damaged, make the model again
+    _script = make_template(*spec)
+    # save the source next to the code so tracebacks can show the lines of the script
+    code = compile(_script, path + '.py', 'exec')
+    _save_model_file(path + '.py', lambda _file: _file.write(_script))
+    _save_model_file(filename, lambda _file: marshal.dump(code, _file))
+    return module_from_code(module_name(*spec), code)
+
+
+def model_hash(spec, compiled):
+    """
+    Make the name of the files a model is saved as, a hash of the model specifications
+    and generator_hash
+    :param spec: tuple of the arguments of load_model that describe the model
+    :param compiled: True for a compiled_model.CompiledEyringModel
+    :return: string of hex digits
+    """
+    _math_type, num_binding_sites, solutes, charges, q_type, enumeration = spec
+    return hashlib.sha1(repr((generator_hash(), _math_type, int(num_binding_sites),
+                              [str(solute) for solute in solutes],
+                              [int(charge) for charge in charges], q_type, enumeration,
+                              compiled))).hexdigest()
+
+
+def generator_hash():
+    """
+    Make a hash of what every saved model depends on, GENERATOR_VERSION, the python version
+    (for the marshalled code) and the files the models are made from
+    :return: string of hex digits
+    """
+    _hash = hashlib.sha1(repr((GENERATOR_VERSION, tuple(sys.version_info[:2]))))
+    for generator_file in _GENERATOR_FILES:
+        with open(os.path.join(_PACKAGE_DIRECTORY, generator_file), 'rb') as _file:
+            _hash.update(_file.read())
+    return _hash.hexdigest()
+
+
+def prune_model_cache():
+    """
+    Remove the models saved in MODEL_DIRECTORY by a different GENERATOR_VERSION, python
+    version or generator files, their names can never be made again so they would never be
+    loaded.  The generator_hash of the saved models is kept in _GENERATOR_HASH_FILE, each
+    process only checks it once
+    :return: list of the names of the files that were removed
+    """
+    if not MODEL_DIRECTORY or MODEL_DIRECTORY in _PRUNED_DIRECTORIES:
+        return []
+    _PRUNED_DIRECTORIES.add(MODEL_DIRECTORY)
+    current_hash = generator_hash()
+    hash_filename = os.path.join(MODEL_DIRECTORY, _GENERATOR_HASH_FILE)
+    try:
+        with open(hash_filename, 'r') as _file:
+            if _file.read().strip() == current_hash:
+                return []
+    except IOError:
+        pass  # no models were saved, or they were saved before the hash file was used
+    removed = []
+    if os.path.isdir(MODEL_DIRECTORY):
+        for name in os.listdir(MODEL_DIRECTORY):
+            if os.path.splitext(name)[1] not in _MODEL_FILE_EXTENSIONS:
+                continue
+            try:
+                os.remove(os.path.join(MODEL_DIRECTORY, name))
+            except OSError:
+                continue  # another process removed it first
+            removed.append(name)
+    _save_model_file(hash_filename, lambda _file: _file.write(current_hash))
+    return removed
+
+
+def _save_model_file(filename, write_function):
+    """
+    Save a file in MODEL_DIRECTORY, the file is written with a temporary name first and then
+    renamed so another process never loads a file that is only partly written
+    :param filename: name of the file to save
+    :param write_function: function that writes the file to an open file
+    """
+    try:
+        os.makedirs(MODEL_DIRECTORY)
+    except OSError:
+        if not os.path.isdir(MODEL_DIRECTORY):
+            raise
+    temp_filename = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_filename, 'wb') as _file:
+        write_function(_file)
+    try:
+        os.rename(temp_filename, filename)
+    except OSError:
+        # on windows the file can not be replaced if another process saved it first
+        os.remove(temp_filename)
+
+
+def make_module(_math_type, num_binding_sites, solutes, charges, q_type, enumeration=None):
+    """
+    Make the script of make_template into a module without saving and importing a file
+    :param _math_type:  string of type of math package to use, 'numpy', 'mpmath' or 'mixed'
+    :param num_binding_sites:  int of the number of binding sites in the model
+    :param solutes:  list of strings of the solutes in the model
+    :param charges:  list of int of the charges of the solutes
+    :param q_type: what type of repulsion / attraction coefficents their are;
+    options are: 'single Q', 'single QR', 'full Q', 'full QR'
+    :param enumeration: how the states of the model are found, None or 'mixed radix'
+    :return: module with the functions of the script, i.e. eyring_rate_algo
+    """
+    _script = make_template(_math_type, num_binding_sites, solutes, charges, q_type,
+                            enumeration)
+    name = module_name(_math_type, num_binding_sites, solutes, charges, q_type, enumeration)
+    return module_from_code(name, compile(_script, '<' + name + '>', 'exec'))
+
+
+def module_name(_math_type, num_binding_sites, solutes, charges, q_type, enumeration=None):
+    """
+    Make the name of the module of a model
+    :return: string, ex. 'eyring_rate_model_numpy_2_Na1_Ca2_single_Q_None'
+    """
+    return '_'.join(['eyring_rate_model', _math_type, str(num_binding_sites)]
+                    + [solute + str(charge) for solute, charge in zip(solutes, charges)]
+                    + str(q_type).split() + str(enumeration).split())
+
+
+def module_from_code(name, code):
+    """
+    Make a module by running the code of a script made by make_template
+    :param name: name of the module
+    :param code: code object of the script
+    :return: module with the functions of the script
+    """
+    module = types.ModuleType(name)
+    module.__file__ = code.co_filename
+    # the mpmath scripts find themselves in sys.modules to use with the adaptive precision
+    sys.modules[name] = module
+    exec code in module.__dict__
+    return module
+
+
+def make_compiled_model(_math_type, num_binding_sites, solutes, charges, q_type,
+                        enumeration=None):
+    """
+    Make a numerical Eyring rate model directly from the model makers, it has the same functions
+    as the file made by make_template but does not have to be saved and imported
+    :param _math_type:  string of type of math package to use, 'numpy', 'mpmath' or 'mixed'
+    :param num_binding_sites:  int of the number of binding sites in the model
+    :param solutes:  list of strings of the solutes in the model
+    :param charges:  list of int of the charges of the solutes
+    :param q_type: what type of repulsion / attraction coefficents their are;
+    options are: 'single Q', 'single QR', 'full Q', 'full QR'
+    :param enumeration: how the states of the model are found, None or 'mixed radix',
+    see step_algo.EryingRateModelMaker
+    :return: compiled_model.CompiledEyringModel
+    """
+    algo_instance = step_algo.EryingRateModelMaker(num_binding_sites, solutes, charges, q_type,
+                                                   enumeration)
+    rates_helper_instance = rates_algo.EryingRateMaker(rates_math_type(_math_type),
+                                                       num_binding_sites, solutes, charges)
+    model = compiled_model.CompiledEyringModel(_math_type, algo_instance, rates_helper_instance)
+    # save how the model was made so the worker processes can make it again
+    model.model_spec = (_math_type, num_binding_sites, list(solutes), list(charges), q_type,
+                        enumeration, True)
+    return model
+
+
+def rates_math_type(_math_type):
+    """
+    Get the math type the rate equations are made with, the mixed precision helper solves
+    matrices made with numpy
+    :param _math_type: string of type of math package used, 'numpy', 'mpmath' or 'mixed'
+    :return: 'numpy' or 'mpmath'
+    """
+    if _math_type == 'mixed':
+        return 'numpy'
+    return _math_type
+
+
 if __name__ == '__main__':
     _ions = ['Na', 'Ca', 'Mg', 'Fe', 'Ba', 'Cd']
     EYRING_RATE_SCRIPT = make_template('numpy', 2, _ions[:3], [1, 2, 2, 2, 2, 2], 'single Q')
@@ -0,0 +1,90 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Test that compiled_model.CompiledEyringModel gives the same results as the script made by
+template_maker.make_template, for the states found by step_algo's breadth first search and
+by the 'mixed radix' enumeration
+
+usage: python -m unittest test_compiled_model
+"""
+# standard libraries
+import unittest
+
+import numpy as np
+
+# local files
+import sweep_driver
+import template_maker
+
+__author__ = 'Kyle Vitautas Lopin'
+
+VOLTAGES = [-150, -50, 0, 50, 150]
+IONS = ['Na', 'Ca']
+CHARGES = [1, 2]
+ION_CONC = {'Nai': 0.1, 'Nae': 0.01,
+            'Cai': 0.001, 'Cae': 0.02}
+ENERGY_BARRIERS = {'Na': [6, -4, 7, -5, 6, -3, 8],
+                   'Ca': [7, -6, 6, -7, 8, -5, 7]}
+QS = 30*[0.7]
+RS = 30*[0.6]
+# largest difference allowed, relative to the largest value of the voltage
+TOLERANCE = 1e-9
+
+
+def state_populations(model, results):
+    """
+    Get the steady state of each voltage as a dict of the states of the model
+    :param model: generated script or compiled_model.CompiledEyringModel
+    :param results: result_set.ResultSet of the model
+    :return: list of dicts, keys are tuples of the ions in each binding site
+    """
+    keys = [tuple(state) for state in model.states]
+    return [dict(zip(keys, steady_state)) for steady_state in results.steady_state]
+
+
+class CompiledModelTest(unittest.TestCase):
+    def check_models(self, math_type, num_binding_sites, q_type):
+        """
+        Solve the script and compiled models, with both enumerations of the states, and check
+        they all have the same currents and steady states as the script made by the breadth
+        first search
+        """
+        energy_barriers = dict((ion, barriers[:2*num_binding_sites+1])
+                               for ion, barriers in ENERGY_BARRIERS.items())
+        energy_barriers['distance'] = sweep_driver.make_distances(num_binding_sites)
+        reference = None
+        for enumeration in (None, 'mixed radix'):
+            for compiled in (False, True):
+                condition = '{0} {1} {2}'.format(math_type, enumeration,
+                                                 'compiled' if compiled else 'script')
+                model = template_maker.get_model(math_type, num_binding_sites, IONS, CHARGES,
+                                                 q_type, enumeration, compiled)
+                results = model.eyring_rate_algo(VOLTAGES, ION_CONC, energy_barriers, QS, RS)
+                populations = state_populations(model, results)
+                if reference is None:
+                    reference = results, populations
+                    continue
+                reference_current = reference[0].current
+                scale = np.max(np.fabs(reference_current), axis=1)
+                np.testing.assert_array_less(
+                    np.max(np.fabs(results.current - reference_current), axis=1),
+                    TOLERANCE*scale, condition)
+                for voltage, states, reference_states in zip(VOLTAGES, populations,
+                                                             reference[1]):
+                    self.assertEqual(sorted(states), sorted(reference_states), condition)
+                    for state, population in reference_states.items():
+                        self.assertAlmostEqual(states[state], population, delta=TOLERANCE,
+                                               msg='{0} at {1} mV'.format(condition, voltage))
+
+    def test_numpy(self):
+        self.check_models('numpy', 3, 'full QR')
+
+    def test_numpy_single_q(self):
+        self.check_models('numpy', 2, 'single Q')
+
+    def test_mpmath(self):
+        self.check_models('mpmath', 2, 'full QR')
+
+
+if __name__ == '__main__':
+    unittest.main()
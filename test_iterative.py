@@ -0,0 +1,87 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Test the iterative (GMRES and BiCGSTAB) steady state solver of np_func against the 'solve'
+method over a stiff and a non-stiff voltage sweep, for the generated script and the compiled model
+
+usage: python -m unittest test_iterative
+"""
+# standard libraries
+import unittest
+
+import numpy as np
+
+# local files
+import np_func
+import sweep_driver
+import template_maker
+
+__author__ = 'Kyle Vitautas Lopin'
+
+VOLTAGES = range(-150, 160, 25)
+IONS = ['Na', 'Ca']
+CHARGES = [1, 2]
+NUM_BINDING_SITES = 3
+# deep binding sites and a very small concentration make the transition matrices stiff,
+# the ratio of the largest to smallest rates is above np_func.STIFF_THRESHOLD
+STIFF_ION_CONC = {'Nai': 0.1, 'Nae': 0.000001,
+                  'Cai': 0.1, 'Cae': 0.02}
+STIFF_ENERGY_BARRIERS = {'Na': [10, -16, 10, -16, 10, -16, 10],
+                         'Ca': [10, -16, 10, -16, 10, -16, 10],
+                         'distance': sweep_driver.make_distances(NUM_BINDING_SITES)}
+# shallow binding sites and similar concentrations, the 'solve' method uses the LU
+# factorization for these matrices
+ION_CONC = {'Nai': 0.1, 'Nae': 0.1,
+            'Cai': 0.01, 'Cae': 0.02}
+ENERGY_BARRIERS = {'Na': [4, -2, 4, -2, 4, -2, 4],
+                   'Ca': [5, -3, 5, -3, 5, -3, 5],
+                   'distance': sweep_driver.make_distances(NUM_BINDING_SITES)}
+QS = 30*[0.7]
+RS = 30*[0.6]
+# largest difference in the currents allowed, relative to the largest current of the voltage
+TOLERANCE = 1e-8
+
+
+class IterativeSteadyStateTest(unittest.TestCase):
+    def check_sweep(self, ion_conc, energy_barriers, stiff):
+        """
+        Solve every voltage of a sweep with each iterative method and check the Krylov solver
+        was used and the currents are the same as the 'solve' method's
+        :param ion_conc: dict of the concentrations of the sweep
+        :param energy_barriers: dict of the energy barriers of the sweep
+        :param stiff: True if the matrices of the sweep should be above STIFF_THRESHOLD
+        """
+        for compiled in (False, True):
+            model = template_maker.get_model('numpy', NUM_BINDING_SITES, IONS, CHARGES,
+                                             'full QR', compiled=compiled)
+            for method in np_func.ITERATIVE_METHODS:
+                solver = np_func.make_sweep_method(method)
+                for voltage in VOLTAGES:
+                    condition = '{0} {1} at {2} mV'.format(
+                        'compiled' if compiled else 'script', method, voltage)
+                    context = model.eyring_rate_context(voltage, ion_conc, energy_barriers,
+                                                        QS, RS)
+                    matrix = context.transition_matrix
+                    result = np_func.solve_eyring_rate_model(voltage, matrix, context, solver)
+                    self.assertGreater(solver.iterations, 0, condition)
+                    reference = np_func.solve_eyring_rate_model(voltage, matrix, context,
+                                                                'solve')
+                    specs = reference.matrix_spec
+                    self.assertEqual(
+                        specs.largest_element > np_func.STIFF_THRESHOLD*specs.smallest_element,
+                        stiff, condition)
+                    reference_current = np.array(reference.current)
+                    error = (np.max(np.fabs(np.array(result.current) - reference_current))
+                             / np.max(np.fabs(reference_current)))
+                    self.assertLess(error, TOLERANCE, condition)
+                self.assertEqual(solver.fallbacks, 0)
+
+    def test_sweep(self):
+        self.check_sweep(ION_CONC, ENERGY_BARRIERS, stiff=False)
+
+    def test_stiff_sweep(self):
+        self.check_sweep(STIFF_ION_CONC, STIFF_ENERGY_BARRIERS, stiff=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
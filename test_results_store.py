@@ -0,0 +1,76 @@
+# Copyright (c) 2015-2016 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Licensed under the GPL
+
+""" Test that results_store saves and loads the columns of a result set and that replacing a
+curve does not leave any columns of the old curve
+
+usage: python -m unittest test_results_store
+"""
+# standard libraries
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# local files
+import result_set
+import results_store
+
+__author__ = 'Kyle Vitautas Lopin'
+
+SOLUTES = ['Ca', 'Na']
+NUM_BARRIERS = 3
+NUM_STATES = 9
+
+
+def make_result_set(voltages):
+    """
+    Make a result set with different values in every column
+    :param voltages: list of voltages
+    :return: result_set.ResultSet
+    """
+    results = result_set.ResultSet.empty(SOLUTES, len(voltages), NUM_BARRIERS, NUM_STATES)
+    for column, array in results.columns().items():
+        if array.dtype.kind == 'f':
+            array[...] = np.random.rand(*array.shape)
+    results.voltage[:] = voltages
+    results.precision[:] = 30
+    results.method[:] = 'lu'
+    return results
+
+
+class ResultsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = results_store.ResultsStore(os.path.join(self.directory, 'store'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_curve(self, name, results):
+        loaded = self.store.load(name)
+        self.assertEqual(loaded.solutes, SOLUTES)
+        for column, array in results.columns().items():
+            np.testing.assert_array_equal(getattr(loaded, column), array, column)
+
+    def test_save_load(self):
+        results = make_result_set(range(-100, 110, 10))
+        self.store.save('curve', results)
+        self.assertEqual(self.store.names(), ['curve'])
+        self.check_curve('curve', results)
+        self.assertEqual(self.store.load('curve')[3].method, 'lu')
+
+    def test_replace(self):
+        self.store.save('curve', make_result_set(range(-100, 110, 10)))
+        shorter = make_result_set([-50, 0, 50])
+        self.store.save('curve', shorter)
+        self.assertEqual(self.store.names(), ['curve'])
+        self.check_curve('curve', shorter)
+        # only the curve folder is left, no temporary or old folders
+        self.assertEqual(os.listdir(self.store.directory), ['curve'])
+
+
+if __name__ == '__main__':
+    unittest.main()